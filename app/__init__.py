@@ -89,3 +89,6 @@ app.register_blueprint(setup_bp, url_prefix="/setups")
 app.register_blueprint(filter_bp, url_prefix="/setups/<setup_id>/filters")
 app.register_blueprint(auth_bp)
 app.register_blueprint(error_bp)
+
+# CLI commands
+from app import commands
@@ -0,0 +1,229 @@
+import time
+from types import SimpleNamespace
+
+import click
+import numpy as np
+import pandas as pd
+from app import app
+from app.constants.storage import STORAGE_EMBEDDED, STORAGE_MEMBERSHIP, STORAGE_TRADES
+from app.models.Document import Document
+from app.models.Setup import Setup
+from app.repositories.account_repository import AccountRepository
+from app.repositories.trade_repository import TradeRepository
+from app.repositories.version_repository import VersionRepository
+from app.services.evaluation_service import VersionEvaluator
+from app.services.filter_service import FilterMasks
+from app.services.propagation_service import resync_versions
+from app.utils.query_plans import check_query_plans, get_hot_queries
+
+
+@app.cli.command("migrate-trades")
+@click.option(
+    "--account",
+    "account_ids",
+    multiple=True,
+    help="ID of an account to migrate. All accounts are migrated if omitted.",
+)
+@click.option(
+    "--min-trades",
+    default=0,
+    show_default=True,
+    help="Only migrate accounts with at least this number of trades.",
+)
+@click.option(
+    "--to",
+    "storage",
+    type=click.Choice([STORAGE_TRADES, STORAGE_EMBEDDED]),
+    default=STORAGE_TRADES,
+    show_default=True,
+    help="Storage to move the trades to.",
+)
+@click.option("--dry-run", is_flag=True, help="List the accounts without moving them.")
+def migrate_trades(account_ids, min_trades, storage, dry_run):
+    """
+    Moves the trades of accounts between the embedded state.data dict and the trades
+    collection. Accounts should not be written while they are migrated.
+    """
+    accounts = Document.objects(id__in=account_ids) if account_ids else Document.objects
+    migrated = 0
+    for account in accounts.no_cache():
+        if account.storage == STORAGE_TRADES:
+            trades = TradeRepository.count_trades(account.id)
+        else:
+            trades = len(account.state.get("data") or {})
+        if account.storage == storage or trades < min_trades:
+            continue
+
+        click.echo(f"{account.id} {account.name}: {trades} trades to {storage}")
+        if dry_run:
+            continue
+        if storage == STORAGE_TRADES:
+            AccountRepository.move_to_trades(account)
+        else:
+            AccountRepository.move_to_embedded(account)
+        migrated += 1
+
+    click.echo(f"{migrated} accounts migrated.")
+
+
+@app.cli.command("migrate-versions")
+@click.option(
+    "--account",
+    "account_ids",
+    multiple=True,
+    help="ID of an account whose versions are migrated. All are migrated if omitted.",
+)
+@click.option(
+    "--to",
+    "storage",
+    type=click.Choice([STORAGE_MEMBERSHIP, STORAGE_EMBEDDED]),
+    default=STORAGE_MEMBERSHIP,
+    show_default=True,
+    help="Storage to move the rows of the versions to.",
+)
+@click.option("--dry-run", is_flag=True, help="List the versions without moving them.")
+def migrate_versions(account_ids, storage, dry_run):
+    """
+    Moves versions between a full copy of their rows and a membership list of row IDs
+    resolved against their account.
+    """
+    versions = (
+        Setup.objects(documentId__in=account_ids) if account_ids else Setup.objects
+    )
+    migrated = 0
+    for version in versions.no_cache():
+        if version.storage == storage:
+            continue
+
+        click.echo(f"{version.id} {version.name}: to {storage}")
+        if dry_run:
+            continue
+        if storage == STORAGE_MEMBERSHIP:
+            VersionRepository.move_to_membership(version)
+        else:
+            VersionRepository.move_to_embedded(version)
+        migrated += 1
+
+    click.echo(f"{migrated} versions migrated.")
+
+
+@app.cli.command("sync-versions")
+@click.option(
+    "--account",
+    "account_ids",
+    multiple=True,
+    help="ID of an account to sync. All accounts with pending writes if omitted.",
+)
+@click.option("--dry-run", is_flag=True, help="List the accounts without syncing them.")
+def sync_versions(account_ids, dry_run):
+    """
+    Re-evaluates the versions of accounts with writes that were never propagated to
+    them, e.g. because propagation failed or the process stopped first, and clears
+    those writes from their pending updates.
+    """
+    synced = 0
+    for account_id, tokens in VersionRepository.get_pending_updates(
+        account_ids
+    ).items():
+        click.echo(f"{account_id}: {len(tokens)} pending writes")
+        if dry_run:
+            continue
+        failed_ids = resync_versions(account_id)
+        VersionRepository.remove_pending_updates(account_id, tokens, failed_ids)
+        if failed_ids:
+            click.echo(f"{account_id}: {len(failed_ids)} versions failed to update")
+        synced += 1
+
+    click.echo(f"{synced} accounts synced.")
+
+
+@app.cli.command("check-indexes")
+@click.option(
+    "--ensure", is_flag=True, help="Create the declared indexes before checking."
+)
+def check_indexes(ensure):
+    """
+    Explains the hot queries of the app and flags the ones that scan a whole
+    collection. Exits with an error if any query does.
+    """
+    if ensure:
+        for model in {model for _, model, _, _ in get_hot_queries()}:
+            model.ensure_indexes()
+
+    scans = 0
+    for name, collection, stages, is_scan in check_query_plans():
+        status = "COLLSCAN" if is_scan else "ok"
+        click.echo(f"{status:8} {collection}: {name} ({' > '.join(stages)})")
+        scans += is_scan
+
+    if scans:
+        raise click.ClickException(f"{scans} queries scan a whole collection.")
+    click.echo("Every query uses an index.")
+
+
+@app.cli.command("benchmark-versions")
+@click.option("--rows", default=20000, show_default=True, help="Trades of the account.")
+@click.option(
+    "--versions", default=32, show_default=True, help="Versions of the account."
+)
+@click.option(
+    "--workers",
+    "worker_counts",
+    multiple=True,
+    type=int,
+    default=[1, 2, 4, 8],
+    show_default=True,
+    help="Evaluation worker counts to time.",
+)
+@click.option("--repeat", default=3, show_default=True, help="Runs per worker count.")
+def benchmark_versions(rows, versions, worker_counts, repeat):
+    """
+    Times the evaluation of the versions of a synthetic account (filtering and encoding
+    their new state) with each number of workers. Nothing is written to the database.
+    """
+    rng = np.random.default_rng(0)
+    pairs = ["eurusd", "gbpusd", "usdjpy", "audusd", "cadjpy"]
+    df = pd.DataFrame(
+        {
+            "col_p": rng.choice(pairs, rows),
+            "col_rr": rng.normal(1, 2, rows).round(2),
+            "col_v_Profit": rng.normal(0, 100, rows).round(2),
+            "col_m_Setup": rng.choice(["A", "B", "C"], rows),
+            "note": "",
+        },
+        index=pd.Index([f"{i:032x}" for i in range(rows)], dtype="object"),
+    )
+    # every version has its own filter values, so no mask is shared between them
+    filters = {
+        id: [
+            SimpleNamespace(
+                column="col_v_Profit", operation="gt", value=[-50 + 100 * id / versions]
+            ),
+            SimpleNamespace(column="col_rr", operation="gt", value=[-id / versions]),
+        ]
+        for id in range(versions)
+    }
+    setups = [SimpleNamespace(id=id, storage=STORAGE_EMBEDDED) for id in filters]
+
+    baseline = None
+    for workers in worker_counts:
+        evaluator = VersionEvaluator(workers=workers)
+        timings = []
+        for _ in range(repeat):
+            masks = FilterMasks(df)
+
+            def evaluate(setup):
+                filtered_df = masks.apply(filters[setup.id])
+                update = VersionRepository.get_state_update(setup.storage, filtered_df)
+                return [(setup.id, update)]
+
+            start = time.perf_counter()
+            evaluator.run(setups, evaluate, lambda updates: [])
+            timings.append(time.perf_counter() - start)
+        evaluator.shutdown()
+
+        best = min(timings)
+        baseline = baseline or best
+        click.echo(
+            f"{workers:3} workers: {best * 1000:8.1f} ms ({baseline / best:.2f}x)"
+        )
@@ -0,0 +1,6 @@
+# Where the trades of an account (Document) are stored
+STORAGE_EMBEDDED = "embedded"  # in the state.data dict of the Document
+STORAGE_TRADES = "trades"  # one document per trade in the trades collection
+
+# Where the rows of a version (Setup) are stored
+STORAGE_MEMBERSHIP = "membership"  # only the row IDs, resolved against the account
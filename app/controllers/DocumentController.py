@@ -2,16 +2,16 @@ import json
 import logging
 import re
 import uuid
+from functools import partial
 
 import pandas as pd
 from app import app
 from app.controllers.errors import UploadError
 from app.controllers.FilterController import filter_open_trades
 from app.controllers.RowController import update_mappings_to_template
-from app.controllers.SetupController import update_setups
+from app.controllers.SetupController import propagate_setups_row
 from app.controllers.UploadController import upload_default, upload_mt4
 from app.controllers.utils import (
-    from_db_to_df,
     from_df_to_db,
     get_columm_expected_type,
     parse_column_name,
@@ -20,15 +20,18 @@ from app.controllers.utils import (
 from app.models.Document import Document, TradeCondition
 from app.models.Setup import Setup
 from app.models.Template import Template
-from app.models.User import User
+from app.repositories.account_repository import AccountRepository
+from app.repositories.template_repository import TemplateRepository
 from app.repositories.version_repository import VersionRepository
 from app.services.account_manager import AccountManager
 from app.services.filter_service import FilterService
+from app.services.propagation_service import propagation_queue
 from app.services.version_service import VersionService
+from app.utils.column_migrations import ColumnMigration
+from app.utils.identity import get_owned, get_user_id
 from bson import json_util
 from flask import jsonify, request
 from flask.wrappers import Response
-from flask_jwt_extended import get_jwt_identity
 
 source_map = {
     "DEFAULT": "Default",
@@ -52,17 +55,12 @@ OTHER_COLUMNS_TYPE_MAPPING = {
 def get_documents():
     """
     Retrieves All Documents
+
+    Setups are read in a separate query that only projects their metadata, so their
+    state is never loaded alongside the documents.
     """
 
     pipeline = [
-        {
-            "$lookup": {
-                "from": Setup._get_collection_name(),
-                "localField": "_id",
-                "foreignField": "documentId",
-                "as": "setups",
-            }
-        },
         {
             "$lookup": {
                 "from": Template._get_collection_name(),
@@ -92,31 +90,41 @@ def get_documents():
                         "date": {"$toDate": "$date_created"},
                     }
                 },
-                "setups": {
-                    "$map": {
-                        "input": "$setups",
-                        "as": "setup",
-                        "in": {
-                            "id": {"$toString": "$$setup._id"},
-                            "name": "$$setup.name",
-                            "isDefault": "$$setup.default",
-                            "date": {
-                                "$dateToString": {
-                                    "format": "%Y-%m-%dT%H:%M:%S.%LZ",
-                                    "date": {"$toDate": "$$setup.date_created"},
-                                }
-                            },
-                        },
-                    }
-                },
             }
         },
     ]
 
-    id = get_jwt_identity()
-    user = User.objects(id=id["$oid"]).get()
-    documents = Document.objects(author=user).aggregate(pipeline)
+    documents = get_owned(Document).aggregate(pipeline)
     documents = json.loads(json_util.dumps(documents))
+
+    setups = Setup.objects(
+        documentId__in=[document["id"] for document in documents]
+    ).aggregate(
+        [
+            {"$sort": {"_id": 1}},
+            {
+                "$project": {
+                    "_id": 0,
+                    "documentId": {"$toString": "$documentId"},
+                    "id": {"$toString": "$_id"},
+                    "name": 1,
+                    "isDefault": "$default",
+                    "date": {
+                        "$dateToString": {
+                            "format": "%Y-%m-%dT%H:%M:%S.%LZ",
+                            "date": {"$toDate": "$date_created"},
+                        }
+                    },
+                }
+            },
+        ]
+    )
+    document_setups = {document["id"]: [] for document in documents}
+    for setup in json.loads(json_util.dumps(setups)):
+        document_setups[setup.pop("documentId")].append(setup)
+    for document in documents:
+        document["setups"] = document_setups[document["id"]]
+
     return jsonify(documents)
 
 
@@ -124,14 +132,13 @@ def get_document(file_id):
     """
     Retreives a Document state
     """
-    id = get_jwt_identity()
-    user = User.objects(id=id["$oid"]).get()
-    file = Document.objects(id=file_id, author=user).get()
+    file = get_owned(Document, id=file_id).get()
     # for col in state["schema"]["fields"]:
     #     col["title"] = parse_column_name(col.get("name"))
     #     col["field"] = col.pop("name")
 
-    response = {"id": str(file.id), "name": file.name, "state": file.state}
+    state = AccountRepository.get_state(file.id, file.state, file.storage)
+    response = {"id": str(file.id), "name": file.name, "state": state}
     response = jsonify(response)
     return response
 
@@ -140,15 +147,14 @@ def create_document():
     """
     Creates a new Document
     """
-    id = get_jwt_identity()
-    user = User.objects(id=id["$oid"]).get()
+    user_id = get_user_id()
 
     name = request.json.get("name", None)
     columns = request.json.get("fields", None)
     other = request.json.get("checkbox", None)
 
     # check if file exists
-    is_file_exists = Document.objects(name=name, author=user)
+    is_file_exists = Document.objects(name=name, author=user_id)
     if len(is_file_exists) > 0:
         return jsonify({"msg": "This file already exists", "success": False})
 
@@ -177,16 +183,20 @@ def create_document():
     state = {"data": data, "fields": df.dtypes.apply(lambda x: x.name).to_dict()}
 
     # get default tempalte
-    default_template = Template.objects(name="Default").get()
+    default_template = TemplateRepository.get_template()
 
     # save the file to the DB
     document = Document(
-        name=name, author=user, state=state, source="Manual", template=default_template
+        name=name,
+        author=user_id,
+        state=state,
+        source="Manual",
+        template=default_template,
     )
     document.save()
     # save the default setup to the DB
     setup = Setup(
-        name="Default", author=user, documentId=document, default=True, state=state
+        name="Default", author=user_id, documentId=document, default=True, state=state
     )
     setup.save()
     return jsonify({"msg": "Document successfully uploaded", "success": True})
@@ -196,9 +206,7 @@ def get_document_columns(file_id):
     """
     Retrieves a Document columns
     """
-    id = get_jwt_identity()
-    user = User.objects(id=id["$oid"]).get()
-    file = Document.objects(id=file_id, author=user).get()
+    file = get_owned(Document, id=file_id).get()
     account_columns = file.state["fields"]
 
     # TODO: check if DataFrame is emtpy. If it is then get data from elsewhere (create utils function).
@@ -215,11 +223,7 @@ def put_document_columns(account_id):
     """
     Updates the account columns
     """
-    # TODO: some logic here can be abstracted
-    id = get_jwt_identity()
-    user = User.objects(id=id["$oid"]).get()
-
-    account = Document.objects(id=account_id, author=user).first()
+    account = get_owned(Document, id=account_id).exclude("state.data").first()
 
     if not account:
         return jsonify(
@@ -230,9 +234,6 @@ def put_document_columns(account_id):
     edit_columns = request.json.get("edit", [])
     delete_columns = request.json.get("delete", [])
 
-    # Get state of the account
-    df = from_db_to_df(account.state)
-
     # Get columns mapped to a template
     template_columns = (
         list(account.template_mapping.values()) if account.template_mapping else []
@@ -240,11 +241,18 @@ def put_document_columns(account_id):
 
     # Extract account columns (fields)
     fields = account.state.get("fields")
+    account_types = dict(fields)
     account_fields = list(fields.keys())
 
     # Track filters to remove
     filters_to_remove = []
 
+    # Only changing the type of a column needs the trades to be read and parsed, any
+    # other change is applied by MongoDB (see ColumnMigration)
+    migration = ColumnMigration()
+    column_types = {}
+
+    column = None
     try:
         # Handle columns to delete
         for column in delete_columns:
@@ -256,7 +264,7 @@ def put_document_columns(account_id):
                         "msg": f"Column {parse_column_name(column)} cannot be deleted becuase it's used in a template. Modify your template settings to delete this column.",
                     }
                 )
-            df = df.drop(column, axis=1, errors="ignore")
+            migration.deleted.append(column)
             del fields[column]
             filters_to_remove.append(column)
 
@@ -276,7 +284,7 @@ def put_document_columns(account_id):
             column_type = get_columm_expected_type(column_id, column_type)
 
             fields[column_name] = column_type
-            df[column_name] = None
+            migration.added.append(column_name)
 
         # Handle columns to edit
         for column in edit_columns:
@@ -300,22 +308,26 @@ def put_document_columns(account_id):
             column_type = column.get("type", None)
             column_type = get_columm_expected_type(new_column_name, column_type)
 
-            df[pre_column_name] = (
-                df[pre_column_name]
-                .astype(column_type)
-                .where(df[pre_column_name].notnull(), None)
-            )
-            df.rename(columns={pre_column_name: new_column_name}, inplace=True)
+            column_types[pre_column_name] = column_type
+            if new_column_name != pre_column_name:
+                # renaming onto a column that is kept or added would null its values
+                if new_column_name in fields:
+                    return jsonify(
+                        {
+                            "success": False,
+                            "msg": f"Column {parse_column_name(pre_column_name)} cannot be renamed to {parse_column_name(new_column_name)} because that column already exists.",
+                        }
+                    )
+                migration.renamed[pre_column_name] = new_column_name
 
             del fields[pre_column_name]
             fields[new_column_name] = column_type
             filters_to_remove.append(pre_column_name)
 
     except Exception as e:
-        # TODO: this exception could be more specific on what column failed
         logging.error(
-            f"Error updating columns for account {account_id}: {str(e)}"
-        )  # TODO: IMPROVE THIS MESSAGE
+            f"Error updating column {column} of account {account_id}: {str(e)}"
+        )
         return jsonify(
             {
                 "success": False,
@@ -324,7 +336,7 @@ def put_document_columns(account_id):
         )
 
     # Ensure a result column is present for the account
-    if not [column for column in df.columns if re.match(r"col_[vpr]_", column)]:
+    if not [column for column in fields if re.match(r"col_[vpr]_", column)]:
         return jsonify(
             {
                 "success": False,
@@ -332,23 +344,54 @@ def put_document_columns(account_id):
             }
         )
 
-    # Update document and its state
-    data = from_df_to_db(df)
-    account.update(__raw__={"$set": {f"state": {"fields": fields, "data": data}}})
+    retyped = any(
+        str(column_type).lower() != str(account_types[column]).lower()
+        for column, column_type in column_types.items()
+    )
+    if retyped:
+        try:
+            df = migrate_dataframe_columns(
+                AccountRepository.get_raw_dataframe(account.id),
+                migration,
+                column_types,
+            )
+        except Exception as e:
+            logging.error(f"Error updating columns for account {account_id}: {str(e)}")
+            return jsonify(
+                {
+                    "success": False,
+                    "msg": "Failed to update account columns. Please try again.",
+                }
+            )
 
     try:
-        # TODO: this should not be here (performance related)
         version_repository = VersionRepository()
         filter_service = FilterService()
         version_service = VersionService(version_repository, filter_service)
 
-        version_service.update_version_from_account_without_filters(
-            account.id, df, fields, filters_to_remove
-        )
+        # redoes the update of the versions from the migrated account if it fails
+        resync = partial(version_service.resync_versions, account.id, filters_to_remove)
+        if retyped:
+            # Update document and its state from the parsed trades
+            AccountRepository.set_state(account, fields, from_df_to_db(df))
+            task = resync
+        else:
+            AccountRepository.migrate_columns(account, fields, migration)
+            task = partial(
+                version_service.migrate_version_columns,
+                account.id,
+                fields,
+                migration,
+                filters_to_remove,
+                partial(AccountRepository.get_raw_dataframe, account.id),
+            )
+
+        # the versions are updated in the background
+        propagation_queue.submit(account.id, task, resync)
 
     except Exception as error:
         logging.error(
-            f"Failed to update setups on ${account_id} during a column update. Error: ${str(error)}"
+            f"Failed to update setups on {account_id} during a column update. Error: {str(error)}"
         )
         return jsonify(
             {"msg": "Something went wrong. Please try again.", "success": False}
@@ -357,8 +400,23 @@ def put_document_columns(account_id):
     return jsonify({"success": True, "msg": "The account was successfully modified!"})
 
 
+def migrate_dataframe_columns(
+    df: pd.DataFrame, migration, column_types: dict
+) -> pd.DataFrame:
+    """
+    Applies a ColumnMigration to the decoded trades of an account, parsing the edited
+    columns to their types in column_types
+    """
+    df = df.drop(migration.deleted, axis=1, errors="ignore")
+    for column in migration.added:
+        df[column] = None
+    for column, column_type in column_types.items():
+        df[column] = df[column].astype(column_type).where(df[column].notnull(), None)
+    return df.rename(columns=migration.renamed)
+
+
 def get_account_settings(account_id):
-    account = Document.objects(id=account_id).get()
+    account = AccountRepository.get_account(account_id)
 
     return jsonify(
         {
@@ -394,7 +452,7 @@ def put_account_settings(account_id) -> Response:
     Returns:
     - Flask.Response: JSON response indicating the outcome.
     """
-    account = Document.objects(id=account_id).get()
+    account = AccountRepository.get_account(account_id)
 
     name = request.json.get("name", account.name)
     balance = request.json.get("balance", account.balance)
@@ -416,7 +474,7 @@ def put_account_settings(account_id) -> Response:
                     open_operation == "empty" or open_operation == "not_empty"
                 ) or open_value:
                     # Ensure filter condition does not return an error
-                    df = from_db_to_df(account.state)
+                    df = AccountRepository.get_raw_dataframe(account.id)
                     column_type = account.state["fields"].get(open_column)
                     filter_open_trades(
                         df, open_column, column_type, open_operation, open_value
@@ -428,7 +486,9 @@ def put_account_settings(account_id) -> Response:
                         value=str(open_value),
                     )
 
-                    account.modify(open_conditions=[open_trade_condition])
+                    Document.objects(id=account.id).update_one(
+                        open_conditions=[open_trade_condition]
+                    )
 
     except Exception as error:
         # TODO: log
@@ -442,7 +502,9 @@ def put_account_settings(account_id) -> Response:
     try:
         # Validate balance is a number
         balance = float(balance)
-        account.modify(name=name, balance=balance, account_currency=currency)
+        Document.objects(id=account.id).update_one(
+            name=name, balance=balance, account_currency=currency
+        )
         return jsonify(
             {"message": "Account settings updated successfully!", "success": True}
         )
@@ -456,12 +518,10 @@ def get_document_compare(file_id):
     """
     Retrieves a Document w/ Setups (compare)
     """
-    id = get_jwt_identity()
     metric = request.args.get("metric", None)
-    user = User.objects(id=id["$oid"]).get()
-    setups = Setup.objects(author=user, documentId=file_id).order_by("-date_created")
+    setups = get_owned(Setup, documentId=file_id).order_by("-date_created")
     # implied that column names will not differ between setups and its document
-    df = from_db_to_df(setups[0].state)
+    df = VersionRepository.get_dataframe(setups[0])
     metric_list = [col for col in df if re.match(r"col_[vpr]_", col)]
     if not metric_list:
         return jsonify(
@@ -472,9 +532,12 @@ def get_document_compare(file_id):
         )
     metric = metric_list[0] if metric is None else metric
 
+    filters = VersionRepository.get_filters(setups)
     setups_compared = []
     for setup in setups:
-        current = setup.setup_compare(metric)
+        current = setup.setup_compare(
+            metric, VersionRepository.get_dataframe(setup), filters[setup.id]
+        )
         current = json.loads(current)
         setups_compared.append(current)
 
@@ -496,7 +559,9 @@ def get_calendar_table(document_id):
     metric = request.args.get("metric", None)
     date = request.args.get("date", None)
     document = Document.objects(id=document_id).get()
-    df = from_db_to_df(document.state, orient="index")
+    df = AccountRepository.get_dataframe(
+        document.id, document.state, document.state_version, document.storage
+    )
     # TODO: combine both loops into a single
     metric_list = [col for col in df if re.match(r"col_[vpr]_", col)]
     # TODO: is it col_r or col_r_
@@ -520,11 +585,10 @@ def get_calendar_table(document_id):
 
 def put_document(file_id):
     """Update Doucment"""
-    id = get_jwt_identity()
-    user = User.objects(id=id["$oid"]).get()
+    user_id = get_user_id()
     # get the document and its new name
     name = request.json.get("name", None)
-    file = Document.objects(id=file_id, author=user).get()
+    file = AccountRepository.get_account(file_id, user_id)
     file.name = name
     file.save()
     return jsonify({"msg": "Document successfully updated", "success": True})
@@ -532,15 +596,14 @@ def put_document(file_id):
 
 def post_document():
     """Upload Document"""
-    id = get_jwt_identity()
-    user = User.objects(id=id["$oid"]).get()
+    user_id = get_user_id()
     # get file
     file = request.files["file"]
 
     file_source = request.form.get("filesourcetype", None)
 
     # check if file exists
-    is_file_exists = Document.objects(name=file.filename, author=user)
+    is_file_exists = Document.objects(name=file.filename, author=user_id)
     if len(is_file_exists) > 0:
         return jsonify({"msg": "This file already exists", "success": False})
     try:
@@ -557,10 +620,10 @@ def post_document():
         return jsonify({"msg": error.message, "success": False})
 
     # save the file to the DB
-    default_template = Template.objects(name="Default").get()
+    default_template = TemplateRepository.get_template()
     document = Document(
         name=file.filename,
-        author=user,
+        author=user_id,
         state=df,
         source=source_map[file_source],
         template=default_template,
@@ -568,7 +631,7 @@ def post_document():
     document.save()
     # save the default setup to the DB
     setup = Setup(
-        name="Default", author=user, documentId=document, default=True, state=df
+        name="Default", author=user_id, documentId=document, default=True, state=df
     )
     setup.save()
 
@@ -580,8 +643,7 @@ def clone_document(file_id):
     Duplicates Existing File
     NOTE: It could be abstracted
     """
-    id = get_jwt_identity()
-    user = User.objects(id=id["$oid"]).get()
+    user_id = get_user_id()
     # get the document and initialise a counter
     copy_counter = 1
     file = Document.objects(id=file_id).get()
@@ -595,7 +657,9 @@ def clone_document(file_id):
         new_name = original + " Copy_" + str(copy_counter)
         is_file_exists = Document.objects(name=new_name)
 
-    new_df = from_db_to_df(file.state)
+    new_df = AccountRepository.get_dataframe(
+        file.id, file.state, file.state_version, file.storage
+    )
     new_data = from_df_to_db(new_df, add_index=True)
     new_state = {
         "data": new_data,
@@ -603,11 +667,17 @@ def clone_document(file_id):
     }
 
     # save the copy to the DB
-    document = Document(name=new_name, author=user, state=new_state, source=file.source)
+    document = Document(
+        name=new_name, author=user_id, state=new_state, source=file.source
+    )
     document.save()
     # save the default setup to the DB
     setup = Setup(
-        name="Default", author=user, documentId=document, default=True, state=new_state
+        name="Default",
+        author=user_id,
+        documentId=document,
+        default=True,
+        state=new_state,
     )
     setup.save()
     return jsonify({"msg": "Document successfully copied", "success": True})
@@ -630,24 +700,18 @@ def put_document_row(file_id):
         index = uuid.uuid4().hex
         # remove unnecessary keys from row
         data.pop("rowId", None)
-        Document.objects(id=file_id).update(
-            __raw__={"$set": {f"state.data.{index}": data}}
-        )
+        AccountRepository.set_trade(document, index, data)
 
     elif method == "update":
         index = data.get("rowId")
         # remove unnecessary keys from row
         data.pop("rowId", None)
-        Document.objects(id=file_id).update(
-            __raw__={"$set": {f"state.data.{index}": data}}
-        )
+        AccountRepository.set_trade(document, index, data)
 
     elif method == "delete":
         index = data.get("rowId")
         try:
-            Document.objects(id=file_id).update_one(
-                __raw__={"$unset": {f"state.data.{index}": 1}}
-            )
+            AccountRepository.delete_trade(document, index)
         except Exception as err:
             return jsonify(
                 {"msg": err, "success": False}
@@ -655,18 +719,13 @@ def put_document_row(file_id):
     else:
         return jsonify({"msg": "Something went wrong. Try again!", "success": False})
 
-    template_type = None
-
-    if document.template:
-        template_type = document.template.name
+    template_type = TemplateRepository.get_template_name(document)
 
     if template_type == "PPT":
         update_mappings_to_template(document, index, data, method)
 
     try:
-        document = Document.objects(id=file_id).first()
-        document_df = from_db_to_df(document.state)
-        update_setups(document.id, document_df)
+        propagate_setups_row(document.id, index)
     except Exception as error:
         logging.error(f"Failed to update setups on ${file_id}. Error: ${error}")
         return jsonify({"msg": "Something went wrong. Try again!", "success": False})
@@ -679,13 +738,13 @@ def delete_document(file_id):
     Delete Document
     NOTE: make sure document belongs to the author
     """
-    id = get_jwt_identity()
-    user = User.objects(id=id["$oid"]).get()
     # get the document
-    file = Document.objects(id=file_id, author=user).get()
+    file = get_owned(Document, id=file_id).get()
     try:
         # delete setups
         Setup.objects(documentId=file.id).delete()
+        # delete trades stored outside the file
+        AccountRepository.delete_trades(file)
         # delete file in DB
         file.delete()
         return jsonify({"msg": "Document successfully deleted", "success": True})
@@ -697,8 +756,7 @@ async def fetch_metatrader():
     """
     Fetch account directly from MetaTrader. It requires account, passsword, server and platform.
     """
-    id = get_jwt_identity()
-    user = User.objects(id=id["$oid"]).get()
+    user_id = get_user_id()
 
     account = request.json.get("account", None)
     password = request.json.get("password", None)
@@ -709,7 +767,7 @@ async def fetch_metatrader():
     if not all([account, password, server, platform]):
         return jsonify({"msg": "Some information is missing.", "success": False})
 
-    account_manager = AccountManager(user)
+    account_manager = AccountManager(user_id)
     result = account_manager.fetch_from_metatrader(account, password, server, platform)
     return jsonify(result)
 
@@ -1,17 +1,21 @@
 import json
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 from io import StringIO
 from typing import Union
 
 import numpy as np
 import pandas as pd
 from app import app
+from app.constants.storage import STORAGE_MEMBERSHIP
 from app.controllers.ErrorController import handle_403
-from app.controllers.utils import from_db_to_df, from_df_to_db, retrieve_filter_options
 from app.models.Document import Document
 from app.models.Filter import Filter
 from app.models.Setup import Setup
+from app.repositories.account_repository import AccountRepository
+from app.repositories.version_repository import VersionRepository
+from app.services.filter_service import FilterMasks, FilterService
+from app.utils.references import get_reference_id
 from bson import DBRef, ObjectId, json_util
 from flask import jsonify, request
 from flask.wrappers import Response
@@ -27,96 +31,18 @@ class CustomJSONizer(json.JSONEncoder):
         )
 
 
-# TODO: this function can be improved
 def apply_filter(df, column, operation, value):
     """
     Applies a Filter to a dataframe
     """
-    if operation == "in" or operation == "nin":
-        if df.dtypes[column] == "bool" and len(value) == 1:
-            # convert string 'true' or 'false' to bool
-            value_bool = value[0] == "true"
-            if operation == "in":
-                df = df[df[column] == value_bool]
-            elif operation == "nin":
-                df = df[df[column] != value_bool]
-        elif column == "col_d":
-            if operation == "in":
-                df = df[df[column].str.fullmatch("|".join(value), case=False)]
-            elif operation == "nin":
-                df = df[-df[column].str.fullmatch("|".join(value), case=False)]
-        else:
-            if operation == "in":
-                df = df[df[column].isin(value)]
-            elif operation == "nin":
-                df = df[-df[column].isin(value)]
-
-    elif operation == "date":
-        date_from = datetime.strptime(value[0], "%m/%d/%Y").strftime("%Y-%m-%d")
-        date_to = datetime.strptime(value[1], "%m/%d/%Y") + timedelta(days=1)
-        date_to = date_to.strftime("%Y-%m-%d")
-        df = df.loc[(df[column] >= date_from) & (df[column] < date_to)]
-
-    else:
-        # update the value so that it only gets the first element
-        value = value[0]
-        if operation == "gt":
-            df = df[df[column] > value]
-        elif operation == "lt":
-            df = df[df[column] < value]
-        elif operation == "eq":
-            df = df[df[column] == value]
-        elif operation == "ne":
-            df = df[df[column] != value]
-
-    return df
+    return df[FilterMasks(df).get_mask(column, operation, value)]
 
 
 def get_filter_options(doucment_id):
     """
     Gets Setup Filter Options
     """
-    document = Document.objects(id=doucment_id).get()
-
-    data = from_db_to_df(document.state)
-    data.replace({np.nan: None}, inplace=True)
-
-    map_types = data.dtypes
-    options = []
-    for column in data.columns:
-        if column.startswith("col_m_"):
-            option = {"id": column, "name": column[6:]}
-            if map_types[column] == "float64" or map_types[column] == "int64":
-                option.update(type="number")
-            else:
-                option.update(type="string")
-                option.update(values=list(data[column].dropna().unique()))
-            options.append(option)
-        if column.startswith("col_p"):
-            option = {
-                "id": column,
-                "name": "Pair",
-                "type": "string",
-                "values": list(data[column].dropna().unique()),
-            }
-            options.append(option)
-        if column.startswith("col_rr"):
-            option = {
-                "id": column,
-                "name": "Risk Reward",
-                "type": "number",
-                "values": list(data[column].dropna().unique()),
-            }
-            options.append(option)
-        if column.startswith("col_d_"):
-            option = {
-                "id": column,
-                "name": column[6:],
-                "type": "date",
-            }
-            options.append(option)
-
-    return options
+    return AccountRepository.get_filter_options(doucment_id)
 
 
 def get_filter_name(column, operation, value):
@@ -163,13 +89,14 @@ def post_filter(setup_id: str):
     operation = request.json.get("action", None)
     value = request.json.get("value", None)
     setup = Setup.objects(id=setup_id).first()
-    df = from_db_to_df(setup.state)
+    df = VersionRepository.get_dataframe(setup)
     if column == None or operation == None or value == None:
         return handle_403(msg="Filter is not valid")
+    if operation not in FilterService.OPERATIONS:
+        return handle_403(msg="Filter is not valid")
 
     df = apply_filter(df, column, operation, value)
     name = get_filter_name(column, operation, value)
-    data = from_df_to_db(df)
 
     filter = Filter(
         name=name,
@@ -178,19 +105,17 @@ def post_filter(setup_id: str):
         value=value,
     ).save()
 
-    is_updated = setup.modify(push__filters=filter, set__state__data=data)
+    is_updated = setup.modify(
+        __raw__={
+            "$push": {"filters": filter.id},
+            "$set": VersionRepository.get_state_update(setup.storage, df),
+            "$inc": {"state_version": 1},
+        }
+    )
 
     if is_updated:
         updated_setup = Setup.objects(id=setup_id).aggregate(
             [
-                {
-                    "$lookup": {
-                        "from": Document._get_collection_name(),
-                        "localField": "documentId",
-                        "foreignField": "_id",
-                        "as": "document",
-                    },
-                },
                 {
                     "$lookup": {
                         "from": Filter._get_collection_name(),
@@ -224,6 +149,8 @@ def post_filter(setup_id: str):
                         "filters.name": 1,
                         "documentId": {"$toString": "documentId"},
                         "state": 1,
+                        "storage": 1,
+                        "row_ids": 1,
                         "notes": 1,
                         "name": 1,
                         "date_created": {
@@ -232,7 +159,6 @@ def post_filter(setup_id: str):
                                 "date": {"$toDate": "$date_created"},
                             }
                         },
-                        "document.state": 1,
                     }
                 },
             ]
@@ -240,10 +166,17 @@ def post_filter(setup_id: str):
 
         updated_setup = json.loads(json_util.dumps(updated_setup))[0]
 
-        df = from_db_to_df(updated_setup["document"][0]["state"])
-        updated_setup["options"] = retrieve_filter_options(df)
+        account_id = get_reference_id(setup._data.get("documentId"))
+        updated_setup["options"] = get_filter_options(account_id)
 
-        del updated_setup["document"]
+        if updated_setup.pop("storage", None) == STORAGE_MEMBERSHIP:
+            # only the rows of the version are read from the account
+            row_ids = updated_setup.get("row_ids") or []
+            account_state = AccountRepository.get_partial_state(account_id, row_ids)
+            updated_setup["state"] = VersionRepository.resolve_state(
+                updated_setup["state"], row_ids, account_state
+            )
+        updated_setup.pop("row_ids", None)
 
         return jsonify(updated_setup)
 
@@ -264,18 +197,22 @@ def delete_filter(setup_id, filter_id):
 
         # establish remaining filters
         document = Document.objects(id=setup.documentId.id).get()
-        df = from_db_to_df(document.state)
-
-        for filter in setup.filters:
-            df = apply_filter(df, filter.column, filter.operation, filter.value)
+        df = AccountRepository.get_dataframe(
+            document.id, document.state, document.state_version, document.storage
+        )
+        df = FilterMasks(df).apply(setup.filters)
 
-        data = from_df_to_db(df)
-        setup.modify(set__state__data=data)
+        setup.modify(
+            __raw__={
+                "$set": VersionRepository.get_state_update(setup.storage, df),
+                "$inc": {"state_version": 1},
+            }
+        )
 
         # delete filter
         filter_dlt.delete()
 
-        response = setup.to_json()
+        response = setup.to_json(VersionRepository.get_state(setup))
         response = json.loads(response)
         # loads options and appends them to setup
         options = get_filter_options(setup.documentId.id)
@@ -12,8 +12,9 @@ import numpy as np
 import pandas as pd
 from app import app
 from app.controllers.GraphsController import calculate_equity
-from app.controllers.utils import from_db_to_df, parse_column_name, truncate
+from app.controllers.utils import parse_column_name, truncate
 from app.models.Setup import Setup
+from app.repositories.version_repository import VersionRepository
 from flask import Flask, make_response, send_file
 from fpdf import FPDF, HTML2FPDF
 
@@ -212,10 +213,11 @@ def get_file(setup_id):
         pdf.title_and_date(title)
         # pdf.insert_toc_placeholder(render_toc) # renders table of contents
         pdf.head2("Notes & Filters")
-        pdf.generate_notes_and_filters(setup.notes, setup.filters)
+        filters = VersionRepository.get_filters([setup])[setup.id]
+        pdf.generate_notes_and_filters(setup.notes, filters)
 
         pdf.head1("Trades Table")
-        df = from_db_to_df(setup.state)
+        df = VersionRepository.get_dataframe(setup)
 
         # drop table columns
         df_drop_columns = [col for col in df.columns if col.startswith("col_m_")] + [
@@ -275,7 +277,7 @@ def get_file(setup_id):
         metric_columns = [
             column for column in df.columns if re.match(r"col_m_", column)
         ]
-        trades = setup.state.get("data").values()
+        trades = VersionRepository.get_state(setup).get("data").values()
         for i, trade in enumerate(trades):
             is_add_page = False if i == len(trades) - 1 else True
             pdf.trade_breakdown(
@@ -1,9 +1,11 @@
 from app.controllers.utils import parse_mappings, row_to_ppt_template
 from app.models.Document import Document
 from app.models.PPTTemplate import EntryPosition, PPTTemplate, TakeProfit
-from app.models.Setup import Setup
+from app.repositories.account_repository import AccountRepository
+from app.repositories.version_repository import VersionRepository
 from bson import ObjectId
 from flask import jsonify
+from pymongo import ReplaceOne
 
 
 def update_ppt_row(document, row_id, row):
@@ -37,22 +39,29 @@ def update_default_row(setup, row_id, note, images, is_sync):
     Update a setup row with Default Template
     """
     try:
-        setup.update(__raw__={"$set": {f"state.data.{row_id}.note": note}})
-        setup.update(__raw__={"$set": {f"state.data.{row_id}.imgs": images}})
+        row_update = {
+            "$set": {
+                f"state.data.{row_id}.note": note,
+                f"state.data.{row_id}.imgs": images,
+            },
+            "$inc": {"state_version": 1},
+        }
+        if isinstance(setup, Document):
+            # the row belongs to an account, whose trades may be stored outside it
+            AccountRepository.update_trade_fields(
+                setup, row_id, {"note": note, "imgs": images}
+            )
+        else:
+            setup.update(__raw__=row_update)
         if is_sync:
             # update the parent document
-            Document.objects(id=setup.documentId.id).update_one(
-                __raw__={"$set": {f"state.data.{row_id}.note": note}}
-            )
-            Document.objects(id=setup.documentId.id).update_one(
-                __raw__={"$set": {f"state.data.{row_id}.imgs": images}}
+            account = Document.objects(id=setup.documentId.id).only("storage").get()
+            AccountRepository.update_trade_fields(
+                account, row_id, {"note": note, "imgs": images}
             )
             # update all the setups
-            Setup.objects(documentId=setup.documentId).update(
-                __raw__={"$set": {f"state.data.{row_id}.note": note}}
-            )
-            Setup.objects(documentId=setup.documentId).update(
-                __raw__={"$set": {f"state.data.{row_id}.imgs": images}}
+            VersionRepository.update_versions_row(
+                setup.documentId.id, row_id, row_update["$set"]
             )
     except Exception as err:
         return jsonify({"msg": err, "success": False})
@@ -64,17 +73,17 @@ def update_mappings_to_row(document, row, mappings):
     Update mapptings from a template to a row.
     """
     row_id = row["row_id"]
-    state_item = document.state["data"][row_id]
+    state_item = AccountRepository.get_trade(document.id, row_id)
 
     for template_k, state_k in mappings.items():
         if state_k:
             template_item = parse_mappings(row, template_k)
             state_item[state_k] = template_item
 
-    document.update(__raw__={"$set": {f"state.data.{row_id}": state_item}})
+    AccountRepository.set_trade(document, row_id, state_item)
 
-    Setup.objects(documentId=document).update(
-        __raw__={"$set": {f"state.data.{row_id}": state_item}}
+    VersionRepository.update_versions_row(
+        document.id, row_id, {f"state.data.{row_id}": state_item}
     )
 
     return True
@@ -166,3 +175,38 @@ def put_template(account, trade_id: str, trade: object) -> None:
         template = PPTTemplate.objects(row_id=trade_id, document=account).get()
         template = row_to_ppt_template(account.template_mapping, template, trade)
         template.save()
+
+
+def sync_templates(account, trades: dict, added: list) -> None:
+    """
+    Syncs the PPT templates of several trades at once, given as {trade_id: trade} with
+    None for the deleted trades. Templates of the added trades are inserted together and
+    the mappings of the updated trades are written in a single bulk write.
+    """
+    deleted = [id for id, trade in trades.items() if trade is None]
+    if deleted:
+        PPTTemplate.objects(document=account, row_id__in=deleted).delete()
+
+    new_templates = []
+    for trade_id in added:
+        template = generate_template(account, trade_id)
+        if account.template_mapping:
+            template = row_to_ppt_template(
+                account.template_mapping, template, trades[trade_id]
+            )
+        new_templates.append(template)
+    if new_templates:
+        PPTTemplate.objects.insert(new_templates, load_bulk=False)
+
+    updated = [
+        id for id, trade in trades.items() if trade is not None and id not in added
+    ]
+    if account.template_mapping and updated:
+        operations = []
+        for template in PPTTemplate.objects(document=account, row_id__in=updated):
+            template = row_to_ppt_template(
+                account.template_mapping, template, trades[template.row_id]
+            )
+            operations.append(ReplaceOne({"_id": template.id}, template.to_mongo()))
+        if operations:
+            PPTTemplate._get_collection().bulk_write(operations, ordered=False)
@@ -3,39 +3,47 @@ import json
 import math
 import os
 import re
+from functools import partial
 from io import StringIO
 
 import numpy as np
 import pandas as pd
 from app import app
+from app.constants.storage import STORAGE_MEMBERSHIP, STORAGE_TRADES
 from app.controllers.db_pipelines.template_pipelines import get_ppt_template_row
 from app.controllers.ErrorController import handle_403
-from app.controllers.FilterController import (
-    apply_filter,
-    filter_open_trades,
-    get_filter_options,
-)
+from app.controllers.FilterController import filter_open_trades, get_filter_options
 from app.controllers.GraphsController import get_bar, get_line, get_pie, get_scatter
 from app.controllers.RowController import update_default_row, update_ppt_row
 from app.controllers.utils import (
     from_db_to_df,
     from_df_to_db,
-    get_result_decorator,
     normalize_results,
     parse_column_name,
-    retrieve_filter_options,
+    select_columns,
 )
 from app.models.Document import Document
 from app.models.Filter import Filter
 from app.models.PPTTemplate import PPTTemplate
 from app.models.Setup import Setup
 from app.models.Template import Template
-from app.models.User import User
+from app.repositories.account_repository import AccountRepository
+from app.repositories.template_repository import TemplateRepository
+from app.repositories.version_repository import VersionRepository
+from app.services.evaluation_service import version_evaluator
+from app.services.filter_service import FilterMasks
+from app.services.propagation_service import RowsTask, propagation_queue
+from app.services.statistics_service import StatisticsService
 from app.utils.encoders import NpEncoder
+from app.utils.identity import get_owned, get_user_id
+from app.utils.references import get_reference_ids
 from bson import DBRef, ObjectId, json_util
 from flask import jsonify, request
 from flask.wrappers import Response
-from flask_jwt_extended import get_jwt_identity
+
+# Panels that can be requested together from the analytics endpoint
+ANALYTICS_PANELS = ["stats", "daily", "net", "cum", "calendar"]
+ANALYTICS_DEFAULT_PANELS = ["stats", "daily", "net", "cum"]
 
 
 # Encoder to deal with numpy Boolean values
@@ -52,32 +60,12 @@ def get_setups():
     """
     Retrieves All Setups for a given User
 
-    TODO: this query in the main one to be called by the app. It should be optimized as much
-    as possible. Here are some suggestions for small improvements.
-
-    https://stackoverflow.com/questions/16586180/typeerror-objectid-is-not-json-serializable (JSONEncoder)
-    https://stackoverflow.com/questions/30333299/pymongo-bson-convert-python-cursor-cursor-object-to-serializable-json-object
-    (using bsonjs)
+    Only the metadata of each Setup is returned. The state and the filter options of a
+    Setup are fetched on demand from its state endpoint (see get_setup_state), so
+    listing the setups does not move any trade over the wire.
     """
-    id = get_jwt_identity()
 
     pipeline = [
-        {
-            "$lookup": {
-                "from": Document._get_collection_name(),
-                "localField": "documentId",
-                "foreignField": "_id",
-                "as": "document",
-            },
-        },
-        {
-            "$lookup": {
-                "from": Template._get_collection_name(),
-                "localField": "document.template",
-                "foreignField": "_id",
-                "as": "template",
-            },
-        },
         {
             "$lookup": {
                 "from": Filter._get_collection_name(),
@@ -86,72 +74,77 @@ def get_setups():
                 "as": "filters",
             },
         },
+        {"$sort": {"documentId": -1}},
         {
-            "$addFields": {
+            "$project": {
+                "_id": 0,
+                "id": {"$toString": "$_id"},
+                "name": 1,
+                "notes": 1,
+                "default": 1,
+                "documentId": {"$toString": "$documentId"},
+                "date_created": {"$dateToString": {"date": "$date_created"}},
+                "synced": {
+                    "$eq": [{"$size": {"$ifNull": ["$pending_updates", []]}}, 0]
+                },
                 "filters": {
                     "$map": {
                         "input": "$filters",
                         "as": "filter",
                         "in": {
-                            "$mergeObjects": [
-                                "$$filter",
-                                {"id": {"$toString": "$$filter._id"}},
-                            ]
+                            "id": {"$toString": "$$filter._id"},
+                            "name": "$$filter.name",
                         },
                     }
-                }
-            }
-        },
-        {"$sort": {"document._id": -1}},
-        {
-            "$project": {
-                "_id": 1,
-                "name": 1,
-                "notes": 1,
-                "default": 1,
-                "template.name": 1,
-                "state": 1,
-                "date_created": {"$dateToString": {"date": "$date_created"}},
-                "document.state": 1,
-                "document._id": 1,
-                "filters.id": 1,
-                "filters.name": 1,
+                },
             }
         },
     ]
 
-    setups = Setup.objects(author=id["$oid"]).aggregate(pipeline)
-
+    setups = get_owned(Setup).aggregate(pipeline)
     setups = json.loads(json_util.dumps(setups))
 
-    df = None
-    document_id = None
+    # template names of the parent documents, without loading their state
+    document_ids = {ObjectId(setup["documentId"]) for setup in setups}
+    documents = Document._get_collection().find(
+        {"_id": {"$in": list(document_ids)}}, {"template": 1}
+    )
+    document_templates = {
+        str(document["_id"]): document.get("template") for document in documents
+    }
+    templates = Template._get_collection().find(
+        {
+            "_id": {
+                "$in": [
+                    template for template in document_templates.values() if template
+                ]
+            }
+        },
+        {"name": 1},
+    )
+    template_names = {template["_id"]: template["name"] for template in templates}
 
     for setup in setups:
+        template_id = document_templates.get(setup["documentId"])
+        setup["template"] = template_names.get(template_id)
 
-        setup["id"] = setup["_id"]["$oid"]
-        # setup["date_created"] = setup["date_created"].isoformat()
-        document = setup["document"][0]
-        setup["documentId"] = document["_id"]["$oid"]
-
-        if not setup["documentId"] == document_id or not isinstance(df, pd.DataFrame):
-            df = from_db_to_df(document["state"])
-            document_id = setup["documentId"]
-
-        setup["template"] = setup["template"][0]["name"] if setup["template"] else None
-        setup["options"] = retrieve_filter_options(df)
+    return jsonify(setups)
 
-        del setup["_id"]
-        del setup["document"]
 
-    return jsonify(setups)
+def get_setup_state(setup_id):
+    """
+    Retrieves the state of a Setup along with the filter options of its Document
+    """
+    setup = get_owned(Setup, id=setup_id).get()
+    response = json.loads(setup.to_json(VersionRepository.get_state(setup)))
+    response.update(options=get_filter_options(setup.documentId.id))
+    return Response(json.dumps(response), mimetype="application/json")
 
 
 def post_setup():
     """
     Creates A New Setup
     """
-    id = get_jwt_identity()
     document = request.json.get("document", None)
     name = request.json.get("name", None)
     if name == "":
@@ -161,36 +154,50 @@ def post_setup():
         return handle_403(msg="Document is not provided")
 
     # NOTE check that doucment exists
-    user = User.objects(id=id["$oid"]).get()
+    user_id = get_user_id()
     document = Document.objects(id=document).get()
     # save the setup to the DB
-    setup = Setup(
-        name=name, author=user, documentId=document, state=document.state, default=False
-    ).save()
+    state = AccountRepository.get_state(document.id, document.state, document.storage)
+    if document.storage == STORAGE_TRADES:
+        # versions of normalized accounts only keep the IDs of their rows
+        setup = Setup(
+            name=name,
+            author=user_id,
+            documentId=document,
+            state={"fields": state.get("fields", {})},
+            storage=STORAGE_MEMBERSHIP,
+            row_ids=sorted(state.get("data") or {}),
+            default=False,
+        ).save()
+    else:
+        setup = Setup(
+            name=name, author=user_id, documentId=document, state=state, default=False
+        ).save()
 
-    return Response(setup.to_json(), mimetype="application/json")
+    return Response(setup.to_json(state), mimetype="application/json")
 
 
 def put_setup(setup_id):
     """
     Renames A Setup
     """
-    id = get_jwt_identity()
     name = request.json.get("name", None)
     default = request.json.get("default", None)
     notes = request.json.get("notes", None)
-    user = User.objects(id=id["$oid"]).get()
-    setup = Setup.objects(id=setup_id, author=user).get()
+    user_id = get_user_id()
+    setup = VersionRepository.get_version(setup_id, user_id)
     setup.name = name if name else setup.name
     setup.notes = notes if notes != None else setup.notes
     if default:
-        Setup.objects(author=user, id__ne=setup_id, documentId=setup.documentId).update(
-            default=False
-        )
+        Setup.objects(
+            author=user_id, id__ne=setup_id, documentId=setup.documentId
+        ).update(default=False)
         setup.default = default
     setup.save()
-    response = setup.to_json()
-    response = json.loads(response)
+    response = json.loads(setup.to_json())
+    # the state is fetched from the state endpoint
+    response.pop("state", None)
+    response.pop("row_ids", None)
     # loads options and appends them to setup
     options = get_filter_options(setup.documentId.id)
     response.update(options=options)
@@ -203,13 +210,11 @@ def delete_setup(setup_id):
     """
     Delete one Setup
     """
-    id = get_jwt_identity()
-    user = User.objects(id=id["$oid"]).get()
+    user_id = get_user_id()
     # get setup
-    setup = Setup.objects(id=setup_id, author=user).get()
+    setup = VersionRepository.get_version(setup_id, user_id)
 
-    for filter in setup.filters:
-        filter.delete()
+    Filter.objects(id__in=get_reference_ids(setup, "filters")).delete()
     setup.delete()
     return jsonify({"msg": "Setup successfully deleted", "success": True})
 
@@ -219,9 +224,8 @@ def get_setup_row(document_id, row_id):
     NOTE: replace this at another location
     It takes in a document_id and row_id and returns the matching row object in JSON format.
     """
-    id = get_jwt_identity()
-    user = User.objects(id=id["$oid"]).get()
-    document = Document.objects(id=document_id).get()
+    user_id = get_user_id()
+    document = AccountRepository.get_account(document_id)
 
     if not document_id or not row_id:
         return {jsonify({"msg": "Something went wrong.", "success": False})}
@@ -231,7 +235,7 @@ def get_setup_row(document_id, row_id):
     if not row:
         # NOTE: make a funciton to create an empty one
         # NOTE: I do not know if this works tbh!!!
-        row = PPTTemplate(author=user, document=document, row_id=row_id).save()
+        row = PPTTemplate(author=user_id, document=document, row_id=row_id).save()
 
     # row.aggregate(pipeline2)
     try:
@@ -256,10 +260,10 @@ def put_setup_row(setup_id, row_id):
     # if sync is True then update the row on all Setups & Document
     is_sync = request.json.get("isSync", None)
     # setup = Setup.objects(id=setup_id).get()
-    document = Document.objects(id=setup_id).get()
+    document = AccountRepository.get_account(setup_id)
     if row_id == "undefined":
         return jsonify({"msg": "Something went wrong...", "success": False})
-    template_type = document.template.name
+    template_type = TemplateRepository.get_template_name(document)
     if template_type == "PPT":
         return update_ppt_row(document, row_id, row)
     else:
@@ -270,104 +274,23 @@ def get_statistics(setup_id):
     """
     Gets Setup Statistics
     """
-    id = get_jwt_identity()
-    user = User.objects(id=id["$oid"]).get()
-    setup = Setup.objects(author=user, id=setup_id).get()
-    data = from_db_to_df(setup.state)
-    result_columns = [col for col in data if re.match(r"col_[vpr]_", col)]
-    response = {}
-    count = {"stat": "Count"}
-    total = {"stat": "Total"}
-    mean = {"stat": "Mean"}
-    wins = {"stat": "Wins"}
-    losses = {"stat": "Losses"}
-    break_even = {"stat": "Break Even"}
-    win_rate = {"stat": "Win Rate"}
-    avg_win = {"stat": "Average Win"}
-    avg_loss = {"stat": "Average Loss"}
-    expectancy = {"stat": "Expectancy"}
-    max_consec_loss = {"stat": "Max. Consecutive Losses"}
-    max_win = {"stat": "Maximum Win"}
-    drawdown = {"stat": "Drawdown"}
-    for col in result_columns:
+    setup = VersionRepository.get_raw_version(setup_id, get_user_id())
+    data = VersionRepository.get_raw_dataframe(setup)
+    response = compute_statistics(data)
+    response = json.dumps(response, cls=NpEncoder)
+    return Response(response, mimetype="application/json")
 
-        column_decorator = get_result_decorator(col)
-
-        count[col] = 0
-        total[col] = 0
-        wins[col] = 0
-        losses[col] = 0
-        break_even[col] = 0
-        total_wins = 0
-        total_losses = 0
-        consecutive_losses = 0
-        current_losses = 0
-        for val in data[col]:
-            # TODO: add this when efficiently detecting misplaced values
-            # skip NaN values
-            # if pd.isna(val):
-            #     continue
-            count[col] += 1 if not np.isnan(val) else 0
-            total[col] += val if not np.isnan(val) else 0
-            if val > 0:
-                wins[col] += 1
-                total_wins += val
-                consecutive_losses = max(consecutive_losses, current_losses)
-                current_losses = 0
-            elif val < 0:
-                total_losses += val
-                losses[col] += 1
-                current_losses += 1
-            elif val == 0:
-                break_even[col] += 1
-                consecutive_losses = max(consecutive_losses, current_losses)
-                current_losses = 0
-        data["cumulative"] = data[col].cumsum().round(2)
-        data["high_value"] = data["cumulative"].cummax()
-        data["drawdown"] = data["cumulative"] - data["high_value"]
-        drawdown[col] = float(data["drawdown"].min())
-        mean[col] = total[col] / count[col] if count[col] else 0
-        win_rate[col] = wins[col] / count[col] if count[col] else 0
-        avg_win[col] = total_wins / wins[col] if wins[col] else 0
-        avg_loss[col] = total_losses / losses[col] if losses[col] else 0
-        expectancy[col] = (win_rate[col] * avg_win[col]) - (
-            (1 - win_rate[col]) * abs(avg_loss[col])
-        )
-        max_consec_loss[col] = max(consecutive_losses, current_losses)
-        max_win[col] = float(data[col].max())
-        response[col] = {
-            "count": count[col],
-            "drawdown": round(data["drawdown"].min(), 3)
-            if not math.isnan(data["drawdown"].min())
-            else None,
-            "total": round(total[col], 3),
-            "mean": round(mean[col], 3),  # bug here with nan
-            "wins": wins[col],
-            "losses": losses[col],
-            "breakEvens": break_even[col],
-            "win_rate": round(wins[col] / count[col], 4) if count[col] else 0,
-            "avg_win": round(total_wins / wins[col], 2) if wins[col] else 0,
-            "avg_loss": round(total_losses / losses[col], 2) if losses[col] else 0,
-            "expectancy": round(
-                (win_rate[col] * avg_win[col])
-                - ((1 - win_rate[col]) * abs(avg_loss[col])),
-                2,
-            ),
-            "max_consec_loss": max(consecutive_losses, current_losses),
-            "max_win": round(data[col].max(), 2)
-            if not math.isnan(data[col].max())
-            else None,
-            "profit_factor": round(total_wins / abs(total_losses), 2)
-            if total_losses
-            else round(total_wins, 2),
-        }
 
-    response = {
+def compute_statistics(df: pd.DataFrame) -> dict:
+    """
+    Computes the statistics of every result column of a setup
+    """
+    result_columns = [col for col in df if re.match(r"col_[vpr]_", col)]
+    response = StatisticsService().get_statistics(df, result_columns)
+    return {
         "data": response,
         "success": True,
     }
-    response = json.dumps(response, cls=NpEncoder)
-    return Response(response, mimetype="application/json")
 
 
 def get_graphics(setup_id):
@@ -376,10 +299,8 @@ def get_graphics(setup_id):
     NOTE: needs some rethinking - probably move to different file
     NOTE: think of a method for data sanitization to drop NaN values so it does not break
     """
-    id = get_jwt_identity()
-    user = User.objects(id=id["$oid"]).get()
-    setup = Setup.objects(author=user, id=setup_id).get()
-    data = from_db_to_df(setup.state)
+    setup = VersionRepository.get_raw_version(setup_id, get_user_id())
+    data = VersionRepository.get_raw_dataframe(setup)
 
     # data.dropna(inplace = True)
     result_names = [
@@ -408,10 +329,8 @@ def get_graphs(setup_id):
     """
     Gets Setups Graphs
     """
-    id = get_jwt_identity()
-    user = User.objects(id=id["$oid"]).get()
-    setup = Setup.objects(author=user, id=setup_id).get()
-    data = from_db_to_df(setup.state)
+    setup = VersionRepository.get_raw_version(setup_id, get_user_id())
+    data = VersionRepository.get_raw_dataframe(setup)
     # data.dropna(inplace = True)
     args = request.args
     type = args.get("type")
@@ -426,7 +345,7 @@ def get_graphs(setup_id):
 
     metric_columns = {
         k: v
-        for k, v in setup.state["fields"].items()
+        for k, v in VersionRepository.get_fields(setup).items()
         if k == "col_rr" or k == "col_p" or k.startswith("col_m_")
     }
 
@@ -445,45 +364,73 @@ def get_graphs(setup_id):
     return "Bad"
 
 
-def update_setups(
-    document_id,
-    document_df: pd.DataFrame,
-    document_fields=None,
-    wiht_fields=False,
-    remove_filters=False,
-) -> None:
+def update_setups_rows(document_id, row_ids) -> list:
+    """
+    Updates several rows of the setups state from parent state. The rows are read from
+    the account when this runs, so the setups always get its latest rows, and rows no
+    longer in the account are removed. They are evaluated against the filters of each
+    setup and only the matching setups keep them, so trade edits cost one update per
+    setup instead of re-filtering the whole state. The setups are evaluated and written
+    in batches with the version evaluator. Returns the IDs of the setups that failed to
+    update.
+    """
+    state = AccountRepository.get_partial_state(document_id, row_ids)
+    rows = {row_id: state["data"].get(row_id) for row_id in row_ids}
+
+    setups = VersionRepository.get_versions_by_account(document_id, rows=False)
+    data = {row_id: row for row_id, row in rows.items() if row is not None}
+
+    if data:
+        rows_df = from_db_to_df({"fields": state["fields"], "data": data})
+        data = from_df_to_db(rows_df)
+        masks = FilterMasks(rows_df)
+        filters = VersionRepository.get_filters(setups)
+
+    def evaluate(setup):
+        # rows that no longer pass the filters of the setup are removed from it
+        members = {row_id: None for row_id in rows}
+        if data:
+            matches = rows_df.index[masks.get_chain_mask(filters[setup.id])]
+            members.update({str(row_id): data[str(row_id)] for row_id in matches})
+        updates = VersionRepository.get_rows_update(setup.storage, members)
+        for update in updates:
+            update["$inc"] = {"state_version": 1}
+        return [(setup.id, update) for update in updates]
+
+    return version_evaluator.run(
+        setups, evaluate, VersionRepository.bulk_update_versions
+    )
+
+
+def propagate_setups_row(document_id, row_id) -> None:
     """
-    Updates the setups state from parent state
+    Queues the row on the propagation queue of the account, see propagate_setups_rows
     """
-    df = document_df
-    setups = Setup.objects(documentId=document_id)
+    propagate_setups_rows(document_id, [row_id])
 
-    for setup in setups:
-        filtered_df = df
-        if remove_filters:
-            setup.modify(__raw__={"$set": {"filters": []}})
-        else:
-            for filter in setup.filters:
-                filtered_df = apply_filter(
-                    filtered_df, filter.column, filter.operation, filter.value
-                )
-        data = from_df_to_db(filtered_df)
-        if wiht_fields:
-            setup.modify(
-                __raw__={"$set": {"state": {"fields": document_fields, "data": data}}}
-            )
-        else:
-            setup.modify(__raw__={"$set": {"state.data": data}})
+
+def propagate_setups_rows(document_id, row_ids) -> None:
+    """
+    Queues the written rows on the propagation queue of the account, so the request
+    returns once the account itself is written. The rows queued by a burst of edits are
+    merged and applied with a single update_setups_rows, which reads them from the
+    account at that point.
+    """
+    propagation_queue.submit(
+        document_id, RowsTask(partial(update_setups_rows, document_id), row_ids)
+    )
 
 
 def get_children(document_id):
-    setups = Setup.objects(documentId=document_id).order_by("-date_created")
+    setups = VersionRepository.get_versions_by_account(document_id, rows=False)
+    setups = setups.order_by("-date_created")
     return [
         {
             "id": str(setup.id),
             "name": setup.name,
             "date": setup.date_created,
             "isDefault": setup.default,
+            "isSynced": not setup.pending_updates,
         }
         for setup in setups
     ]
@@ -494,22 +441,25 @@ def get_daily_distribution(setup_id):
     """
     Get daily distribution for setup
     """
-    id = get_jwt_identity()
 
-    user = User.objects(id=id["$oid"]).get()
-    setup = Setup.objects(author=user, id=setup_id).get()
-    df = from_db_to_df(setup.state)
+    setup = VersionRepository.get_raw_version(setup_id, get_user_id())
+    df = VersionRepository.get_raw_dataframe(setup)
+    return jsonify(compute_daily_distribution(df))
+
+
+def compute_daily_distribution(df: pd.DataFrame) -> dict:
+    """
+    Computes the mean result of each weekday for every result column of a setup
+    """
     date_columns = [column for column in df.columns if re.match(r"col_d_", column)]
     result_columns = [
         column for column in df.columns if re.match(r"col_[vpr]_", column)
     ]
     if not date_columns or not result_columns:
-        return jsonify(
-            {
-                "success": False,
-                "message": "No date or result data found in this account.",
-            }
-        )
+        return {
+            "success": False,
+            "message": "No date or result data found in this account.",
+        }
 
     week_df = df.groupby(df[date_columns[0]].dt.day_name()).mean(numeric_only=True)
 
@@ -542,7 +492,7 @@ def get_daily_distribution(setup_id):
             weekday_mean[day] = mean
             result_column = parse_column_name(col)
         response[result_column] = weekday_mean
-    return jsonify({"success": True, "data": response})
+    return {"success": True, "data": response}
 
 
 # TODO: move this to its own route setup/id/stats/{stats_id}
@@ -551,30 +501,30 @@ def get_net_results(setup_id):
     Get net returns from a setup
     # TODO: might have to take in account order (for now it is not an issue)
     """
-    id = get_jwt_identity()
 
-    user = User.objects(id=id["$oid"]).get()
+    setup = VersionRepository.get_raw_version(setup_id, get_user_id())
+    columns = select_columns(VersionRepository.get_fields(setup), r"col_[vpr]_")
+    df = VersionRepository.get_raw_dataframe(setup, columns)
+    return jsonify(compute_net_results(df))
 
-    setup = Setup.objects(author=user, id=setup_id).get()
-    df = from_db_to_df(setup.state)
 
+def compute_net_results(df: pd.DataFrame) -> dict:
+    """
+    Computes the net returns of every result column of a setup
+    """
     result_columns = [
         column for column in df.columns if re.match(r"col_[vpr]_", column)
     ]
 
     # TODO: it should be able to adjustabble by metrics
     if not result_columns:
-        return jsonify(
-            {"success": False, "message": "No results data found in this account."}
-        )
+        return {"success": False, "message": "No results data found in this account."}
 
     data = {}
     for column in result_columns:
         data[column] = df[column].replace({np.nan: None}).tolist()
 
-    result = {"success": True, "labels": list(range(1, len(df.index))), "data": data}
-
-    return jsonify(result)
+    return {"success": True, "labels": list(range(1, len(df.index))), "data": data}
 
 
 # TODO: move this to its own route setup/id/stats/{stats_id}
@@ -584,60 +534,53 @@ def get_cumulative_results(setup_id):
     # TODO: might have to take in account order (for now it is not an issue)
     """
 
-    id = get_jwt_identity()
+    setup = VersionRepository.get_raw_version(setup_id, get_user_id())
+    columns = select_columns(VersionRepository.get_fields(setup), r"col_[vpr]_")
+    df = VersionRepository.get_raw_dataframe(setup, columns)
+    return jsonify(compute_cumulative_results(df))
 
-    user = User.objects(id=id["$oid"]).get()
-
-    setup = Setup.objects(author=user, id=setup_id).get()
-    df = from_db_to_df(setup.state)
 
+def compute_cumulative_results(df: pd.DataFrame) -> dict:
+    """
+    Computes the cumulative returns of every result column of a setup
+    """
     result_columns = [
         column for column in df.columns if re.match(r"col_[vpr]_", column)
     ]
 
     # TODO: it should be able to adjustabble by metrics
     if not result_columns:
-        return jsonify(
-            {"success": False, "message": "No results data found in this account."}
-        )
+        return {"success": False, "message": "No results data found in this account."}
 
     data = {}
     for column in result_columns:
         data[column] = df[column].cumsum().replace({np.nan: None}).tolist()
 
-    result = {
+    return {
         "success": True,
         "labels": list(range(1, len(df.index) + 1)),
         "data": data,
     }
 
-    return jsonify(result)
-
 
 # TODO: move this to its own route setup/id/stats/{stats_id}
 def get_bubble_results(setup_id):
     """
     ....
     """
-    id = get_jwt_identity()
-    user = User.objects(id=id["$oid"]).get()
-    setup = Setup.objects(author=user, id=setup_id).get()
+    setup = VersionRepository.get_raw_version(setup_id, get_user_id())
 
     args = request.args
     current_metric = args.get("currentMetric")
 
-    df = from_db_to_df(setup.state)
-    df.replace({np.nan: None}, inplace=True)
-
     data = []
+    fields = VersionRepository.get_fields(setup)
     metric_list = [
         col
-        for col, dtype in setup.state["fields"].items()
+        for col, dtype in fields.items()
         if col.startswith("col_m_") and (dtype == "int64" or dtype == "float64")
     ]
-    result_columns = [
-        column for column in df.columns if re.match(r"col_[vpr]_", column)
-    ]
+    result_columns = select_columns(fields, r"col_[vpr]_")
 
     if len(result_columns) == 0 or len(metric_list) == 0:
         return jsonify(
@@ -647,7 +590,7 @@ def get_bubble_results(setup_id):
             }
         )
 
-    if "col_rr" not in df.columns:
+    if "col_rr" not in fields:
         return jsonify(
             {
                 "success": False,
@@ -665,6 +608,11 @@ def get_bubble_results(setup_id):
     if metric_num == None:
         return "Bad"
 
+    df = VersionRepository.get_raw_dataframe(
+        setup, result_columns + [metric_num, "col_rr"]
+    )
+    df.replace({np.nan: None}, inplace=True)
+
     for res in result_columns:
         dataset = {
             "label": res[6:],
@@ -714,8 +662,8 @@ def get_calendar_table(setup_id):
     """
     metric = request.args.get("metric", None)
     date = request.args.get("date", None)
-    setup = Setup.objects(id=setup_id).get()
-    df = from_db_to_df(setup.state, orient="index")
+    setup = VersionRepository.get_raw_version(setup_id)
+    df = VersionRepository.get_raw_dataframe(setup)
     # TODO: combine both loops into a single
     metric_list = [col for col in df if re.match(r"col_[vpr]_", col)]
     # TODO: is it col_r or col_r_
@@ -748,7 +696,7 @@ def get_calendar_statistics(version_id) -> Response:
     Returns statistics on the version performance for the given month and year,
     with optional timezone offset adjustments.
     """
-    # TODO: refactor into a smaller function and create unit tests
+    # TODO: create unit tests
     metric_column = request.args.get("metric", None)
     date_column = request.args.get("date", None)
     calendar_month_year = request.args.get("monthYear")
@@ -758,26 +706,52 @@ def get_calendar_statistics(version_id) -> Response:
         return jsonify({"success": False, "msg": "Required parameters are missing."})
 
     try:
-        month, year = map(int, calendar_month_year.split("/"))
-    except ValueError:
-        return jsonify(
-            {"success": False, "msg": "Invalid monthYear format. Use MM/YYYY format."}
+        version = VersionRepository.get_raw_version(version_id)
+        columns = VersionRepository.get_fields(version).keys()
+        # only the metric and date are decoded, unknown ones are rejected below
+        df = VersionRepository.get_raw_dataframe(
+            version,
+            [column for column in columns if column in (metric_column, date_column)],
         )
-
-    try:
-        version = Setup.objects(id=version_id).get()
-        df = from_db_to_df(version.state, orient="index")
-        columns = version.state.get("fields").keys()
     except Exception as e:
         return jsonify({"success": False, "msg": str(e)})
 
+    response = compute_calendar_statistics(
+        df, columns, metric_column, date_column, calendar_month_year, timezone_offset
+    )
+    response_json = json.dumps(response, cls=NpEncoder)
+    return Response(response_json, mimetype="application/json")
+
+
+def compute_calendar_statistics(
+    df: pd.DataFrame,
+    columns,
+    metric_column,
+    date_column,
+    calendar_month_year,
+    timezone_offset=0,
+) -> dict:
+    """
+    Computes the statistics of a version for the given month and year and the change
+    from the previous month. The DataFrame is not modified.
+    """
+    if not all([metric_column, date_column, calendar_month_year]):
+        return {"success": False, "msg": "Required parameters are missing."}
+
+    try:
+        month, year = map(int, calendar_month_year.split("/"))
+    except ValueError:
+        return {
+            "success": False,
+            "msg": "Invalid monthYear format. Use MM/YYYY format.",
+        }
+
     if metric_column not in columns or date_column not in columns:
-        return jsonify({"success": False, "msg": "Invalid metric or date selected."})
+        return {"success": False, "msg": "Invalid metric or date selected."}
 
-    df[date_column] = pd.to_datetime(df[date_column]) + pd.Timedelta(
-        minutes=-timezone_offset
+    df = df.set_index(
+        pd.to_datetime(df[date_column]) + pd.Timedelta(minutes=-timezone_offset)
     )
-    df = df.set_index(date_column)
 
     current_df = df.loc[(df.index.month == month) & (df.index.year == year)]
     previous_month = month - 1 if month > 1 else 12
@@ -787,12 +761,10 @@ def get_calendar_statistics(version_id) -> Response:
     ]
 
     if current_df.empty:
-        return jsonify(
-            {
-                "success": False,
-                "msg": "No data available for the specified month and year.",
-            }
-        )
+        return {
+            "success": False,
+            "msg": "No data available for the specified month and year.",
+        }
 
     def calculate_metrics(data, result_column=None):
         round_decimals = 2
@@ -848,12 +820,52 @@ def get_calendar_statistics(version_id) -> Response:
         ),
     }
 
-    response = {
+    return {
         "current": current_stats,
         "previous": previous_stats_changes,
         "success": True,
     }
 
+
+def get_analytics(setup_id) -> Response:
+    """
+    Returns several statistics panels of a setup in a single request. The panels are
+    chosen with the include argument (e.g. include=stats,daily,net,cum) and all of
+    them are computed from a single read and decode of the setup state. The calendar
+    panel takes the same arguments as the calendar statistics endpoint.
+    """
+    setup = VersionRepository.get_raw_version(setup_id, get_user_id())
+
+    include = request.args.get("include", ",".join(ANALYTICS_DEFAULT_PANELS))
+    panels = [panel.strip() for panel in include.split(",") if panel.strip()]
+    invalid_panels = [panel for panel in panels if panel not in ANALYTICS_PANELS]
+    if invalid_panels:
+        return jsonify(
+            {"success": False, "msg": f"Invalid panels: {', '.join(invalid_panels)}."}
+        )
+
+    df = VersionRepository.get_raw_dataframe(setup)
+
+    response = {"success": True}
+    for panel in panels:
+        if panel == "stats":
+            response[panel] = compute_statistics(df)
+        elif panel == "daily":
+            response[panel] = compute_daily_distribution(df)
+        elif panel == "net":
+            response[panel] = compute_net_results(df)
+        elif panel == "cum":
+            response[panel] = compute_cumulative_results(df)
+        elif panel == "calendar":
+            response[panel] = compute_calendar_statistics(
+                df,
+                VersionRepository.get_fields(setup).keys(),
+                request.args.get("metric", None),
+                request.args.get("date", None),
+                request.args.get("monthYear"),
+                request.args.get("offset", default=0, type=int),
+            )
+
     response_json = json.dumps(response, cls=NpEncoder)
     return Response(response_json, mimetype="application/json")
 
@@ -897,7 +909,7 @@ def get_open_trades(version_id) -> Response:
     column_type = account.state["fields"].get(column)
 
     # Convert the database state to a DataFrame once to avoid redundant conversions.
-    df = from_db_to_df(version.state)
+    df = VersionRepository.get_dataframe(version)
 
     try:
         # Filter the DataFrame based on the open trades criteria.
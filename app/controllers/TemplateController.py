@@ -1,9 +1,9 @@
 import re
 
 from app.controllers.utils import from_db_to_df, parse_column_name, parse_column_type
-from app.models.Document import Document
 from app.models.PPTTemplate import EntryPosition, PPTTemplate, TakeProfit
-from app.models.Template import Template
+from app.repositories.account_repository import AccountRepository
+from app.repositories.template_repository import TemplateRepository
 from flask import jsonify, request
 
 
@@ -79,8 +79,8 @@ def assing_template_to_document(document_id, template_id):
     """
     mappings = request.json.get("mappings", None)
 
-    document = Document.objects(id=document_id).get()
-    template = Template.objects(id=template_id).get()
+    document = AccountRepository.get_account(document_id)
+    template = TemplateRepository.get_template_by_id(template_id)
 
     document.template = template
 
@@ -97,7 +97,8 @@ def assing_template_to_document(document_id, template_id):
     # if mappings then perform the preliminary mapping (fetch)
     # TODO: problem if the account is empty
     if is_mappings:
-        fetch_template_mappings(document, document.author, document.state, mappings)
+        state, _ = AccountRepository.get_raw_state(document.id)
+        fetch_template_mappings(document, document.author, state, mappings)
 
     return jsonify(
         {
@@ -109,7 +110,7 @@ def assing_template_to_document(document_id, template_id):
 
 def get_template_mapping(document_id):
     """Get a breakdown of column types and names to act as a template mapping helper"""
-    document = Document.objects(id=document_id).get()
+    document = AccountRepository.get_account(document_id)
 
     columns = document.state["fields"]
 
@@ -1,27 +1,46 @@
+import logging
 import uuid
 
-from app.controllers.RowController import add_template, delete_template, put_template
-from app.controllers.SetupController import update_setups
-from app.controllers.utils import from_db_to_df, validation_pipeline
+from app.controllers.RowController import (
+    add_template,
+    delete_template,
+    put_template,
+    sync_templates,
+)
+from app.controllers.SetupController import propagate_setups_row, propagate_setups_rows
+from app.controllers.utils import validation_pipeline
 from app.models.Document import Document
+from app.repositories.account_repository import AccountRepository
+from app.repositories.template_repository import TemplateRepository
+from app.utils.identity import get_user_id
 from flask import jsonify, request
 
 
+def get_trade(account_id, trade_id):
+    try:
+        trade = AccountRepository.get_trade(account_id, trade_id, get_user_id())
+    except Document.DoesNotExist:
+        return jsonify({"msg": "Account not found.", "success": False})
+
+    if trade is None:
+        return jsonify({"msg": "Trade not found.", "success": False})
+
+    trade["rowId"] = trade_id
+    return jsonify({"trade": trade, "success": True})
+
+
 def delete_trade(account_id, trade_id):
-    account = Document.objects(id=account_id).get()
+    account = AccountRepository.get_account(account_id)
     try:
-        account.modify(__raw__={"$unset": {f"state.data.{trade_id}": 1}})
+        AccountRepository.delete_trade(account, trade_id)
     except Exception as err:
         return jsonify({"msg": "Something went wrong.", "success": False})
 
-    if account.template:
-        template_name = account.template.name
-        if template_name == "PPT":
-            delete_template(account, trade_id)
+    if TemplateRepository.get_template_name(account) == "PPT":
+        delete_template(account, trade_id)
 
     try:
-        document_df = from_db_to_df(account.state)
-        update_setups(account.id, document_df)
+        propagate_setups_row(account.id, trade_id)
     except Exception as err:
         print("Something went wrong:", err)
         return jsonify({"msg": "Something went wrong. Try again!", "success": False})
@@ -30,22 +49,19 @@ def delete_trade(account_id, trade_id):
 
 
 def post_trade(account_id):
-    account = Document.objects(id=account_id).get()
+    account = AccountRepository.get_account(account_id)
     trade_id = uuid.uuid4().hex
     trade = {"note": "", "imgs": ""}
 
     try:
-        account.modify(__raw__={"$set": {f"state.data.{trade_id}": trade}})
-        if account.template:
-            template_name = account.template.name
-            if template_name == "PPT":
-                add_template(account, trade_id)
+        AccountRepository.set_trade(account, trade_id, trade)
+        if TemplateRepository.get_template_name(account) == "PPT":
+            add_template(account, trade_id)
     except Exception as err:
         return jsonify({"msg": "Something went wrong.", "success": False})
 
     try:
-        document_df = from_db_to_df(account.state)
-        update_setups(account.id, document_df)
+        propagate_setups_row(account.id, trade_id)
     except Exception as err:
         print("Something went wrong:", err)
         return jsonify({"msg": "Something went wrong. Try again!", "success": False})
@@ -58,7 +74,7 @@ def post_trade(account_id):
 
 
 def put_trade(account_id, trade_id):
-    account = Document.objects(id=account_id).get()
+    account = AccountRepository.get_account(account_id)
 
     trade = request.json.get("trade", None)
     try:
@@ -66,22 +82,88 @@ def put_trade(account_id, trade_id):
 
         trade.pop("rowId", None)
 
-        account.modify(__raw__={"$set": {f"state.data.{trade_id}": trade}})
+        AccountRepository.set_trade(account, trade_id, trade)
 
-        if account.template:
-            template_name = account.template.name
-            if template_name == "PPT":
-                # TODO: handle PPT update (currently only mapping fields)
-                put_template(account, trade_id, trade)
+        if TemplateRepository.get_template_name(account) == "PPT":
+            # TODO: handle PPT update (currently only mapping fields)
+            put_template(account, trade_id, trade)
 
     except Exception as err:
         return jsonify({"msg": "Something went wrong.", "success": False})
 
     try:
-        document_df = from_db_to_df(account.state)
-        update_setups(account.id, document_df)
+        propagate_setups_row(account.id, trade_id)
     except Exception as err:
         print("Something went wrong:", err)
         return jsonify({"msg": "Something went wrong. Try again!", "success": False})
 
-    return jsonify({"msg": "Trade updated successfully!", "success": True})
+    trade["rowId"] = trade_id
+    return jsonify(
+        {"msg": "Trade updated successfully!", "success": True, "trade": trade}
+    )
+
+
+def patch_trades(account_id):
+    """
+    Applies a list of operations to the trades of the account, e.g.
+    [{"op": "add", "trade": {...}}, {"op": "update", "rowId": ..., "trade": {...}},
+    {"op": "delete", "rowId": ...}]. They are written with a single update of the
+    account and propagated to its setups once.
+    """
+    account = AccountRepository.get_account(account_id)
+    operations = request.json.get("operations", None)
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"msg": "No operations to apply.", "success": False})
+
+    # final state of every trade touched, in order, with None for deleted trades
+    trades, added = {}, []
+    try:
+        for operation in operations:
+            op = operation.get("op")
+            if op == "add":
+                trade_id = uuid.uuid4().hex
+                trade = operation.get("trade") or {"note": "", "imgs": ""}
+                added.append(trade_id)
+            elif op == "update" and operation.get("rowId") and operation.get("trade"):
+                trade_id = operation["rowId"]
+                trade = operation["trade"]
+            elif op == "delete" and operation.get("rowId"):
+                trade_id = operation["rowId"]
+                trade = None
+            else:
+                return jsonify({"msg": "Invalid operation.", "success": False})
+
+            if trade is not None:
+                trade = validation_pipeline(dict(trade))
+                trade.pop("rowId", None)
+            trades[trade_id] = trade
+    except Exception as err:
+        return jsonify({"msg": "Invalid operation.", "success": False})
+
+    try:
+        AccountRepository.set_trades(account, trades)
+        if TemplateRepository.get_template_name(account) == "PPT":
+            sync_templates(account, trades, added)
+    except Exception as err:
+        return jsonify({"msg": "Something went wrong.", "success": False})
+
+    try:
+        propagate_setups_rows(account.id, list(trades))
+    except Exception as err:
+        logging.error(f"Failed to update setups on {account_id}. Error: {err}")
+        return jsonify({"msg": "Something went wrong. Try again!", "success": False})
+
+    return jsonify(
+        {
+            "msg": "Trades updated successfully!",
+            "success": True,
+            "trades": [
+                {**trade, "rowId": trade_id}
+                for trade_id, trade in trades.items()
+                if trade is not None
+            ],
+            "deleted": [
+                trade_id for trade_id, trade in trades.items() if trade is None
+            ],
+        }
+    )
@@ -2,9 +2,10 @@ import json
 import logging
 
 from app.controllers.ErrorController import handle_401, handle_403
-from app.models.Template import Template
 from app.models.User import User
-from app.models.UserSettings import UserSettings
+from app.repositories.template_repository import TemplateRepository
+from app.repositories.user_settings_repository import UserSettingsRepository
+from app.utils.identity import get_user, get_user_id
 from bson import json_util
 from flask import jsonify, request
 from flask_jwt_extended import (
@@ -19,15 +20,9 @@ from werkzeug.security import check_password_hash, generate_password_hash
 
 
 def get_user_details():
-    id = get_jwt_identity()
-    user = User.objects(id=id["$oid"]).get()
-
-    user_settings = UserSettings.objects(user=user)
+    user = get_user()
 
-    if not user_settings:
-        user_settings = UserSettings(user=user).save()
-    else:
-        user_settings = user_settings.get()
+    user_settings = UserSettingsRepository.get_user_settings(user.id)
 
     templates = user_settings.get_templates()
 
@@ -35,9 +30,11 @@ def get_user_details():
 
     template_ids = [str(template.id) for template in user_settings.templates]
 
-    market_templates = Template.objects().filter(id__not__in=template_ids).to_json()
-
-    market_templates = json.loads(market_templates)
+    market_templates = [
+        json.loads(template.to_json())
+        for template in TemplateRepository.get_templates()
+        if str(template.id) not in template_ids
+    ]
 
     for template in market_templates:
         template["id"] = template["_id"]["$oid"]
@@ -56,15 +53,9 @@ def get_user_details():
 
 def post_user_template(templateId):
     """Add a Template to a User"""
-    id = get_jwt_identity()
-    user = User.objects(id=id["$oid"]).get()
-    template_to_add = Template.objects(id=templateId).get()
-
-    user_settings = UserSettings.objects(user=user)
-    if not user_settings:
-        user_settings = UserSettings(user=user).save()
+    template_to_add = TemplateRepository.get_template_by_id(templateId)
 
-    user_settings.update(add_to_set__templates=template_to_add)
+    UserSettingsRepository.add_template(get_user_id(), template_to_add)
 
     return {"success": True, "msg": "Template added successfully."}
 
@@ -100,7 +91,7 @@ def signup():
     # Receiving data
     email = request.json.get("email", None)
     password = request.json.get("password", None)
-    default_template = Template.objects(name="Default").get()
+    default_template = TemplateRepository.get_template()
     if email and password:
         hashed_password = generate_password_hash(password)
         user = User(email=email, password=hashed_password)
@@ -109,7 +100,7 @@ def signup():
         try:
             user = user.save()
             # setup user settings
-            UserSettings(user=user, templates=[default_template]).save()
+            UserSettingsRepository.create_user_settings(user, [default_template])
 
             user_id = json.loads(json_util.dumps(user.id))
             access_token = create_access_token(identity=user_id)
@@ -133,11 +124,10 @@ def signup():
 
 def update_password():
     """Update password"""
-    id = get_jwt_identity()
     password = request.json.get("password", None)
     hashed_password = generate_password_hash(password)
 
-    User.objects(id=id["$oid"]).update(password=hashed_password)
+    User.objects(id=get_user_id()).update(password=hashed_password)
     return {"success": True, "msg": "Password updated successfully."}
 
 
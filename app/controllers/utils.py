@@ -1,7 +1,8 @@
 import json
+import math
 import re
 import uuid
-from datetime import date, datetime
+from datetime import date, datetime, timezone
 from io import StringIO
 
 import numpy as np
@@ -11,6 +12,7 @@ from app.constants.columns import (
     EXACT_STRING_COLUMNS,
     NON_EXACT_FLOAT_COLUMNS,
 )
+from app.utils.cache import state_cache
 
 TEMPLATE_PPT_POSITIONS = ["size", "order_type", "risk_reward", "price", "risk"]
 TEMPLATE_PPT_TAKE_PROFIT = "take_profit"
@@ -92,37 +94,182 @@ def parse_column_type(column_type):
         return str(column_type)
 
 
-def from_db_to_df(state, orient="index"):
+def _decode_column(values, dtype):
+    """
+    Builds a Series from the raw values of a column, parsing them to the dtype stored in
+    the state fields. Unknown dtypes are left for pandas to infer.
+    """
+    if dtype and dtype.startswith("datetime64"):
+        return pd.to_datetime(
+            pd.Series(values, dtype="object"), utc=True, errors="coerce"
+        )
+    if dtype in ("float64", "float"):
+        return pd.to_numeric(pd.Series(values, dtype="object"), errors="coerce").astype(
+            "float64"
+        )
+    if dtype in ("int64", "int"):
+        return pd.to_numeric(pd.Series(values, dtype="object"), errors="coerce")
+    if not values:
+        return pd.Series(values, dtype="bool" if dtype == "bool" else "object")
+    return pd.Series(values)
+
+
+def select_columns(fields, *patterns) -> list:
+    """
+    Returns the columns of the state fields that match any of the regex patterns (e.g.
+    r"col_[vpr]_" or r"col_d_"), in field order.
+    """
+    return [
+        column
+        for column in fields
+        if any(re.match(pattern, column) for pattern in patterns)
+    ]
+
+
+def from_db_to_df(state, orient="index", columns=None):
     """
     This methods converts a table from the database into a dataframe. It takes an
     orientation as an optional parameter which defaults to "index".
+
+    Rows are read straight from the state dict column by column and each column is parsed
+    to the dtype stored in the state fields. Row IDs are kept as the index. When a list
+    of columns is given only those are decoded (see select_columns).
     """
-    parsed_state = json.dumps(state["data"], default=json_serial)
-    # get columns that have to be parsed to datetime
-    date_columns = [
-        column_name
-        for column_name, dtype in state.get("fields").items()
-        if dtype.startswith("datetime64")
-    ]
-    # I personally do not like having StringIO because I don't understand why is it necessary
-    # although it doesn't work without it. Root problem from imgs being [] in json.
-    return pd.read_json(
-        StringIO(parsed_state), orient=orient, convert_dates=date_columns
+    if orient != "index":
+        parsed_state = json.dumps(state["data"], default=json_serial)
+        return pd.read_json(StringIO(parsed_state), orient=orient)
+
+    data = state.get("data") or {}
+    fields = state.get("fields") or {}
+
+    if columns is not None:
+        columns = list(columns)
+    else:
+        # columns declared in fields go first, followed by any key only found in rows
+        columns = list(fields.keys())
+        known_columns = set(columns)
+        for row in data.values():
+            for column in row:
+                if column not in known_columns:
+                    known_columns.add(column)
+                    columns.append(column)
+
+    rows = list(data.values())
+    df = pd.DataFrame(
+        {
+            column: _decode_column(
+                [row.get(column) for row in rows], fields.get(column)
+            ).array
+            for column in columns
+        },
+        index=pd.Index(list(data.keys()), dtype="object"),
+        columns=columns,
     )
+    return df
+
+
+def get_cache_key(owner_id, columns=None):
+    """
+    Returns the key of a decoded state in the process cache. States decoded with a
+    selection of columns are kept apart from the full ones.
+    """
+    if columns is None:
+        return owner_id
+    return f"{owner_id}:{'|'.join(columns)}"
+
+
+def from_db_to_df_cached(state, owner_id, state_version=0, columns=None):
+    """
+    Same as from_db_to_df but keeps the decoded DataFrame in the process cache, keyed by
+    the Document/Setup ID and its state version. A copy is returned on every call.
+    """
+    key = get_cache_key(owner_id, columns)
+    df = state_cache.get(key, state_version or 0)
+    if df is None:
+        df = from_db_to_df(state, columns=columns)
+        state_cache.put(key, state_version or 0, df)
+        df = df.copy()
+    return df
+
+
+def _encode_datetime(value):
+    """
+    Formats a datetime in ISO format with second precision. Timezone aware values are
+    stored in UTC with a trailing Z.
+    """
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return value.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _encode_value(value):
+    """
+    Converts a single cell into a value that can be stored in the database.
+    """
+    if value is None or value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, datetime):
+        return _encode_datetime(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_encode_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _encode_value(item) for key, item in value.items()}
+    return value
+
+
+def _encode_column(series):
+    """
+    Converts a column into a list of values that can be stored in the database.
+    """
+    dtype = series.dtype
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        if getattr(dtype, "tz", None) is not None:
+            values = series.dt.tz_convert("UTC").dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+        else:
+            values = series.dt.strftime("%Y-%m-%dT%H:%M:%S")
+        return values.astype("object").where(series.notna(), None).tolist()
+    if pd.api.types.is_float_dtype(dtype) and isinstance(dtype, np.dtype):
+        values = series.to_numpy()
+        encoded = values.astype("object")
+        encoded[~np.isfinite(values)] = None
+        return encoded.tolist()
+    if (
+        pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_bool_dtype(dtype)
+    ) and isinstance(dtype, np.dtype):
+        return series.tolist()
+    return [_encode_value(value) for value in series.astype("object")]
 
 
 def from_df_to_db(df, add_index=False):
     """
     This methods converts a dataframe into a table to store in the database.
+
+    Rows are written straight into a dict keyed by row ID: dates become ISO strings,
+    missing values become None and lists (e.g. imgs) are kept as they are.
     """
     if add_index:
         new_index = pd.Series([uuid.uuid4().hex for _ in range(len(df))])
         df.set_index(new_index, inplace=True)
 
-    data = df.to_json(orient="index", date_format="iso", date_unit="s")
-    data = json.loads(data)
+    if not df.index.is_unique:
+        raise ValueError("DataFrame index must be unique to be stored.")
+
+    columns = [str(column) for column in df.columns]
+    if not columns:
+        return {str(row_id): {} for row_id in df.index}
+
+    values = [_encode_column(df.iloc[:, i]) for i in range(len(columns))]
+    data = {
+        str(row_id): dict(zip(columns, row))
+        for row_id, row in zip(df.index, zip(*values))
+    }
 
-    # return {"fields": df.dtypes.apply(lambda x: x.name).to_dict(), "data": data}
     return data
 
 
@@ -172,57 +319,6 @@ def row_to_ppt_template(mappings, template, row):
     return template
 
 
-def retrieve_filter_options(data: pd.DataFrame):
-    """
-    Accepts a DataFrame object from a Setup or Document and returns an array with the options to filter
-    """
-    options = []
-
-    map_types = data.dtypes
-    options = []
-    for column in data.columns:
-        if column.startswith("col_m_"):
-            option = {"id": column, "name": column[6:]}
-            if map_types[column] == "float64" or map_types[column] == "int64":
-                option.update(type="number")
-            else:
-                option.update(type="string")
-                option.update(values=list(data[column].dropna().unique()))
-            options.append(option)
-        if column == "col_p":
-            option = {
-                "id": column,
-                "name": "Pair",
-                "type": "string",
-                "values": list(data[column].dropna().unique().astype(str)),
-            }
-            options.append(option)
-        if column == "col_rr":
-            option = {
-                "id": column,
-                "name": "Risk Reward",
-                "type": "number",
-            }
-            options.append(option)
-        if column.startswith("col_d_"):
-            option = {
-                "id": column,
-                "name": column[6:],
-                "type": "date",
-            }
-            options.append(option)
-        if column == "col_d":
-            option = {
-                "id": column,
-                "name": "Direction",
-                "type": "string",
-                "values": ["Long", "Short"],
-            }
-            options.append(option)
-    options = json.loads(json.dumps(options, cls=CustomJSONizer))
-    return options
-
-
 def validation_pipeline(data):
     """
     This helper function validates and sanitizes the data before returning it
@@ -1,6 +1,7 @@
 from datetime import datetime
 from enum import Enum
 
+from app.constants.storage import STORAGE_EMBEDDED
 from app.models.Template import Template
 from app.models.User import User
 from mongoengine.document import DynamicDocument, EmbeddedDocument
@@ -10,6 +11,7 @@ from mongoengine.fields import (
     EmbeddedDocumentField,
     EnumField,
     FloatField,
+    IntField,
     ListField,
     ReferenceField,
     StringField,
@@ -40,6 +42,10 @@ class Document(DynamicDocument):
     template = ReferenceField(Template)
     template_mapping = DictField()
     state = DictField()
+    state_version = IntField(default=0)
+    storage = StringField(default=STORAGE_EMBEDDED)
+    # distinct values and numeric ranges of the filterable columns, empty until built
+    filter_index = DictField()
     balance = FloatField(default=0.0, min=0.0)
     account_currency = EnumField(Currency, defaul=Currency.USD)
     open_conditions = ListField(EmbeddedDocumentField(TradeCondition))
@@ -66,6 +72,6 @@ class Document(DynamicDocument):
 
     meta = {
         "collection": "documents",
-        "indexes": ["name"],
+        "indexes": ["name", {"fields": ["author", "name"]}],
         "ordering": ["-date_created"],
     }
@@ -144,4 +144,5 @@ class PPTTemplate(DynamicDocument):
     meta = {
         "collection": "ppttemplate",
         "ordering": ["-date_created"],
+        "indexes": [{"fields": ["document", "row_id"]}],
     }
@@ -3,7 +3,8 @@ from datetime import datetime
 from io import StringIO
 
 import pandas as pd
-from app.controllers.utils import from_db_to_df
+from app.constants.storage import STORAGE_EMBEDDED
+from app.controllers.utils import from_db_to_df_cached
 from app.models.Document import Document
 from app.models.Filter import Filter
 from app.models.User import User
@@ -13,6 +14,7 @@ from mongoengine.fields import (
     BooleanField,
     DateTimeField,
     DictField,
+    IntField,
     ListField,
     ReferenceField,
     StringField,
@@ -24,13 +26,28 @@ class Setup(DynamicDocument):
     default = BooleanField()
     filters = ListField(ReferenceField(Filter), default=[])
     state = DictField()
+    state_version = IntField(default=0)
+    storage = StringField(default=STORAGE_EMBEDDED)
+    # IDs of the account rows in the version, in no particular order, used by
+    # STORAGE_MEMBERSHIP
+    row_ids = ListField(StringField())
+    # tokens of the account writes not propagated to the version yet
+    pending_updates = ListField(StringField())
     notes = StringField(default="")
     author = ReferenceField(User)
     documentId = ReferenceField(Document, reverse_delete_rule="CASCADE")
     date_created = DateTimeField(default=datetime.utcnow)
 
-    def to_json(self):
+    def to_json(self, state=None, filters=None):
+        """
+        Filters already loaded for the setup (see VersionRepository.get_filters) can be
+        passed so they are not dereferenced again
+        """
         data = self.to_mongo()
+        if state is not None:
+            # state with rows resolved from the account (see STORAGE_MEMBERSHIP)
+            data["state"] = state
+            data.pop("row_ids", None)
         # rename key ID and Document ID
         data["id"] = str(self.id)
         data["documentId"] = str(self.documentId.id)
@@ -38,20 +55,23 @@ class Setup(DynamicDocument):
         del data["_id"]
 
         # gets the Filter data instead of just the ID
-        for i in range(len(data["filters"])):
-            data["filters"][i] = {
-                "id": str(self.filters[i].id),
-                "name": self.filters[i].name,
-            }
+        if filters is None:
+            filters = self.filters
+        data["filters"] = [
+            {"id": str(filter.id), "name": filter.name} for filter in filters
+        ]
         return dumps(data)
 
-    def setup_compare(self, metric):
-        df = from_db_to_df(self.state)
+    def setup_compare(self, metric, df=None, filters=None):
+        if filters is None:
+            filters = self.filters
+        if df is None:
+            df = from_db_to_df_cached(self.state, self.id, self.state_version)
         setup_compare = {
             "id": str(self.id),
             "name": self.name,
             "date_created": self.date_created.isoformat(),
-            "filters": [str(filter.name) for filter in self.filters],
+            "filters": [str(filter.name) for filter in filters],
             "stats": {
                 "data": [
                     ["Average", float(round(df[metric].mean(), 2))],
@@ -76,6 +96,8 @@ class Setup(DynamicDocument):
         "indexes": [
             "author",
             "#author",
+            # versions of an account, e.g. when a trade is propagated to them
+            {"fields": ["documentId", "-date_created"]},
         ],
     }
 
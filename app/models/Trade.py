@@ -0,0 +1,20 @@
+from app.models.Document import Document
+from mongoengine import CASCADE
+from mongoengine.document import DynamicDocument
+from mongoengine.fields import DictField, ReferenceField, StringField
+
+
+class Trade(DynamicDocument):
+    """
+    A single row of an account stored in its own document. Used by the accounts whose
+    storage is STORAGE_TRADES instead of the state.data dict of the Document.
+    """
+
+    account = ReferenceField(Document, reverse_delete_rule=CASCADE, required=True)
+    row_id = StringField(required=True)
+    data = DictField()
+
+    meta = {
+        "collection": "trades",
+        "indexes": [{"fields": ["account", "row_id"], "unique": True}],
+    }
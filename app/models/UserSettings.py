@@ -28,4 +28,4 @@ class UserSettings(DynamicDocument):
 
         return json.loads(dumps(templates))
 
-    meta = {"collection": "usersettings"}
+    meta = {"collection": "usersettings", "indexes": ["user"]}
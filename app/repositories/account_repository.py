@@ -0,0 +1,372 @@
+import pandas as pd
+from app.constants.storage import STORAGE_EMBEDDED, STORAGE_TRADES
+from app.controllers.utils import from_db_to_df, get_cache_key
+from app.models.Document import Document
+from app.repositories.trade_repository import TradeRepository
+from app.utils.cache import state_cache
+from app.utils.column_migrations import get_increment
+from app.utils.filter_index import (
+    build_filter_index,
+    get_filter_index_rows_update,
+    get_filter_index_update,
+    get_filter_options,
+    replaces_indexed_value,
+)
+from app.utils.raw_bson import decode_raw, find_one_state, get_raw_collection
+from bson import ObjectId
+
+
+class AccountRepository:
+    """
+    Reads and writes the trades of an account (Document) wherever they are stored:
+    embedded in state.data or in the trades collection. The fields always stay in
+    state.fields and every write bumps the state version of the account.
+
+    Writes also keep the filter index of the account up to date. Written values are
+    added to it in the same update, while deleting a trade drops the index so it is
+    rebuilt on the next read.
+    """
+
+    @staticmethod
+    def get_state(account_id, state, storage=None, columns=None) -> dict:
+        if storage != STORAGE_TRADES:
+            return state
+        return {
+            "fields": state.get("fields", {}),
+            "data": TradeRepository.get_trades(account_id, columns),
+        }
+
+    @staticmethod
+    def get_dataframe(
+        account_id, state, state_version=0, storage=None, columns=None
+    ) -> pd.DataFrame:
+        """
+        Returns the decoded state of the account, going through the process cache so
+        the trades are only read on a cache miss. A copy is returned on every call.
+        Passing columns only decodes those.
+        """
+        key = get_cache_key(account_id, columns)
+        df = state_cache.get(key, state_version or 0)
+        if df is None:
+            state = AccountRepository.get_state(account_id, state, storage, columns)
+            df = from_db_to_df(state, columns=columns)
+            state_cache.put(key, state_version or 0, df)
+            df = df.copy()
+        return df
+
+    @staticmethod
+    def get_raw_dataframe(account_id, columns=None) -> pd.DataFrame:
+        """
+        Same as get_dataframe but reads the account straight from pymongo, so no
+        mongoengine document is built. Its state is only read on a cache miss, and
+        decoded in a single pass. Raises Document.DoesNotExist if it is not found.
+        """
+        collection = get_raw_collection(Document)
+        account = collection.find_one(
+            {"_id": ObjectId(account_id)}, {"state_version": 1, "storage": 1}
+        )
+        if account is None:
+            raise Document.DoesNotExist("Document matching query does not exist.")
+
+        key = get_cache_key(account["_id"], columns)
+        df = state_cache.get(key, account.get("state_version") or 0)
+        if df is not None:
+            return df
+
+        state, state_version = AccountRepository.get_raw_state(account["_id"], columns)
+        df = from_db_to_df(state, columns=columns)
+        state_cache.put(key, state_version, df)
+        return df.copy()
+
+    @staticmethod
+    def get_state_version(account_id) -> int:
+        """
+        Returns the state version of the account. Raises Document.DoesNotExist if it is
+        not found.
+        """
+        account = get_raw_collection(Document).find_one(
+            {"_id": ObjectId(account_id)}, {"state_version": 1}
+        )
+        if account is None:
+            raise Document.DoesNotExist("Document matching query does not exist.")
+        return account.get("state_version") or 0
+
+    @staticmethod
+    def get_raw_state(account_id, columns=None):
+        """
+        Reads the state of the account straight from pymongo and decodes it in a single
+        pass. Passing columns only reads those. Returns the state and the state version
+        it was read at.
+        """
+        account = decode_raw(
+            find_one_state(
+                get_raw_collection(Document),
+                {"_id": ObjectId(account_id)},
+                {"state": 1, "storage": 1, "state_version": 1},
+                columns,
+            )
+        )
+        if account is None:
+            raise Document.DoesNotExist("Document matching query does not exist.")
+        state = AccountRepository.get_state(
+            account["_id"], account.get("state") or {}, account.get("storage"), columns
+        )
+        return state, account.get("state_version") or 0
+
+    @staticmethod
+    def get_account(account_id, author=None):
+        """
+        Returns the account without its trades, to read or change its metadata. The
+        fields stay in state.fields and saving it only writes the changed fields.
+        """
+        accounts = Document.objects(id=account_id)
+        if author is not None:
+            accounts = accounts.filter(author=author)
+        return accounts.exclude("state.data").get()
+
+    @staticmethod
+    def get_trade(account_id, row_id, author_id=None):
+        """
+        Returns a single trade of the account, or None if it does not exist. Only that
+        row is read and decoded. Raises Document.DoesNotExist if the account is not found.
+        """
+        query = {"_id": ObjectId(account_id)}
+        if author_id is not None:
+            query["author"] = ObjectId(author_id)
+        account = get_raw_collection(Document).find_one(
+            query, {"storage": 1, f"state.data.{row_id}": 1}
+        )
+        if account is None:
+            raise Document.DoesNotExist("Document matching query does not exist.")
+        account = decode_raw(account)
+        if account.get("storage") == STORAGE_TRADES:
+            return TradeRepository.get_trade(account["_id"], row_id)
+        return ((account.get("state") or {}).get("data") or {}).get(row_id)
+
+    @staticmethod
+    def get_rows(account_id, row_ids) -> dict:
+        """
+        Returns the trades of the account with the given row IDs, by row ID. Only those
+        rows are read.
+        """
+        return AccountRepository.get_partial_state(account_id, row_ids)["data"]
+
+    @staticmethod
+    def get_partial_state(account_id, row_ids) -> dict:
+        """
+        Returns the state of the account with only the trades with the given row IDs.
+        Trades that do not exist are left out. Raises Document.DoesNotExist if the
+        account is not found.
+        """
+        row_ids = list(row_ids)
+        projection = {"storage": 1, "state.fields": 1}
+        projection.update({f"state.data.{row_id}": 1 for row_id in row_ids})
+        account = get_raw_collection(Document).find_one(
+            {"_id": ObjectId(account_id)}, projection
+        )
+        if account is None:
+            raise Document.DoesNotExist("Document matching query does not exist.")
+        account = decode_raw(account)
+        state = account.get("state") or {}
+        data = dict(state.get("data") or {})
+        if account.get("storage") == STORAGE_TRADES and row_ids:
+            data = TradeRepository.get_trades(account["_id"], row_ids=row_ids)
+        return {"fields": state.get("fields") or {}, "data": data}
+
+    @staticmethod
+    def get_index_update(account, rows: dict, partial=False) -> dict:
+        """
+        Returns the update that adds the written rows, by row ID, to the filter index.
+        It must be worked out before the rows are written: when a row changes or
+        removes an indexed value the index is dropped instead, as the old value cannot
+        be taken out of it. A partial row only holds the columns being written.
+        """
+        if not account.filter_index:
+            # the index is built from scratch on the next read
+            return {}
+        fields = account.state.get("fields", {})
+        old_rows = AccountRepository.get_rows(account.id, list(rows))
+        for row_id, row in rows.items():
+            if replaces_indexed_value(fields, old_rows.get(row_id), row, partial):
+                return {"$unset": {"filter_index": 1}}
+        if len(rows) == 1:
+            return get_filter_index_update(fields, next(iter(rows.values())))
+        return get_filter_index_rows_update(fields, list(rows.values()))
+
+    @staticmethod
+    def set_trade(account, row_id, row) -> None:
+        index_update = AccountRepository.get_index_update(account, {row_id: row})
+        if account.storage == STORAGE_TRADES:
+            TradeRepository.set_trade(account.id, row_id, row)
+            update = {"$inc": {"state_version": 1}}
+        else:
+            update = {
+                "$set": {f"state.data.{row_id}": row},
+                "$inc": {"state_version": 1},
+            }
+        update.update(index_update)
+        Document.objects(id=account.id).update_one(__raw__=update)
+
+    @staticmethod
+    def set_trades(account, rows: dict) -> None:
+        """
+        Sets several trades of the account, given as {row_id: row} with None for the
+        trades to delete, with a single update of the account
+        """
+        added = {row_id: row for row_id, row in rows.items() if row is not None}
+        removed = [row_id for row_id, row in rows.items() if row is None]
+        index_update = {}
+        if not removed and added:
+            index_update = AccountRepository.get_index_update(account, added)
+
+        update = {"$inc": {"state_version": 1}}
+        if account.storage == STORAGE_TRADES:
+            TradeRepository.write_trades(account.id, rows)
+        else:
+            if added:
+                update["$set"] = {
+                    f"state.data.{row_id}": row for row_id, row in added.items()
+                }
+            if removed:
+                update["$unset"] = {f"state.data.{row_id}": 1 for row_id in removed}
+
+        if removed:
+            # the index is built from scratch on the next read
+            update.setdefault("$unset", {})["filter_index"] = 1
+        update.update(index_update)
+        Document.objects(id=account.id).update_one(__raw__=update)
+
+    @staticmethod
+    def update_trade_fields(account, row_id, values: dict) -> None:
+        index_update = AccountRepository.get_index_update(
+            account, {row_id: values}, partial=True
+        )
+        if account.storage == STORAGE_TRADES:
+            TradeRepository.update_trade_fields(account.id, row_id, values)
+            update = {"$inc": {"state_version": 1}}
+        else:
+            update = {
+                "$set": {
+                    f"state.data.{row_id}.{key}": value for key, value in values.items()
+                },
+                "$inc": {"state_version": 1},
+            }
+        update.update(index_update)
+        Document.objects(id=account.id).update_one(__raw__=update)
+
+    @staticmethod
+    def delete_trade(account, row_id) -> None:
+        if account.storage == STORAGE_TRADES:
+            TradeRepository.delete_trade(account.id, row_id)
+            update = {"$unset": {"filter_index": 1}, "$inc": {"state_version": 1}}
+        else:
+            update = {
+                "$unset": {f"state.data.{row_id}": 1, "filter_index": 1},
+                "$inc": {"state_version": 1},
+            }
+        Document.objects(id=account.id).update_one(__raw__=update)
+
+    @staticmethod
+    def set_state(account, fields, data) -> None:
+        index = build_filter_index(fields, data)
+        if account.storage == STORAGE_TRADES:
+            TradeRepository.replace_trades(account.id, data)
+            update = {
+                "$set": {"state.fields": fields, "filter_index": index},
+                "$inc": {"state_version": 1},
+            }
+        else:
+            update = {
+                "$set": {
+                    "state": {"fields": fields, "data": data},
+                    "filter_index": index,
+                },
+                "$inc": {"state_version": 1},
+            }
+        Document.objects(id=account.id).update_one(__raw__=update)
+
+    @staticmethod
+    def migrate_columns(account, fields, migration) -> None:
+        """
+        Applies a ColumnMigration to the trades of the account with update pipelines,
+        so they are not read, and sets its new fields. The filter index is dropped and
+        rebuilt on the next read.
+        """
+        update = {
+            "state.fields": {"$literal": fields},
+            "state_version": get_increment("state_version"),
+        }
+        if account.storage == STORAGE_TRADES:
+            TradeRepository.migrate_trades(account.id, migration)
+        else:
+            update["state.data"] = migration.get_rows_expression("$state.data")
+        Document.objects(id=account.id).update_one(
+            __raw__=[{"$set": update}, {"$project": {"filter_index": 0}}]
+        )
+
+    @staticmethod
+    def get_filter_options(account_id) -> list:
+        """
+        Returns the filter options of the account. Only its fields and filter index are
+        read, the trades are only read when the index has to be built.
+        """
+        account = Document._get_collection().find_one(
+            {"_id": ObjectId(account_id)}, {"state.fields": 1, "filter_index": 1}
+        )
+        if account is None:
+            raise Document.DoesNotExist("Document matching query does not exist.")
+        index = account.get("filter_index")
+        if not index:
+            index = AccountRepository.rebuild_filter_index(account_id)
+        return get_filter_options(account.get("state", {}).get("fields", {}), index)
+
+    @staticmethod
+    def rebuild_filter_index(account_id) -> dict:
+        """
+        Builds the filter index of the account from its trades and stores it, unless
+        the account was written meanwhile, as the index would then miss that write
+        """
+        account = Document.objects(id=account_id).get()
+        state = AccountRepository.get_state(account.id, account.state, account.storage)
+        index = build_filter_index(state.get("fields", {}), state.get("data") or {})
+        Document.objects(id=account.id, state_version=account.state_version).update_one(
+            __raw__={"$set": {"filter_index": index}}
+        )
+        return index
+
+    @staticmethod
+    def delete_trades(account) -> None:
+        if account.storage == STORAGE_TRADES:
+            TradeRepository.delete_trades(account.id)
+
+    @staticmethod
+    def move_to_trades(account) -> bool:
+        """
+        Moves the embedded trades of the account to the trades collection. Returns False
+        if the account already uses it. The account must not be written meanwhile.
+        """
+        if account.storage == STORAGE_TRADES:
+            return False
+        TradeRepository.replace_trades(account.id, account.state.get("data") or {})
+        Document.objects(id=account.id).update_one(
+            __raw__={
+                "$set": {"storage": STORAGE_TRADES},
+                "$unset": {"state.data": 1},
+            }
+        )
+        return True
+
+    @staticmethod
+    def move_to_embedded(account) -> bool:
+        """
+        Moves the trades of the account back into its state.data dict. Returns False if
+        the account already embeds them.
+        """
+        if account.storage != STORAGE_TRADES:
+            return False
+        data = TradeRepository.get_trades(account.id)
+        Document.objects(id=account.id).update_one(
+            __raw__={"$set": {"storage": STORAGE_EMBEDDED, "state.data": data}}
+        )
+        TradeRepository.delete_trades(account.id)
+        return True
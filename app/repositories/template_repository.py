@@ -1,7 +1,46 @@
 from app.models.Template import Template
+from app.utils.cache import template_cache
+from app.utils.references import get_reference_id
 
 
 class TemplateRepository:
+    """
+    Templates are reference data the app never writes, so they are served from the
+    process cache by name and by ID. The returned templates are shared and must not be
+    modified.
+    """
+
     @staticmethod
     def get_template(name: str = "Default") -> Template:
-        return Template.objects(name=name).first()
+        return template_cache.get_or_load(
+            ("name", name), lambda: Template.objects(name=name).first()
+        )
+
+    @staticmethod
+    def get_template_by_id(template_id) -> Template:
+        """
+        Raises Template.DoesNotExist if it is not found
+        """
+        key = ("id", str(template_id))
+        template = template_cache.get(key)
+        if template is None:
+            template = Template.objects(id=template_id).get()
+            template_cache.put(key, template)
+        return template
+
+    @staticmethod
+    def get_templates() -> list:
+        return template_cache.get_or_load("all", lambda: list(Template.objects()))
+
+    @staticmethod
+    def get_template_name(document):
+        """
+        Returns the name of the template of a Document, or None if it has none. The
+        reference is resolved through the cache instead of dereferencing it.
+        """
+        template = document._data.get("template")
+        if template is None:
+            return None
+        if isinstance(template, Template):
+            return template.name
+        return TemplateRepository.get_template_by_id(get_reference_id(template)).name
@@ -0,0 +1,117 @@
+from app.models.Trade import Trade
+from bson import ObjectId
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+
+
+class TradeRepository:
+    """
+    Access to the trades collection. Queries go straight through pymongo so rows are
+    never hydrated into mongoengine objects. Trades are returned in insertion order,
+    which matches the order of the rows in an embedded state.
+    """
+
+    @staticmethod
+    def get_trades(account_id, columns=None, row_ids=None) -> dict:
+        """
+        Returns the rows of the account by row ID. Passing columns only reads those,
+        and passing row_ids only reads those rows.
+        """
+        projection = {"_id": 0, "row_id": 1}
+        if columns is None:
+            projection["data"] = 1
+        else:
+            projection.update({f"data.{column}": 1 for column in columns})
+        query = {"account": ObjectId(account_id)}
+        if row_ids is not None:
+            query["row_id"] = {"$in": list(row_ids)}
+        cursor = Trade._get_collection().find(query, projection).sort("_id", 1)
+        return {trade["row_id"]: trade.get("data", {}) for trade in cursor}
+
+    @staticmethod
+    def count_trades(account_id) -> int:
+        return Trade._get_collection().count_documents(
+            {"account": ObjectId(account_id)}
+        )
+
+    @staticmethod
+    def get_trade(account_id, row_id):
+        trade = Trade._get_collection().find_one(
+            {"account": ObjectId(account_id), "row_id": row_id}, {"_id": 0, "data": 1}
+        )
+        return trade.get("data", {}) if trade else None
+
+    @staticmethod
+    def set_trade(account_id, row_id, data) -> None:
+        Trade._get_collection().update_one(
+            {"account": ObjectId(account_id), "row_id": row_id},
+            {"$set": {"data": data}},
+            upsert=True,
+        )
+
+    @staticmethod
+    def update_trade_fields(account_id, row_id, values: dict) -> None:
+        Trade._get_collection().update_one(
+            {"account": ObjectId(account_id), "row_id": row_id},
+            {"$set": {f"data.{key}": value for key, value in values.items()}},
+        )
+
+    @staticmethod
+    def delete_trade(account_id, row_id) -> None:
+        Trade._get_collection().delete_one(
+            {"account": ObjectId(account_id), "row_id": row_id}
+        )
+
+    @staticmethod
+    def write_trades(account_id, rows: dict) -> None:
+        """
+        Sets or, for the rows that are None, deletes several trades of the account in a
+        single bulk write
+        """
+        account_id = ObjectId(account_id)
+        operations = [
+            DeleteOne({"account": account_id, "row_id": row_id})
+            if row is None
+            else UpdateOne(
+                {"account": account_id, "row_id": row_id},
+                {"$set": {"data": row}},
+                upsert=True,
+            )
+            for row_id, row in rows.items()
+        ]
+        if operations:
+            Trade._get_collection().bulk_write(operations, ordered=False)
+
+    @staticmethod
+    def migrate_trades(account_id, migration) -> None:
+        """
+        Applies a ColumnMigration to every trade of the account, inside MongoDB
+        """
+        Trade._get_collection().update_many(
+            {"account": ObjectId(account_id)},
+            [{"$set": {"data": migration.get_row_expression("$data")}}],
+        )
+
+    @staticmethod
+    def delete_trades(account_id) -> None:
+        Trade._get_collection().delete_many({"account": ObjectId(account_id)})
+
+    @staticmethod
+    def replace_trades(account_id, data: dict) -> None:
+        """
+        Makes data the trades of the account. The rows are upserted first and only then
+        the trades no longer in data are deleted, so a write that fails halfway never
+        leaves the account without its trades. Existing trades keep their position.
+        """
+        account_id = ObjectId(account_id)
+        collection = Trade._get_collection()
+        operations = [
+            ReplaceOne(
+                {"account": account_id, "row_id": row_id},
+                {"account": account_id, "row_id": row_id, "data": row},
+                upsert=True,
+            )
+            for row_id, row in data.items()
+        ]
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+        collection.delete_many({"account": account_id, "row_id": {"$nin": list(data)}})
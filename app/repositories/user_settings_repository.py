@@ -0,0 +1,36 @@
+from app.models.UserSettings import UserSettings
+from app.utils.cache import user_settings_cache
+
+
+class UserSettingsRepository:
+    """
+    The settings of each user are served from the process cache, which is invalidated
+    whenever this process writes them.
+    """
+
+    @staticmethod
+    def get_user_settings(user_id) -> UserSettings:
+        """
+        Returns the settings of the user, creating them if they do not exist
+        """
+        key = str(user_id)
+        user_settings = user_settings_cache.get(key)
+        if user_settings is None:
+            user_settings = UserSettings.objects(user=user_id).first()
+            if user_settings is None:
+                user_settings = UserSettings(user=user_id).save()
+            user_settings_cache.put(key, user_settings)
+        return user_settings
+
+    @staticmethod
+    def create_user_settings(user, templates: list) -> UserSettings:
+        user_settings = UserSettings(user=user, templates=templates).save()
+        user_settings_cache.put(str(user.id), user_settings)
+        return user_settings
+
+    @staticmethod
+    def add_template(user_id, template) -> None:
+        UserSettings.objects(user=user_id).update_one(
+            add_to_set__templates=template, upsert=True
+        )
+        user_settings_cache.invalidate(str(user_id))
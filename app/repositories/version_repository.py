@@ -1,4 +1,23 @@
+import logging
+
+import pandas as pd
+from app.constants.storage import STORAGE_EMBEDDED, STORAGE_MEMBERSHIP
+from app.controllers.utils import (
+    from_db_to_df,
+    from_db_to_df_cached,
+    from_df_to_db,
+    get_cache_key,
+)
+from app.models.Filter import Filter
 from app.models.Setup import Setup
+from app.repositories.account_repository import AccountRepository
+from app.utils.cache import state_cache
+from app.utils.column_migrations import get_increment
+from app.utils.raw_bson import decode_raw, find_one_state, get_raw_collection
+from app.utils.references import get_reference_ids
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
 
 class VersionRepository:
@@ -13,13 +32,341 @@ class VersionRepository:
         ).save()
 
     @staticmethod
-    def get_versions_by_account(account_id):
-        return Setup.objects(documentId=account_id)
+    def get_versions_by_account(account_id, rows=True):
+        versions = Setup.objects(documentId=account_id)
+        if not rows:
+            versions = versions.exclude("state.data", "row_ids")
+        return versions
+
+    @staticmethod
+    def get_version(version_id, author=None):
+        """
+        Returns the version without its rows, to read or change its metadata. The fields
+        stay in state.fields and saving it only writes the changed fields.
+        """
+        versions = Setup.objects(id=version_id)
+        if author is not None:
+            versions = versions.filter(author=author)
+        return versions.exclude("state.data", "row_ids").get()
+
+    @staticmethod
+    def get_filters(versions) -> dict:
+        """
+        Returns the filters of each version by version ID, in the order they were added.
+        The filters of all the versions are loaded in a single $in query instead of
+        dereferencing them one version at a time.
+        """
+        filter_ids = {
+            version.id: get_reference_ids(version, "filters") for version in versions
+        }
+        ids = {id for version_ids in filter_ids.values() for id in version_ids}
+        filters = Filter.objects.in_bulk(list(ids)) if ids else {}
+        return {
+            version_id: [filters[id] for id in version_ids if id in filters]
+            for version_id, version_ids in filter_ids.items()
+        }
 
     @staticmethod
     def remove_version_filter(version, filter) -> None:
         version.modify(pull__filters=filter.pk)
 
     @staticmethod
-    def update_version_state(version, data, fields) -> None:
-        version.modify(__raw__={"$set": {"state": {"fields": fields, "data": data}}})
+    def bulk_update_versions(updates) -> list:
+        """
+        Sends the updates of several versions in a single unordered bulk write. Takes a
+        list of (version_id, update) pairs and returns the IDs of the versions that
+        failed to update.
+        """
+        if not updates:
+            return []
+
+        operations = [UpdateOne({"_id": id}, update) for id, update in updates]
+        try:
+            Setup._get_collection().bulk_write(operations, ordered=False)
+        except BulkWriteError as error:
+            failed_ids = []
+            for write_error in error.details.get("writeErrors", []):
+                version_id = updates[write_error["index"]][0]
+                logging.error(
+                    f"Failed to update version {version_id}: {write_error.get('errmsg')}"
+                )
+                failed_ids.append(version_id)
+            return failed_ids
+        return []
+
+    @staticmethod
+    def get_state_update(storage, df: pd.DataFrame, fields=None) -> dict:
+        """
+        Returns the $set that stores the rows of the DataFrame as the state of a version
+        with the given storage. Membership versions only keep the row IDs, so the rows
+        are not encoded for them.
+        """
+        if storage == STORAGE_MEMBERSHIP:
+            update = {"row_ids": sorted(str(row_id) for row_id in df.index)}
+            if fields is not None:
+                update["state.fields"] = fields
+            return update
+        data = from_df_to_db(df)
+        if fields is not None:
+            return {"state": {"fields": fields, "data": data}}
+        return {"state.data": data}
+
+    @staticmethod
+    def get_columns_update(storage, fields, migration) -> list:
+        """
+        Returns the update pipeline that applies a ColumnMigration to a version with the
+        given storage and sets its new fields. Membership versions only store the
+        fields.
+        """
+        update = {
+            "state.fields": {"$literal": fields},
+            "state_version": get_increment("state_version"),
+        }
+        if storage != STORAGE_MEMBERSHIP:
+            update["state.data"] = migration.get_rows_expression("$state.data")
+        return [{"$set": update}]
+
+    @staticmethod
+    def get_row_update(storage, row_id, row=None) -> dict:
+        """
+        Returns the update that adds or, when no row is given, removes a single row
+        from a version with the given storage.
+        """
+        if storage == STORAGE_MEMBERSHIP:
+            if row is None:
+                return {"$pull": {"row_ids": row_id}}
+            return {"$addToSet": {"row_ids": row_id}}
+        if row is None:
+            return {"$unset": {f"state.data.{row_id}": 1}}
+        return {"$set": {f"state.data.{row_id}": row}}
+
+    @staticmethod
+    def get_rows_update(storage, rows: dict) -> list:
+        """
+        Same as get_row_update for several rows, as {row_id: row} with None for the rows
+        to remove. Returns the list of updates to apply, as membership versions cannot
+        add to and pull from row_ids in the same update.
+        """
+        added = {row_id: row for row_id, row in rows.items() if row is not None}
+        removed = [row_id for row_id, row in rows.items() if row is None]
+        if storage == STORAGE_MEMBERSHIP:
+            updates = []
+            if added:
+                updates.append({"$addToSet": {"row_ids": {"$each": list(added)}}})
+            if removed:
+                updates.append({"$pull": {"row_ids": {"$in": removed}}})
+            return updates
+        update = {}
+        if added:
+            update["$set"] = {
+                f"state.data.{row_id}": row for row_id, row in added.items()
+            }
+        if removed:
+            update["$unset"] = {f"state.data.{row_id}": 1 for row_id in removed}
+        return [update] if update else []
+
+    @staticmethod
+    def update_versions_row(account_id, row_id, values: dict) -> None:
+        """
+        Sets values of a row (e.g. {"state.data.<row_id>.note": note}) in every version
+        of the account that embeds its rows. Membership versions read the row from the
+        account, so only their state version is bumped.
+        """
+        Setup.objects(documentId=account_id, storage__ne=STORAGE_MEMBERSHIP).update(
+            __raw__={"$set": values, "$inc": {"state_version": 1}}
+        )
+        Setup.objects(documentId=account_id, storage=STORAGE_MEMBERSHIP).update(
+            __raw__={"$inc": {"state_version": 1}}
+        )
+
+    @staticmethod
+    def add_pending_update(account_id, token: str) -> None:
+        """
+        Marks every version of the account as waiting for the write with the token
+        """
+        Setup.objects(documentId=account_id).update(
+            __raw__={"$addToSet": {"pending_updates": token}}
+        )
+
+    @staticmethod
+    def get_pending_updates(account_ids=None) -> dict:
+        """
+        Returns the tokens of the writes not propagated yet, by account ID, for the
+        accounts with any
+        """
+        versions = Setup.objects(pending_updates__0__exists=True)
+        if account_ids:
+            versions = versions.filter(documentId__in=account_ids)
+        pending = {}
+        for version in versions.only("documentId", "pending_updates").as_pymongo():
+            tokens = pending.setdefault(version["documentId"], [])
+            tokens += [t for t in version["pending_updates"] if t not in tokens]
+        return pending
+
+    @staticmethod
+    def remove_pending_updates(account_id, tokens: list, failed_ids=None) -> None:
+        """
+        Marks the writes with the tokens as applied to the versions of the account,
+        except to the versions that failed to update
+        """
+        Setup.objects(documentId=account_id, id__nin=failed_ids or []).update(
+            __raw__={"$pull": {"pending_updates": {"$in": tokens}}}
+        )
+
+    @staticmethod
+    def resolve_state(state, row_ids, account_state) -> dict:
+        """
+        Returns a state with the rows of the account listed in row_ids, in account order
+        """
+        members = set(row_ids or [])
+        account_data = account_state.get("data") or {}
+        return {
+            "fields": state.get("fields", {}),
+            "data": {
+                row_id: row for row_id, row in account_data.items() if row_id in members
+            },
+        }
+
+    @staticmethod
+    def get_state(version) -> dict:
+        if version.storage != STORAGE_MEMBERSHIP:
+            return version.state
+        account = version.documentId
+        account_state = AccountRepository.get_state(
+            account.id, account.state, account.storage
+        )
+        return VersionRepository.resolve_state(
+            version.state, version.row_ids, account_state
+        )
+
+    @staticmethod
+    def get_dataframe(version, columns=None) -> pd.DataFrame:
+        """
+        Returns the decoded state of the version, going through the process cache. Rows
+        of membership versions are taken from the decoded state of the account, so they
+        are cached for both state versions. Passing columns only decodes those.
+        """
+        if version.storage != STORAGE_MEMBERSHIP:
+            return from_db_to_df_cached(
+                version.state, version.id, version.state_version, columns
+            )
+
+        account = version.documentId
+        key = get_cache_key(version.id, columns)
+        state_version = (version.state_version or 0, account.state_version or 0)
+        df = state_cache.get(key, state_version)
+        if df is None:
+            account_df = AccountRepository.get_dataframe(
+                account.id,
+                account.state,
+                account.state_version,
+                account.storage,
+                columns,
+            )
+            df = account_df[account_df.index.isin(version.row_ids or [])]
+            state_cache.put(key, state_version, df)
+            df = df.copy()
+        return df
+
+    @staticmethod
+    def get_raw_version(version_id, author_id=None):
+        """
+        Reads a version straight from pymongo as a RawBSONDocument, without its rows, so
+        no mongoengine document is built. Raises Setup.DoesNotExist if it is not found.
+        """
+        query = {"_id": ObjectId(version_id)}
+        if author_id is not None:
+            query["author"] = ObjectId(author_id)
+        version = get_raw_collection(Setup).find_one(
+            query, {"state.data": 0, "row_ids": 0}
+        )
+        if version is None:
+            raise Setup.DoesNotExist("Setup matching query does not exist.")
+        return version
+
+    @staticmethod
+    def get_fields(version) -> dict:
+        """
+        Returns the fields of a version read with get_raw_version
+        """
+        return decode_raw(version.get("state") or {}).get("fields") or {}
+
+    @staticmethod
+    def get_raw_dataframe(version, columns=None) -> pd.DataFrame:
+        """
+        Same as get_dataframe for a version read with get_raw_version. Its rows are only
+        read on a cache miss, and decoded in a single pass.
+        """
+        key = get_cache_key(version["_id"], columns)
+        membership = version.get("storage") == STORAGE_MEMBERSHIP
+        state_version = version.get("state_version") or 0
+        if membership:
+            account_version = AccountRepository.get_state_version(version["documentId"])
+            state_version = (state_version, account_version)
+        df = state_cache.get(key, state_version)
+        if df is not None:
+            return df
+
+        collection = get_raw_collection(Setup)
+        if membership:
+            members = decode_raw(
+                collection.find_one(
+                    {"_id": version["_id"]}, {"row_ids": 1, "state_version": 1}
+                )
+            )
+            account_df = AccountRepository.get_raw_dataframe(
+                version["documentId"], columns
+            )
+            df = account_df[account_df.index.isin(members.get("row_ids") or [])]
+            state_version = (members.get("state_version") or 0, account_version)
+        else:
+            members = decode_raw(
+                find_one_state(
+                    collection,
+                    {"_id": version["_id"]},
+                    {"state": 1, "state_version": 1},
+                    columns,
+                )
+            )
+            df = from_db_to_df(members.get("state") or {}, columns=columns)
+            state_version = members.get("state_version") or 0
+
+        # tagged with the version the rows were read at
+        state_cache.put(key, state_version, df)
+        return df.copy()
+
+    @staticmethod
+    def move_to_membership(version) -> bool:
+        """
+        Replaces the embedded rows of the version by their IDs. Returns False if the
+        version already uses membership.
+        """
+        if version.storage == STORAGE_MEMBERSHIP:
+            return False
+        row_ids = sorted((version.state or {}).get("data") or {})
+        version.update(
+            __raw__={
+                "$set": {"storage": STORAGE_MEMBERSHIP, "row_ids": row_ids},
+                "$unset": {"state.data": 1},
+                "$inc": {"state_version": 1},
+            }
+        )
+        return True
+
+    @staticmethod
+    def move_to_embedded(version) -> bool:
+        """
+        Stores a copy of the rows of the version again. Returns False if the version
+        already embeds them.
+        """
+        if version.storage != STORAGE_MEMBERSHIP:
+            return False
+        data = from_df_to_db(VersionRepository.get_dataframe(version))
+        version.update(
+            __raw__={
+                "$set": {"storage": STORAGE_EMBEDDED, "state.data": data},
+                "$unset": {"row_ids": 1},
+                "$inc": {"state_version": 1},
+            }
+        )
+        return True
@@ -1,6 +1,7 @@
 from app.controllers.PDFController import get_file
 from app.controllers.SetupController import (
     delete_setup,
+    get_analytics,
     get_bubble_results,
     get_calendar_statistics,
     get_calendar_table,
@@ -11,6 +12,7 @@ from app.controllers.SetupController import (
     get_net_results,
     get_open_trades,
     get_setup_row,
+    get_setup_state,
     get_setups,
     get_statistics,
     post_setup,
@@ -28,10 +30,12 @@ setup_bp.route("", methods=["POST"])(jwt_required()(post_setup))
 
 setup_bp.route("/<setup_id>", methods=["PUT"])(jwt_required()(put_setup))
 setup_bp.route("/<setup_id>", methods=["DELETE"])(jwt_required()(delete_setup))
+setup_bp.route("/<setup_id>/state", methods=["GET"])(jwt_required()(get_setup_state))
 
 # TODO: renmae this to report
 setup_bp.route("/<setup_id>/file", methods=["GET"])(jwt_required()(get_file))
 setup_bp.route("/<setup_id>/stats", methods=["GET"])(jwt_required()(get_statistics))
+setup_bp.route("/<setup_id>/analytics", methods=["GET"])(jwt_required()(get_analytics))
 
 # TODO: move this to another route or orgnaise better
 setup_bp.route("/<setup_id>/charts", methods=["GET"])(jwt_required()(get_graphics))
@@ -1,4 +1,10 @@
-from app.controllers.TradeController import delete_trade, post_trade, put_trade
+from app.controllers.TradeController import (
+    delete_trade,
+    get_trade,
+    patch_trades,
+    post_trade,
+    put_trade,
+)
 from flask import Blueprint
 from flask_jwt_extended import jwt_required
 
@@ -8,6 +14,10 @@ trade_bp = Blueprint("trade_bp", __name__)
 
 trade_bp.route("", methods=["POST"])(jwt_required()(post_trade))
 
+trade_bp.route("", methods=["PATCH"])(jwt_required()(patch_trades))
+
+trade_bp.route("/<trade_id>", methods=["GET"])(jwt_required()(get_trade))
+
 trade_bp.route("/<trade_id>", methods=["DELETE"])(jwt_required()(delete_trade))
 
 trade_bp.route("/<trade_id>", methods=["PUT"])(jwt_required()(put_trade))
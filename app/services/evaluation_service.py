@@ -0,0 +1,64 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Threads that evaluate the versions of an account in parallel. With 1 the versions are
+# evaluated one after the other, on the calling thread. Encoding the state of a version
+# is Python work that holds the GIL, so more threads only help once filtering dominates
+# (see the benchmark-versions command).
+EVALUATION_WORKERS = int(os.getenv("EVALUATION_WORKERS", 1))
+
+# Number of evaluated versions sent in each bulk write
+EVALUATION_BATCH_SIZE = int(os.getenv("EVALUATION_BATCH_SIZE", 16))
+
+
+class VersionEvaluator:
+    """
+    Evaluates the versions of an account (filtering and encoding their new state) on a
+    bounded thread pool, shared by every propagation. Updates are written in batches as
+    soon as they are ready, so the writes of the first versions overlap with the
+    evaluation of the rest.
+    """
+
+    def __init__(
+        self, workers: int = EVALUATION_WORKERS, batch_size: int = EVALUATION_BATCH_SIZE
+    ):
+        self.workers = workers
+        self.batch_size = batch_size
+        self._executor = None
+        if workers > 1:
+            self._executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="evaluation"
+            )
+
+    def run(self, versions, evaluate, write) -> list:
+        """
+        Calls evaluate(version) for every version, which returns the list of its
+        (version_id, update) pairs, and sends the updates with write(updates), which
+        returns the IDs of the versions that failed to update. Returns the IDs of all
+        the failed versions.
+        """
+        if self._executor is None:
+            results = (evaluate(version) for version in versions)
+        else:
+            futures = [self._executor.submit(evaluate, version) for version in versions]
+            results = (future.result() for future in as_completed(futures))
+
+        failed_ids, updates = [], []
+        for version_updates in results:
+            updates += version_updates
+            if len(updates) >= self.batch_size:
+                failed_ids += write(updates)
+                updates = []
+        if updates:
+            failed_ids += write(updates)
+        return failed_ids
+
+    def shutdown(self) -> None:
+        """
+        Stops the threads of the evaluator once the running evaluations end
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+
+
+version_evaluator = VersionEvaluator()
@@ -1,94 +1,113 @@
 from datetime import datetime, timedelta
+from functools import lru_cache
 
+import numpy as np
 import pandas as pd
 
 
-class FilterService:
+def freeze_value(value):
+    """
+    Returns a hashable version of a filter value so it can be part of a cache key
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze_value(v) for v in value)
+    return value
 
-    # Define operations as a static class variable
-    OPERATIONS = {
-        "in": "filter_in",
-        "nin": "filter_nin",
-        "date": "filter_date",
-        "gt": "filter_gt",
-        "lt": "filter_lt",
-        "eq": "filter_eq",
-        "ne": "filter_ne",
-    }
-
-    def apply_filter(self, df, filter_obj) -> None:
-        """
-        Routes to the specific filtering method based on the operation specified in filter_obj.
-        Raises ValueError for unsupported operations.
-        """
-        method_name = self.OPERATIONS.get(filter_obj.operation)
-        if not method_name:
-            raise ValueError("Unsupported operation")
-
-        # Handle boolean and date operations separately
-        if (
-            filter_obj.operation in ["in", "nin"]
-            and df.dtypes[filter_obj.column] == "bool"
-            and len(filter_obj.value) == 1
-        ):
-            return self.filter_boolean(df, filter_obj)
-        elif hasattr(self, method_name):
-            method = getattr(self, method_name)
-            return method(df, filter_obj)
-        else:
-            raise ValueError("Unsupported operation")
-
-    def filter_boolean(self, df, filter_obj):
-        """
-        Filters dataframe for boolean operations 'in' and 'nin'.
-        """
-        value_bool = filter_obj.value[0] == "true"
-        if filter_obj.operation == "in":
-            return df[df[filter_obj.column] == value_bool]
-        elif filter_obj.operation == "nin":
-            return df[df[filter_obj.column] != value_bool]
-
-    def filter_in(self, df, filter_obj):
-        if filter_obj.column == "col_d":
-            return df[
-                df[filter_obj.column].str.fullmatch(
-                    "|".join(filter_obj.value), case=False
-                )
-            ]
-        else:
-            return df[df[filter_obj.column].isin(filter_obj.value)]
-
-    def filter_nin(self, df, filter_obj):
-        if filter_obj.column == "col_d":
-            return df[
-                -df[filter_obj.column].str.fullmatch(
-                    "|".join(filter_obj.value), case=False
-                )
-            ]
-        else:
-            return df[-df[filter_obj.column].isin(filter_obj.value)]
-
-    def filter_date(self, df, filter_obj):
+
+@lru_cache(maxsize=1024)
+def compile_filter(column, operation, value: tuple):
+    """
+    Compiles a filter into a function that returns its boolean mask over a DataFrame.
+    Everything that does not depend on the rows (e.g. the date bounds) is worked out
+    here, once per filter. Raises ValueError for unsupported operations.
+    """
+    if operation in ["in", "nin"]:
+        # directions match case-insensitively, other columns by value
+        pattern = "|".join(map(str, value)) if column == "col_d" else None
+        # a single 'true' or 'false' value filters boolean columns
+        value_bool = len(value) == 1 and value[0] == "true"
+
+        def include(df):
+            series = df[column]
+            if series.dtype == "bool" and len(value) == 1:
+                return series == value_bool
+            if column == "col_d":
+                return series.str.fullmatch(pattern, case=False).fillna(False)
+            return series.isin(value)
+
+        if operation == "in":
+            return include
+        return lambda df: ~include(df).astype(bool)
+
+    if operation == "date":
+        date_from = datetime.strptime(value[0], "%m/%d/%Y").strftime("%Y-%m-%d")
+        date_to = datetime.strptime(value[1], "%m/%d/%Y") + timedelta(days=1)
+        date_to = date_to.strftime("%Y-%m-%d")
+        return lambda df: (df[column] >= date_from) & (df[column] < date_to)
+
+    if operation in ["gt", "lt", "eq", "ne"]:
+        target = value[0]
+        if operation == "gt":
+            return lambda df: df[column] > target
+        if operation == "lt":
+            return lambda df: df[column] < target
+        if operation == "eq":
+            return lambda df: df[column] == target
+        return lambda df: df[column] != target
+
+    raise ValueError("Unsupported operation")
+
+
+class FilterMasks:
+    """
+    Boolean masks of filters over a single DataFrame. The mask of each (column,
+    operation, value) is only computed once, so versions sharing a filter reuse it and
+    a chain of filters costs one mask combination instead of a copy per filter.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.masks = {}
+
+    def get_mask(self, column, operation, value) -> np.ndarray:
+        key = (column, operation, freeze_value(value))
+        mask = self.masks.get(key)
+        if mask is None:
+            mask = compile_filter(*key)(self.df)
+            mask = np.asarray(mask, dtype=bool)
+            self.masks[key] = mask
+        return mask
+
+    def get_chain_mask(self, filters) -> np.ndarray:
+        mask = np.ones(len(self.df), dtype=bool)
+        for filter in filters:
+            mask = mask & self.get_mask(filter.column, filter.operation, filter.value)
+        return mask
+
+    def apply(self, filters) -> pd.DataFrame:
         """
-        Filters dataframe for entries between two dates.
+        Returns the rows of the DataFrame that pass every filter
         """
-        date_from = datetime.strptime(filter_obj.value[0], "%m/%d/%Y").strftime(
-            "%Y-%m-%d"
-        )
-        date_to = datetime.strptime(filter_obj.value[1], "%m/%d/%Y") + timedelta(days=1)
-        date_to = date_to.strftime("%Y-%m-%d")
-        return df.loc[
-            (df[filter_obj.column] >= date_from) & (df[filter_obj.column] < date_to)
-        ]
+        return self.df[self.get_chain_mask(filters)]
+
+
+class FilterService:
 
-    def filter_gt(self, df, filter_obj):
-        return df[df[filter_obj.column] > filter_obj.value[0]]
+    OPERATIONS = ["in", "nin", "date", "gt", "lt", "eq", "ne"]
 
-    def filter_lt(self, df, filter_obj):
-        return df[df[filter_obj.column] < filter_obj.value[0]]
+    def get_masks(self, df: pd.DataFrame) -> FilterMasks:
+        return FilterMasks(df)
 
-    def filter_eq(self, df, filter_obj):
-        return df[df[filter_obj.column] == filter_obj.value[0]]
+    def apply_filter(self, df, filter_obj) -> pd.DataFrame:
+        """
+        Returns the rows of df that pass filter_obj.
+        Raises ValueError for unsupported operations.
+        """
+        return self.apply_filters(df, [filter_obj])
 
-    def filter_ne(self, df, filter_obj):
-        return df[df[filter_obj.column] != filter_obj.value[0]]
+    def apply_filters(self, df, filters) -> pd.DataFrame:
+        """
+        Returns the rows of df that pass every filter in the list.
+        Raises ValueError for unsupported operations.
+        """
+        return FilterMasks(df).apply(filters)
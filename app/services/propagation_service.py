@@ -0,0 +1,253 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from app.repositories.version_repository import VersionRepository
+from app.services.filter_service import FilterService
+from app.services.version_service import VersionService
+
+# Threads that propagate account writes to their versions. With 0 the propagation runs
+# inline, before the write returns.
+PROPAGATION_WORKERS = int(os.getenv("PROPAGATION_WORKERS", 2))
+
+# Seconds without writes to an account before its queued writes are propagated, so a
+# burst of edits is merged into a single round of version updates
+PROPAGATION_WINDOW = float(os.getenv("PROPAGATION_WINDOW", 1))
+
+# Longest an account keeps collecting writes while they keep coming
+PROPAGATION_MAX_DELAY = float(os.getenv("PROPAGATION_MAX_DELAY", 10))
+
+# Times a task is run before its account is resynced instead
+PROPAGATION_ATTEMPTS = int(os.getenv("PROPAGATION_ATTEMPTS", 3))
+
+# Seconds before a resync that failed is queued again
+PROPAGATION_RETRY_DELAY = float(os.getenv("PROPAGATION_RETRY_DELAY", 60))
+
+
+class RowsTask:
+    """
+    Propagation of the changed rows of an account, by row ID. The rows are read from
+    the account when the task is applied, not when it is queued, so tasks applied late
+    or by another process never write stale rows. Consecutive row tasks of an account
+    are merged and applied with a single call to apply(row_ids).
+    """
+
+    def __init__(self, apply, row_ids):
+        self.apply = apply
+        self.row_ids = list(dict.fromkeys(row_ids))
+
+    def merge(self, other: "RowsTask") -> "RowsTask":
+        return RowsTask(self.apply, self.row_ids + other.row_ids)
+
+    def __call__(self):
+        return self.apply(self.row_ids)
+
+
+def resync_versions(account_id, filter_list=()) -> list:
+    """
+    Re-evaluates every version of the account from its current state, removing the
+    filters on columns in filter_list. Returns the IDs of the versions that failed to
+    update.
+    """
+    version_service = VersionService(VersionRepository(), FilterService())
+    return version_service.resync_versions(account_id, filter_list)
+
+
+def coalesce(items: list) -> list:
+    """
+    Merges consecutive row tasks of a list of (tokens, task, fallback) items. Any other
+    task is kept as is, so it still runs after the writes submitted before it.
+    """
+    merged = []
+    for tokens, task, fallback in items:
+        if (
+            merged
+            and isinstance(task, RowsTask)
+            and isinstance(merged[-1][1], RowsTask)
+        ):
+            previous_tokens, previous, previous_fallback = merged.pop()
+            merged.append(
+                (previous_tokens + tokens, previous.merge(task), previous_fallback)
+            )
+        else:
+            merged.append((tokens, task, fallback))
+    return merged
+
+
+class PropagationQueue:
+    """
+    Propagates the writes of accounts to their versions off the request path.
+
+    Tasks of one account run one at a time, in the order they were submitted, while
+    different accounts propagate in parallel. Until a task is applied, its token is kept
+    in the pending_updates of every version of the account, so a version is up to date
+    when that list is empty. Versions that fail to update keep the token.
+
+    A task that raises is run again, up to attempts times, and then its fallback runs
+    instead, which clears the tokens of the task if it succeeds. Tasks are submitted
+    with the fallback that redoes their work from the current state of the account,
+    fallback(account_id) by default. A fallback that fails too is queued again as a
+    task of its own after retry_delay seconds. Tokens left behind by that one (or by a
+    process that stopped before propagating) are cleared by the sync-versions command.
+
+    An account is only propagated once it goes window seconds without writes (or after
+    max_delay seconds), and every task queued by then is taken at once, so the row
+    tasks of a burst of edits are merged (see coalesce). The wait happens on a timer,
+    so the workers only ever run tasks.
+    """
+
+    def __init__(
+        self,
+        workers: int = PROPAGATION_WORKERS,
+        window: float = PROPAGATION_WINDOW,
+        max_delay: float = PROPAGATION_MAX_DELAY,
+        attempts: int = PROPAGATION_ATTEMPTS,
+        retry_delay: float = PROPAGATION_RETRY_DELAY,
+        fallback=None,
+    ):
+        self.workers = workers
+        self.window = window
+        self.max_delay = max_delay
+        self.attempts = attempts
+        self.retry_delay = retry_delay
+        self.fallback = fallback
+        self._executor = None
+        if workers:
+            self._executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="propagation"
+            )
+        # pending ([token], task, fallback) items of the accounts being propagated
+        self._queues = {}
+        # when the first and last of the pending tasks of each account were submitted
+        self._first_submit = {}
+        self._last_submit = {}
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def submit(self, account_id, task, fallback=None) -> None:
+        """
+        Queues a task that updates the versions of the account. The task takes no
+        arguments and returns the IDs of the versions that failed to update, and so does
+        its fallback.
+        """
+        if fallback is None and self.fallback is not None:
+            fallback = partial(self.fallback, account_id)
+        token = uuid.uuid4().hex
+        VersionRepository.add_pending_update(account_id, token)
+        if self._executor is None:
+            self._run(account_id, [token], task, fallback)
+            return
+        self._enqueue(account_id, ([token], task, fallback))
+
+    def _enqueue(self, account_id, item: tuple) -> None:
+        key = str(account_id)
+        with self._lock:
+            now = time.monotonic()
+            self._first_submit.setdefault(key, now)
+            self._last_submit[key] = now
+            queue = self._queues.get(key)
+            if queue is not None:
+                # already scheduled, or picked up once the running drain ends
+                queue.append(item)
+                return
+            self._queues[key] = deque([item])
+            self._schedule(account_id, key)
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Blocks until every queued task has run. Returns False on timeout.
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._queues, timeout)
+
+    def _schedule(self, account_id, key: str) -> None:
+        """
+        Drains the account on the pool once it goes window seconds without writes or
+        its oldest pending task waited max_delay seconds, re-checking on a timer until
+        then. Called with the lock held.
+        """
+        delay = min(
+            self._last_submit[key] + self.window,
+            self._first_submit[key] + self.max_delay,
+        )
+        delay -= time.monotonic()
+        if delay <= 0:
+            self._executor.submit(self._drain, account_id, key)
+            return
+        timer = threading.Timer(delay, self._expire, (account_id, key))
+        timer.daemon = True
+        timer.start()
+
+    def _expire(self, account_id, key: str) -> None:
+        with self._lock:
+            self._schedule(account_id, key)
+
+    def _drain(self, account_id, key: str) -> None:
+        with self._lock:
+            queue = self._queues[key]
+            items = list(queue)
+            queue.clear()
+            del self._first_submit[key]
+        for tokens, task, fallback in coalesce(items):
+            self._run(account_id, tokens, task, fallback)
+        with self._lock:
+            if queue:
+                # submitted while running
+                self._schedule(account_id, key)
+                return
+            del self._queues[key]
+            del self._last_submit[key]
+            self._idle.notify_all()
+
+    def _run(self, account_id, tokens: list, task, fallback=None) -> None:
+        for attempt in range(1, self.attempts + 1):
+            failed_ids = self._attempt(account_id, task, attempt)
+            if failed_ids is not None:
+                break
+        else:
+            failed_ids = None
+            if fallback is not None:
+                failed_ids = self._attempt(account_id, fallback)
+            if failed_ids is None:
+                self._retry(account_id, tokens, fallback)
+                return
+        VersionRepository.remove_pending_updates(account_id, tokens, failed_ids)
+
+    def _retry(self, account_id, tokens: list, fallback) -> None:
+        """
+        Queues the fallback of a task that failed again after retry_delay seconds, with
+        no fallback of its own, so it is only retried once
+        """
+        if fallback is None or self._executor is None:
+            logging.error(
+                f"Versions of account {account_id} left pending with {tokens}"
+            )
+            return
+        timer = threading.Timer(
+            self.retry_delay, self._enqueue, (account_id, (tokens, fallback, None))
+        )
+        timer.daemon = True
+        timer.start()
+
+    @staticmethod
+    def _attempt(account_id, task, attempt=None):
+        """
+        Runs the task and returns the IDs of the versions that failed to update, or None
+        if it raised
+        """
+        try:
+            return task() or []
+        except Exception:
+            logging.exception(
+                f"Failed to propagate writes of account {account_id}"
+                + (f" (attempt {attempt})" if attempt else " (resync)")
+            )
+            return None
+
+
+propagation_queue = PropagationQueue(fallback=resync_versions)
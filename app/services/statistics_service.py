@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+
+class StatisticsService:
+    """
+    Computes the statistics of the result columns of a state. All the columns are
+    evaluated at once on a 2-D array (rows x columns) so no Python loop runs per trade.
+    Missing values are ignored: they are not counted and do not break loss streaks.
+    """
+
+    def get_statistics(self, df: pd.DataFrame, columns: list) -> dict:
+        """
+        Returns a dict with the statistics of each column. The DataFrame is not modified.
+        """
+        if not columns:
+            return {}
+
+        values = df[columns].to_numpy(dtype="float64", na_value=np.nan)
+        valid = ~np.isnan(values)
+        win_mask = values > 0
+        loss_mask = values < 0
+
+        counts = valid.sum(axis=0)
+        totals = np.where(valid, values, 0).sum(axis=0)
+        wins = win_mask.sum(axis=0)
+        losses = loss_mask.sum(axis=0)
+        break_evens = (values == 0).sum(axis=0)
+        total_wins = np.where(win_mask, values, 0).sum(axis=0)
+        total_losses = np.where(loss_mask, values, 0).sum(axis=0)
+
+        drawdowns = self.get_drawdowns(values, valid)
+        max_consec_losses = self.get_max_consecutive_losses(loss_mask, values >= 0)
+        max_wins = np.max(np.where(valid, values, -np.inf), axis=0, initial=-np.inf)
+
+        response = {}
+        for i, column in enumerate(columns):
+            count = int(counts[i])
+            total = float(totals[i])
+            column_wins = int(wins[i])
+            column_losses = int(losses[i])
+            column_total_wins = float(total_wins[i])
+            column_total_losses = float(total_losses[i])
+
+            win_rate = column_wins / count if count else 0
+            avg_win = column_total_wins / column_wins if column_wins else 0
+            avg_loss = column_total_losses / column_losses if column_losses else 0
+
+            response[column] = {
+                "count": count,
+                "drawdown": round(float(drawdowns[i]), 3)
+                if not np.isnan(drawdowns[i])
+                else None,
+                "total": round(total, 3),
+                "mean": round(total / count if count else 0, 3),
+                "wins": column_wins,
+                "losses": column_losses,
+                "breakEvens": int(break_evens[i]),
+                "win_rate": round(win_rate, 4),
+                "avg_win": round(avg_win, 2),
+                "avg_loss": round(avg_loss, 2),
+                "expectancy": round(
+                    (win_rate * avg_win) - ((1 - win_rate) * abs(avg_loss)), 2
+                ),
+                "max_consec_loss": int(max_consec_losses[i]),
+                "max_win": round(float(max_wins[i]), 2) if count else None,
+                "profit_factor": round(column_total_wins / abs(column_total_losses), 2)
+                if column_total_losses
+                else round(column_total_wins, 2),
+            }
+
+        return response
+
+    @staticmethod
+    def get_drawdowns(values: np.ndarray, valid: np.ndarray) -> np.ndarray:
+        """
+        Returns the maximum drawdown of each column, measured on the cumulative results
+        rounded to 2 decimals. Columns without values get NaN.
+        """
+        cumulative = np.where(valid, np.nancumsum(values, axis=0), np.nan).round(2)
+        # fmax ignores NaN so the running high skips missing values
+        high_values = np.fmax.accumulate(cumulative, axis=0)
+        drawdowns = np.where(valid, cumulative - high_values, np.inf)
+        drawdowns = np.min(drawdowns, axis=0, initial=np.inf)
+        return np.where(valid.any(axis=0), drawdowns, np.nan)
+
+    @staticmethod
+    def get_max_consecutive_losses(
+        loss_mask: np.ndarray, reset_mask: np.ndarray
+    ) -> np.ndarray:
+        """
+        Returns the longest run of losses of each column. A run is broken by a win or a
+        break even, missing values neither extend nor break it.
+        """
+        if not len(loss_mask):
+            return np.zeros(loss_mask.shape[1], dtype="int64")
+        losses_so_far = np.cumsum(loss_mask, axis=0)
+        # number of losses seen at the last reset, carried forward
+        losses_at_reset = np.maximum.accumulate(
+            np.where(reset_mask, losses_so_far, 0), axis=0
+        )
+        return (losses_so_far - losses_at_reset).max(axis=0)
@@ -1,28 +1,122 @@
-from app.controllers.utils import from_df_to_db
+from app.repositories.account_repository import AccountRepository
+from app.services.evaluation_service import version_evaluator
 
 
 class VersionService:
-    def __init__(self, version_repsitory, filter_service):
+    def __init__(self, version_repsitory, filter_service, evaluator=None):
         self.version_repository = version_repsitory
         self.filter_service = filter_service
+        self.evaluator = evaluator or version_evaluator
 
     def update_version_from_account_without_filters(
         self, account_id, account_data, account_fields, filter_list
     ):
+        """
+        Re-applies the filters of every version of the account to its new data and
+        removes the filters on columns in filter_list. The versions are evaluated in
+        parallel and written in bulk, and the IDs of the versions that failed are
+        returned.
+        """
+        versions = self.version_repository.get_versions_by_account(
+            account_id, rows=False
+        )
+        version_filters = self.version_repository.get_filters(versions)
+        return self.refilter_versions(
+            versions, version_filters, account_data, account_fields, filter_list
+        )
 
-        versions = self.version_repository.get_versions_by_account(account_id)
+    def resync_versions(self, account_id, filter_list=()):
+        """
+        Same as update_version_from_account_without_filters but reads the data and
+        fields of the account when it runs, so the versions get its latest state
+        """
+        account_fields = AccountRepository.get_partial_state(account_id, [])["fields"]
+        account_data = AccountRepository.get_raw_dataframe(account_id)
+        return self.update_version_from_account_without_filters(
+            account_id, account_data, account_fields, list(filter_list)
+        )
 
+    def migrate_version_columns(
+        self, account_id, account_fields, migration, filter_list, load_account_data
+    ):
+        """
+        Applies a ColumnMigration to every version of the account inside MongoDB, in a
+        single bulk write. Versions with filters on columns in filter_list lose those
+        filters and are re-filtered from the account data, which is only loaded (with
+        load_account_data) if there is any. Returns the IDs of the versions that
+        failed.
+        """
+        versions = self.version_repository.get_versions_by_account(
+            account_id, rows=False
+        )
+        version_filters = self.version_repository.get_filters(versions)
+
+        refiltered, updates = [], []
         for version in versions:
-            new_state = account_data
-            for filter in version.filters:
+            if any(
+                filter.column in filter_list for filter in version_filters[version.id]
+            ):
+                refiltered.append(version)
+                continue
+            update = self.version_repository.get_columns_update(
+                version.storage, account_fields, migration
+            )
+            updates.append((version.id, update))
+
+        failed_ids = self.version_repository.bulk_update_versions(updates)
+        if refiltered:
+            failed_ids += self.refilter_versions(
+                refiltered,
+                version_filters,
+                load_account_data(),
+                account_fields,
+                filter_list,
+            )
+        return failed_ids
+
+    def refilter_versions(
+        self, versions, version_filters, account_data, account_fields, filter_list
+    ):
+        """
+        Re-applies the filters of the versions to the account data, except the filters
+        on columns in filter_list, which are removed
+        """
+        # masks are shared between versions with the same filters
+        masks = self.filter_service.get_masks(account_data)
+
+        removed_filters = {}
+
+        def evaluate(version):
+            filters_to_keep = []
+            filters_to_remove = []
+            for filter in version_filters[version.id]:
                 if filter.column not in filter_list:
-                    new_state = self.filter_service.apply_filter(new_state, filter)
+                    filters_to_keep.append(filter)
                 else:
-                    # remove filter
-                    self.version_repository.remove_version_filter(version, filter)
+                    filters_to_remove.append(filter)
+            new_state = masks.apply(filters_to_keep)
+
+            update = {
+                "$set": self.version_repository.get_state_update(
+                    version.storage, new_state, account_fields
+                ),
+                "$inc": {"state_version": 1},
+            }
+            if filters_to_remove:
+                update["$pull"] = {
+                    "filters": {"$in": [filter.pk for filter in filters_to_remove]}
+                }
+                removed_filters[version.id] = filters_to_remove
+            return [(version.id, update)]
+
+        failed_ids = self.evaluator.run(
+            versions, evaluate, self.version_repository.bulk_update_versions
+        )
+
+        # filters are only deleted once no version references them
+        for version_id, filters in removed_filters.items():
+            if version_id not in failed_ids:
+                for filter in filters:
                     filter.delete()
 
-            version_state = from_df_to_db(new_state)
-            self.version_repository.update_version_state(
-                version, version_state, account_fields
-            )
+        return failed_ids
@@ -0,0 +1,163 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+# Default memory budget for decoded states kept in memory by each process
+STATE_CACHE_MAX_BYTES = int(os.getenv("STATE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# Seconds reference data (templates, user settings) is served from memory before it
+# is read again, so writes made by other processes show up after at most this long
+REFERENCE_CACHE_TTL = float(os.getenv("REFERENCE_CACHE_TTL", 300))
+
+
+class DataFrameCache:
+    """
+    Least recently used cache of decoded DataFrames bounded by a memory budget.
+
+    Entries are keyed by the ID of the Document or Setup that owns the state and tagged
+    with its state version. Only the latest version of each owner is kept, so a write
+    that bumps the version makes the cached entry stale on the next lookup.
+    """
+
+    def __init__(self, max_bytes: int = STATE_CACHE_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, owner_id, version: int):
+        """
+        Returns a copy of the cached DataFrame for the owner and version or None.
+        """
+        key = str(owner_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            df = entry[1]
+        # callers are free to modify the DataFrame they receive
+        return df.copy()
+
+    def put(self, owner_id, version: int, df: pd.DataFrame) -> None:
+        """
+        Stores the DataFrame for the owner and version, evicting the least recently
+        used entries until the cache fits its memory budget.
+        """
+        key = str(owner_id)
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (version, df, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, owner_id) -> None:
+        with self._lock:
+            self._remove(str(owner_id))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size": self.size,
+                "max_size": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+
+class TTLCache:
+    """
+    Cache of small reference documents that are read far more often than they change.
+
+    Entries expire ttl seconds after they are stored and are dropped by invalidate when
+    this process writes them. The cached objects are shared between requests, so
+    callers must not modify them.
+    """
+
+    def __init__(self, ttl: float = REFERENCE_CACHE_TTL, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the cached value for the key or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_load(self, key, load):
+        """
+        Returns the cached value for the key, calling load to read it on a miss. None
+        is never cached, so a missing document is looked up again on the next call.
+        """
+        value = self.get(key)
+        if value is None:
+            value = load()
+            if value is not None:
+                self.put(key, value)
+        return value
+
+    def invalidate(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+state_cache = DataFrameCache()
+template_cache = TTLCache()
+user_settings_cache = TTLCache()
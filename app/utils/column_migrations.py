@@ -0,0 +1,78 @@
+def get_increment(field: str) -> dict:
+    """
+    Returns the expression that adds one to a counter field in an update pipeline, as
+    operators like $inc cannot be used there
+    """
+    return {"$add": [{"$ifNull": [f"${field}", 0]}, 1]}
+
+
+class ColumnMigration:
+    """
+    Changes to the columns of an account that MongoDB can apply to the stored rows
+    itself, with an update pipeline, so the rows never leave the database: deleting
+    columns, adding them (as null) and renaming them. Changing the type of a column
+    needs its values to be parsed and is not covered.
+    """
+
+    def __init__(self, deleted=None, added=None, renamed=None):
+        self.deleted = list(deleted or [])
+        self.added = list(added or [])
+        # previous name -> new name
+        self.renamed = dict(renamed or {})
+
+    def get_row_expression(self, row: str) -> dict:
+        """
+        Returns the expression that migrates a single row, e.g. "$data"
+        """
+        columns = {"$objectToArray": row}
+        if self.deleted:
+            columns = {
+                "$filter": {
+                    "input": columns,
+                    "as": "column",
+                    "cond": {"$not": {"$in": ["$$column.k", self.deleted]}},
+                }
+            }
+        if self.renamed:
+            branches = [
+                {"case": {"$eq": ["$$column.k", previous]}, "then": new}
+                for previous, new in self.renamed.items()
+            ]
+            columns = {
+                "$map": {
+                    "input": columns,
+                    "as": "column",
+                    "in": {
+                        "k": {
+                            "$switch": {"branches": branches, "default": "$$column.k"}
+                        },
+                        "v": "$$column.v",
+                    },
+                }
+            }
+        if self.added:
+            columns = {
+                "$concatArrays": [
+                    columns,
+                    [{"k": column, "v": None} for column in self.added],
+                ]
+            }
+        return {"$arrayToObject": columns}
+
+    def get_rows_expression(self, data: str) -> dict:
+        """
+        Returns the expression that migrates every row of a dict of rows by row ID,
+        e.g. "$state.data"
+        """
+        return {
+            "$arrayToObject": {
+                "$map": {
+                    "input": {"$objectToArray": {"$ifNull": [data, {"$literal": {}}]}},
+                    "as": "row",
+                    "in": {
+                        "k": "$$row.k",
+                        "v": self.get_row_expression("$$row.v"),
+                    },
+                }
+            }
+        }
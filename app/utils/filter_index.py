@@ -0,0 +1,158 @@
+import math
+
+# dtypes of the state fields that are filtered by range instead of by value
+NUMBER_TYPES = ["float64", "int64"]
+
+INDEX_VALUES = "values"
+INDEX_RANGE = "range"
+
+
+def get_index_kind(column, dtype):
+    """
+    Returns how a column is indexed for the filter options: by its distinct values, by
+    its numeric range or not at all (None). Risk reward is a number listed by its
+    values, as its filter option always has been.
+    """
+    if column in ["col_p", "col_rr"]:
+        return INDEX_VALUES
+    if column.startswith("col_m_"):
+        return INDEX_RANGE if dtype in NUMBER_TYPES else INDEX_VALUES
+    return None
+
+
+def is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def build_filter_index(fields: dict, data: dict) -> dict:
+    """
+    Builds the filter index of an account from its stored rows: the distinct values of
+    each value column, in order of appearance, and the min and max of each numeric one.
+    """
+    columns = {}
+    for column, dtype in fields.items():
+        kind = get_index_kind(column, dtype)
+        if kind is None:
+            continue
+        values = [row.get(column) for row in data.values()]
+        values = [value for value in values if not is_missing(value)]
+        if kind == INDEX_VALUES:
+            columns[column] = {"values": list(dict.fromkeys(values))}
+        elif values:
+            columns[column] = {"min": min(values), "max": max(values)}
+        else:
+            # min and max are left unset so the first value written sets them
+            columns[column] = {}
+    return {"columns": columns}
+
+
+def get_filter_index_update(fields: dict, row: dict) -> dict:
+    """
+    Returns the update that adds the values of a written row to the filter index. Values
+    are only ever added, so an overwritten value stays in the index until it is rebuilt.
+    """
+    values, lower, upper = {}, {}, {}
+    for column, value in row.items():
+        kind = get_index_kind(column, fields.get(column))
+        if kind is None or is_missing(value):
+            continue
+        path = f"filter_index.columns.{column}"
+        if kind == INDEX_VALUES:
+            values[f"{path}.values"] = value
+        else:
+            lower[f"{path}.min"] = value
+            upper[f"{path}.max"] = value
+
+    update = {}
+    if values:
+        update["$addToSet"] = values
+    if lower:
+        update["$min"] = lower
+        update["$max"] = upper
+    return update
+
+
+def replaces_indexed_value(fields: dict, old_row, new_row: dict, partial=False) -> bool:
+    """
+    Returns True if writing new_row over old_row changes or removes an indexed value. As
+    values are only ever added to the index, the old value would stay in it. A partial
+    new_row only holds the columns being written.
+    """
+    for column, value in (old_row or {}).items():
+        if is_missing(value) or get_index_kind(column, fields.get(column)) is None:
+            continue
+        if column not in new_row:
+            if not partial:
+                return True
+        elif new_row[column] != value:
+            return True
+    return False
+
+
+def get_filter_index_rows_update(fields: dict, rows: list) -> dict:
+    """
+    Same as get_filter_index_update for several written rows, merged into one update
+    """
+    values, lower, upper = {}, {}, {}
+    for row in rows:
+        update = get_filter_index_update(fields, row)
+        for path, value in update.get("$addToSet", {}).items():
+            path_values = values.setdefault(path, [])
+            if value not in path_values:
+                path_values.append(value)
+        for path, value in update.get("$min", {}).items():
+            lower[path] = min(lower.get(path, value), value)
+        for path, value in update.get("$max", {}).items():
+            upper[path] = max(upper.get(path, value), value)
+
+    update = {}
+    if values:
+        update["$addToSet"] = {
+            path: {"$each": path_values} for path, path_values in values.items()
+        }
+    if lower:
+        update["$min"] = lower
+        update["$max"] = upper
+    return update
+
+
+def get_filter_options(fields: dict, index: dict) -> list:
+    """
+    Returns the options to filter the versions of an account, from its fields and its
+    filter index
+    """
+    columns = index.get("columns", {})
+    options = []
+    for column, dtype in fields.items():
+        indexed = columns.get(column, {})
+        kind = get_index_kind(column, dtype)
+        if column.startswith("col_m_"):
+            option = {"id": column, "name": column[6:]}
+        elif column == "col_p":
+            option = {"id": column, "name": "Pair"}
+        elif column == "col_rr":
+            option = {"id": column, "name": "Risk Reward"}
+        elif column.startswith("col_d_"):
+            options.append({"id": column, "name": column[6:], "type": "date"})
+            continue
+        elif column == "col_d":
+            options.append(
+                {
+                    "id": column,
+                    "name": "Direction",
+                    "type": "string",
+                    "values": ["Long", "Short"],
+                }
+            )
+            continue
+        else:
+            continue
+
+        if column == "col_rr":
+            option.update(type="number", values=indexed.get("values", []))
+        elif kind == INDEX_VALUES:
+            option.update(type="string", values=indexed.get("values", []))
+        else:
+            option.update(type="number", min=indexed.get("min"), max=indexed.get("max"))
+        options.append(option)
+    return options
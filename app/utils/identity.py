@@ -0,0 +1,33 @@
+from app.models.User import User
+from bson import ObjectId
+from flask import g
+from flask_jwt_extended import get_jwt_identity
+
+
+def get_user_id() -> ObjectId:
+    """
+    Returns the ID of the user making the request, read from its JWT once per request.
+    Queries can filter on it directly (e.g. author=get_user_id()) without loading the
+    user.
+    """
+    if "user_id" not in g:
+        g.user_id = ObjectId(get_jwt_identity()["$oid"])
+    return g.user_id
+
+
+def get_user() -> User:
+    """
+    Returns the user making the request. It is only loaded when a document needs it
+    (e.g. to read its email), at most once per request.
+    """
+    if "user" not in g:
+        g.user = User.objects(id=get_user_id()).get()
+    return g.user
+
+
+def get_owned(model, **query):
+    """
+    Returns the queryset of the documents of the model authored by the user making the
+    request, narrowed by the query
+    """
+    return model.objects(author=get_user_id(), **query)
@@ -0,0 +1,81 @@
+from app.models.Document import Document
+from app.models.PPTTemplate import PPTTemplate
+from app.models.Setup import Setup
+from app.models.Template import Template
+from app.models.Trade import Trade
+from app.models.User import User
+from app.models.UserSettings import UserSettings
+from bson import ObjectId
+
+# Stages of a query plan that read every document of the collection
+SCAN_STAGES = ["COLLSCAN"]
+
+
+def get_hot_queries() -> list:
+    """
+    Returns the queries run on every request or write, as (name, model, filter, sort).
+    The values are placeholders, only the shape of each query matters to its plan.
+    """
+    id = ObjectId()
+    return [
+        ("versions by account", Setup, {"documentId": id}, [("date_created", -1)]),
+        (
+            "versions by author and account",
+            Setup,
+            {"author": id, "documentId": id},
+            [("date_created", -1)],
+        ),
+        ("versions by author", Setup, {"author": id}, [("date_created", -1)]),
+        ("accounts by author", Document, {"author": id}, [("date_created", -1)]),
+        ("account by name", Document, {"author": id, "name": ""}, None),
+        ("trades by account", Trade, {"account": id}, [("_id", 1)]),
+        ("trade", Trade, {"account": id, "row_id": ""}, None),
+        ("ppt rows by account", PPTTemplate, {"document": id}, None),
+        ("ppt row", PPTTemplate, {"document": id, "row_id": ""}, None),
+        ("template by name", Template, {"name": ""}, None),
+        ("user settings", UserSettings, {"user": id}, None),
+        ("user by email", User, {"email": ""}, None),
+    ]
+
+
+def get_plan_stages(plan: dict) -> list:
+    """
+    Returns the stages of a winning plan from explain(), from the root to its inputs
+    """
+    stages = []
+    pending = [plan]
+    while pending:
+        stage = pending.pop(0)
+        if "queryPlan" in stage:
+            # plans run by the slot based engine wrap the classic plan
+            pending.append(stage["queryPlan"])
+            continue
+        if "stage" in stage:
+            stages.append(stage["stage"])
+        if "inputStage" in stage:
+            pending.append(stage["inputStage"])
+        pending.extend(stage.get("inputStages", []))
+    return stages
+
+
+def explain_query(model, filter: dict, sort=None) -> list:
+    """
+    Returns the stages of the plan MongoDB picks for the query
+    """
+    cursor = model._get_collection().find(filter)
+    if sort:
+        cursor = cursor.sort(sort)
+    explain = cursor.explain()
+    return get_plan_stages(explain["queryPlanner"]["winningPlan"])
+
+
+def check_query_plans() -> list:
+    """
+    Explains every hot query and returns (name, collection, stages, is_scan) for each
+    """
+    results = []
+    for name, model, filter, sort in get_hot_queries():
+        stages = explain_query(model, filter, sort)
+        is_scan = any(stage in SCAN_STAGES for stage in stages)
+        results.append((name, model._get_collection_name(), stages, is_scan))
+    return results
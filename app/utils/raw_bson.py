@@ -0,0 +1,49 @@
+from bson import decode
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+# documents are returned as undecoded BSON, each field is decoded when accessed
+RAW_CODEC_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+
+def get_raw_collection(model):
+    """
+    Returns the pymongo collection of a mongoengine model, reading RawBSONDocument
+    instead of hydrating model instances
+    """
+    return model._get_collection().with_options(codec_options=RAW_CODEC_OPTIONS)
+
+
+def decode_raw(document) -> dict:
+    """
+    Decodes a raw document, and all its nested documents, into dicts in a single pass
+    """
+    if isinstance(document, RawBSONDocument):
+        return decode(document.raw)
+    return document
+
+
+def find_one_state(collection, query: dict, projection: dict, columns=None):
+    """
+    Same as collection.find_one(query, projection) for a projection that includes
+    "state", but when columns are given only the fields and those columns of every row
+    of state.data are read. Rows are read by path, so the whole state is read for
+    columns with dots or dollar signs.
+    """
+    if columns is None or any("." in column or "$" in column for column in columns):
+        return collection.find_one(query, projection)
+
+    projection = {key: value for key, value in projection.items() if key != "state"}
+    rows = {
+        "$map": {
+            "input": {"$objectToArray": {"$ifNull": ["$state.data", {"$literal": {}}]}},
+            "as": "row",
+            "in": {
+                "k": "$$row.k",
+                "v": {column: f"$$row.v.{column}" for column in columns},
+            },
+        }
+    }
+    projection["state"] = {"fields": "$state.fields", "data": {"$arrayToObject": rows}}
+    pipeline = [{"$match": query}, {"$limit": 1}, {"$project": projection}]
+    return next(iter(collection.aggregate(pipeline)), None)
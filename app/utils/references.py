@@ -0,0 +1,20 @@
+from bson import ObjectId
+
+
+def get_reference_id(reference):
+    """
+    Returns the ID of a stored reference, whether it is still an ObjectId or DBRef or
+    already a document, without dereferencing it
+    """
+    if reference is None or isinstance(reference, ObjectId):
+        return reference
+    return reference.id
+
+
+def get_reference_ids(document, field: str) -> list:
+    """
+    Returns the IDs of a list of references of a document without dereferencing them
+    """
+    return [
+        get_reference_id(reference) for reference in document._data.get(field) or []
+    ]
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+from app.controllers.SetupController import (
+    compute_calendar_statistics,
+    compute_cumulative_results,
+    compute_daily_distribution,
+    compute_net_results,
+)
+from pandas.testing import assert_frame_equal
+
+panels_df = pd.DataFrame(
+    {
+        "col_d_Close Time": pd.to_datetime(
+            [
+                "2023-05-29T10:00:00Z",
+                "2023-06-05T10:00:00Z",
+                "2023-06-06T10:00:00Z",
+                "2023-06-12T10:00:00Z",
+            ],
+            utc=True,
+        ),
+        "col_v_Profit": [-20.0, 50.0, np.nan, -10.0],
+    },
+    index=pd.Index(["a", "b", "c", "d"], dtype="object"),
+)
+
+
+def test_compute_daily_distribution():
+    response = compute_daily_distribution(panels_df)
+    assert response["data"]["Profit"]["Monday"] == round((-20 + 50 - 10) / 3, 3)
+    assert response["data"]["Profit"]["Tuesday"] is None
+    assert response["data"]["Profit"]["Friday"] == 0
+
+
+def test_compute_results_without_result_columns():
+    df = panels_df[["col_d_Close Time"]]
+    assert compute_net_results(df)["success"] is False
+    assert compute_cumulative_results(df)["success"] is False
+    assert compute_daily_distribution(df)["success"] is False
+
+
+def test_compute_cumulative_results():
+    response = compute_cumulative_results(panels_df)
+    assert response["data"]["col_v_Profit"] == [-20.0, 30.0, None, 20.0]
+    assert response["labels"] == [1, 2, 3, 4]
+
+
+def test_compute_calendar_statistics():
+    original = panels_df.copy()
+    response = compute_calendar_statistics(
+        panels_df, panels_df.columns, "col_v_Profit", "col_d_Close Time", "06/2023"
+    )
+    assert response["success"] is True
+    assert response["current"]["total_trades"] == 3
+    assert response["current"]["net_pnl"] == 40.0
+    assert response["previous"]["net_pnl"] == 300.0
+    assert_frame_equal(panels_df, original)
+
+
+def test_compute_calendar_statistics_invalid_arguments():
+    response = compute_calendar_statistics(
+        panels_df, panels_df.columns, "col_v_Profit", "col_d_Close Time", "2023-06"
+    )
+    assert response["success"] is False
+    response = compute_calendar_statistics(
+        panels_df, panels_df.columns, "col_v_Other", "col_d_Close Time", "06/2023"
+    )
+    assert response["success"] is False
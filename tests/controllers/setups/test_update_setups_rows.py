@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+
+from app.constants.storage import STORAGE_EMBEDDED, STORAGE_MEMBERSHIP
+from app.controllers.SetupController import update_setups_rows
+from app.services.evaluation_service import VersionEvaluator
+
+
+def test_rows_are_evaluated_per_setup(mocker):
+    fields = {"col_p": "object", "col_v_Profit": "float64"}
+    mocker.patch(
+        "app.controllers.SetupController.AccountRepository.get_partial_state",
+        return_value={
+            "fields": fields,
+            "data": {
+                "a1": {"col_p": "eurusd", "col_v_Profit": 10.0},
+                "b2": {"col_p": "gbpusd", "col_v_Profit": -5.0},
+            },
+        },
+    )
+    setups = [
+        SimpleNamespace(id="v1", storage=STORAGE_EMBEDDED),
+        SimpleNamespace(id="v2", storage=STORAGE_MEMBERSHIP),
+    ]
+    version_repository = "app.controllers.SetupController.VersionRepository"
+    mocker.patch(f"{version_repository}.get_versions_by_account", return_value=setups)
+    mocker.patch(
+        f"{version_repository}.get_filters",
+        return_value={
+            "v1": [],
+            "v2": [SimpleNamespace(column="col_p", operation="in", value=["eurusd"])],
+        },
+    )
+    bulk_update = mocker.patch(
+        f"{version_repository}.bulk_update_versions", return_value=[]
+    )
+    evaluator = VersionEvaluator(workers=1, batch_size=16)
+    mocker.patch("app.controllers.SetupController.version_evaluator", evaluator)
+
+    assert update_setups_rows("account", ["a1", "b2", "c3"]) == []
+
+    updates = bulk_update.call_args.args[0]
+    assert [id for id, _ in updates] == ["v1", "v2", "v2"]
+    assert set(updates[0][1]["$set"]) == {"state.data.a1", "state.data.b2"}
+    assert updates[0][1]["$unset"] == {"state.data.c3": 1}
+    assert updates[1][1]["$addToSet"] == {"row_ids": {"$each": ["a1"]}}
+    assert updates[2][1]["$pull"] == {"row_ids": {"$in": ["b2", "c3"]}}
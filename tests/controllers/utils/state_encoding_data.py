@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+state_df = pd.DataFrame(
+    {
+        "#": [73492188, 73630088, 73704117],
+        "col_d_Open Time": pd.to_datetime(
+            ["2023-05-18T04:30:34Z", None, "2023-06-01T02:32:29Z"], utc=True
+        ),
+        "col_m_Type": ["buy", None, "sell"],
+        "col_p": ["euraud", "eurusd", "usdjpy"],
+        "col_o": [1.63414, np.nan, 139.004],
+        "col_v_Profit": [34.29, -239.75, np.nan],
+        "col_m_Flag": [True, False, True],
+        "note": ["<p>Good entry</p>", "", ""],
+        "imgs": [["https://img.com/1.png", "https://img.com/2.png"], [], ""],
+    },
+    index=pd.Index(
+        [
+            "60184a54a08f493fa0a2619b09bcce2e",
+            "f5c85fb6b76f430fb13ca16f838ff25f",
+            "f8d845c158eb4c00b716b5540bd557d3",
+        ],
+        dtype="object",
+    ),
+)
+
+state_db = {
+    "60184a54a08f493fa0a2619b09bcce2e": {
+        "#": 73492188,
+        "col_d_Open Time": "2023-05-18T04:30:34Z",
+        "col_m_Type": "buy",
+        "col_p": "euraud",
+        "col_o": 1.63414,
+        "col_v_Profit": 34.29,
+        "col_m_Flag": True,
+        "note": "<p>Good entry</p>",
+        "imgs": ["https://img.com/1.png", "https://img.com/2.png"],
+    },
+    "f5c85fb6b76f430fb13ca16f838ff25f": {
+        "#": 73630088,
+        "col_d_Open Time": None,
+        "col_m_Type": None,
+        "col_p": "eurusd",
+        "col_o": None,
+        "col_v_Profit": -239.75,
+        "col_m_Flag": False,
+        "note": "",
+        "imgs": [],
+    },
+    "f8d845c158eb4c00b716b5540bd557d3": {
+        "#": 73704117,
+        "col_d_Open Time": "2023-06-01T02:32:29Z",
+        "col_m_Type": "sell",
+        "col_p": "usdjpy",
+        "col_o": 139.004,
+        "col_v_Profit": None,
+        "col_m_Flag": True,
+        "note": "",
+        "imgs": "",
+    },
+}
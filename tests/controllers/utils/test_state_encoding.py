@@ -0,0 +1,79 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from app.controllers.UploadController import upload_mt4
+from app.controllers.utils import from_db_to_df, from_df_to_db, select_columns
+from pandas.testing import assert_frame_equal
+from tests.controllers.utils.state_encoding_data import state_db, state_df
+
+
+def legacy_from_df_to_db(df):
+    """Previous encoder, kept as a reference for equivalence"""
+    return json.loads(df.to_json(orient="index", date_format="iso", date_unit="s"))
+
+
+def to_state(df):
+    return {
+        "data": from_df_to_db(df),
+        "fields": df.dtypes.apply(lambda x: x.name).to_dict(),
+    }
+
+
+def test_from_df_to_db():
+    assert from_df_to_db(state_df.copy()) == state_db
+
+
+def test_from_df_to_db_matches_legacy_encoder():
+    assert from_df_to_db(state_df.copy()) == legacy_from_df_to_db(state_df)
+
+
+def test_from_df_to_db_non_finite_floats():
+    df = pd.DataFrame({"col_v_Profit": [np.inf, -np.inf, 1.5]}, index=["a", "b", "c"])
+    assert from_df_to_db(df) == legacy_from_df_to_db(df)
+
+
+def test_from_df_to_db_naive_dates():
+    df = pd.DataFrame(
+        {"col_d_Date": pd.to_datetime(["2023-05-18 04:30:34.750", None])},
+        index=["a", "b"],
+    )
+    assert from_df_to_db(df) == legacy_from_df_to_db(df)
+
+
+def test_from_df_to_db_add_index():
+    df = state_df.reset_index(drop=True)
+    data = from_df_to_db(df, add_index=True)
+    assert len(data) == len(state_df)
+    assert all(len(row_id) == 32 for row_id in data)
+
+
+def test_round_trip():
+    df = from_db_to_df(to_state(state_df.copy()))
+    assert_frame_equal(df, state_df)
+
+
+def test_round_trip_empty():
+    df = state_df.iloc[0:0]
+    assert_frame_equal(from_db_to_df(to_state(df.copy())), df, check_index_type=False)
+
+
+def test_round_trip_mt4_upload():
+    file_path = os.path.abspath("tests/data/mt4_to_tradesharpener.xlsx")
+    state = upload_mt4(file_path)
+    df = from_db_to_df(state)
+    assert from_df_to_db(df) == state["data"]
+    assert_frame_equal(from_db_to_df(to_state(df)), df)
+
+
+def test_select_columns():
+    fields = to_state(state_df.copy())["fields"]
+    assert select_columns(fields, r"col_[vpr]_") == ["col_v_Profit"]
+    assert select_columns(fields, r"col_d_", r"col_p$") == ["col_d_Open Time", "col_p"]
+
+
+def test_from_db_to_df_columns():
+    columns = ["col_v_Profit", "col_d_Open Time"]
+    df = from_db_to_df(to_state(state_df.copy()), columns=columns)
+    assert_frame_equal(df, state_df[columns])
@@ -0,0 +1,268 @@
+import pytest
+from app.constants.storage import STORAGE_EMBEDDED, STORAGE_TRADES
+from app.models.Document import Document
+from app.repositories.account_repository import AccountRepository
+from bson import ObjectId, encode
+from bson.raw_bson import RawBSONDocument
+
+fields = {"col_p": "object", "col_v_Profit": "float64"}
+data = {
+    "a1": {"col_p": "eurusd", "col_v_Profit": 10.0},
+    "b2": {"col_p": "gbpusd", "col_v_Profit": -5.0},
+}
+
+
+def make_account(mocker, storage, filter_index=None):
+    state = {"fields": fields}
+    if storage == STORAGE_EMBEDDED:
+        state["data"] = data
+    return mocker.Mock(
+        id="account", state=state, storage=storage, filter_index=filter_index or {}
+    )
+
+
+def test_get_state_embedded(mocker):
+    get_trades = mocker.patch(
+        "app.repositories.account_repository.TradeRepository.get_trades"
+    )
+    state = {"fields": fields, "data": data}
+    assert AccountRepository.get_state("account", state, STORAGE_EMBEDDED) is state
+    assert AccountRepository.get_state("account", state) is state
+    get_trades.assert_not_called()
+
+
+def test_get_state_trades(mocker):
+    mocker.patch(
+        "app.repositories.account_repository.TradeRepository.get_trades",
+        return_value=data,
+    )
+    state = AccountRepository.get_state("account", {"fields": fields}, STORAGE_TRADES)
+    assert state == {"fields": fields, "data": data}
+
+
+def test_set_trade_embedded(mocker):
+    objects = mocker.patch("app.repositories.account_repository.Document.objects")
+    set_trade = mocker.patch(
+        "app.repositories.account_repository.TradeRepository.set_trade"
+    )
+    AccountRepository.set_trade(
+        make_account(mocker, STORAGE_EMBEDDED), "a1", data["a1"]
+    )
+
+    set_trade.assert_not_called()
+    objects.return_value.update_one.assert_called_once_with(
+        __raw__={
+            "$set": {"state.data.a1": data["a1"]},
+            "$inc": {"state_version": 1},
+        }
+    )
+
+
+def test_set_trade_trades(mocker):
+    objects = mocker.patch("app.repositories.account_repository.Document.objects")
+    set_trade = mocker.patch(
+        "app.repositories.account_repository.TradeRepository.set_trade"
+    )
+    AccountRepository.set_trade(make_account(mocker, STORAGE_TRADES), "a1", data["a1"])
+
+    set_trade.assert_called_once_with("account", "a1", data["a1"])
+    objects.return_value.update_one.assert_called_once_with(
+        __raw__={"$inc": {"state_version": 1}}
+    )
+
+
+def test_set_trade_updates_filter_index(mocker):
+    objects = mocker.patch("app.repositories.account_repository.Document.objects")
+    mocker.patch("app.repositories.account_repository.TradeRepository.set_trade")
+    mocker.patch.object(AccountRepository, "get_rows", return_value={})
+    account = make_account(mocker, STORAGE_TRADES, filter_index={"columns": {}})
+    AccountRepository.set_trade(account, "a1", data["a1"])
+
+    objects.return_value.update_one.assert_called_once_with(
+        __raw__={
+            "$inc": {"state_version": 1},
+            "$addToSet": {"filter_index.columns.col_p.values": "eurusd"},
+        }
+    )
+
+
+def test_set_trade_drops_filter_index_on_replaced_value(mocker):
+    objects = mocker.patch("app.repositories.account_repository.Document.objects")
+    mocker.patch("app.repositories.account_repository.TradeRepository.set_trade")
+    mocker.patch.object(AccountRepository, "get_rows", return_value=data)
+    account = make_account(mocker, STORAGE_TRADES, filter_index={"columns": {}})
+    AccountRepository.set_trade(account, "a1", {**data["a1"], "col_p": "usdjpy"})
+
+    objects.return_value.update_one.assert_called_once_with(
+        __raw__={"$inc": {"state_version": 1}, "$unset": {"filter_index": 1}}
+    )
+
+
+def test_get_filter_options_not_found(mocker):
+    collection = mocker.patch(
+        "app.repositories.account_repository.Document._get_collection"
+    )
+    collection.return_value.find_one.return_value = None
+    with pytest.raises(Document.DoesNotExist):
+        AccountRepository.get_filter_options(ObjectId())
+
+
+def test_rebuild_filter_index_only_stores_unchanged_state(mocker):
+    objects = mocker.patch("app.repositories.account_repository.Document.objects")
+    account = make_account(mocker, STORAGE_EMBEDDED)
+    account.state_version = 7
+    objects.return_value.get.return_value = account
+    AccountRepository.rebuild_filter_index("account")
+
+    objects.assert_called_with(id="account", state_version=7)
+
+
+def test_delete_trade_drops_filter_index(mocker):
+    objects = mocker.patch("app.repositories.account_repository.Document.objects")
+    AccountRepository.delete_trade(make_account(mocker, STORAGE_EMBEDDED), "a1")
+
+    objects.return_value.update_one.assert_called_once_with(
+        __raw__={
+            "$unset": {"state.data.a1": 1, "filter_index": 1},
+            "$inc": {"state_version": 1},
+        }
+    )
+
+
+def test_set_trades_single_update(mocker):
+    objects = mocker.patch("app.repositories.account_repository.Document.objects")
+    write_trades = mocker.patch(
+        "app.repositories.account_repository.TradeRepository.write_trades"
+    )
+    AccountRepository.set_trades(
+        make_account(mocker, STORAGE_EMBEDDED), {"a1": data["a1"], "b2": None}
+    )
+
+    write_trades.assert_not_called()
+    objects.return_value.update_one.assert_called_once_with(
+        __raw__={
+            "$inc": {"state_version": 1},
+            "$set": {"state.data.a1": data["a1"]},
+            "$unset": {"state.data.b2": 1, "filter_index": 1},
+        }
+    )
+
+
+def test_set_trades_updates_filter_index(mocker):
+    objects = mocker.patch("app.repositories.account_repository.Document.objects")
+    write_trades = mocker.patch(
+        "app.repositories.account_repository.TradeRepository.write_trades"
+    )
+    mocker.patch.object(AccountRepository, "get_rows", return_value={})
+    account = make_account(mocker, STORAGE_TRADES, filter_index={"columns": {}})
+    AccountRepository.set_trades(account, data)
+
+    write_trades.assert_called_once_with("account", data)
+    objects.return_value.update_one.assert_called_once_with(
+        __raw__={
+            "$inc": {"state_version": 1},
+            "$addToSet": {
+                "filter_index.columns.col_p.values": {"$each": ["eurusd", "gbpusd"]}
+            },
+        }
+    )
+
+
+def test_migrate_columns_trades(mocker):
+    objects = mocker.patch("app.repositories.account_repository.Document.objects")
+    migrate_trades = mocker.patch(
+        "app.repositories.account_repository.TradeRepository.migrate_trades"
+    )
+    migration = mocker.Mock()
+    AccountRepository.migrate_columns(
+        make_account(mocker, STORAGE_TRADES), fields, migration
+    )
+
+    migrate_trades.assert_called_once_with("account", migration)
+    migration.get_rows_expression.assert_not_called()
+    objects.return_value.update_one.assert_called_once_with(
+        __raw__=[
+            {
+                "$set": {
+                    "state.fields": {"$literal": fields},
+                    "state_version": {"$add": [{"$ifNull": ["$state_version", 0]}, 1]},
+                }
+            },
+            {"$project": {"filter_index": 0}},
+        ]
+    )
+
+
+def test_move_to_trades(mocker):
+    objects = mocker.patch("app.repositories.account_repository.Document.objects")
+    replace_trades = mocker.patch(
+        "app.repositories.account_repository.TradeRepository.replace_trades"
+    )
+    assert AccountRepository.move_to_trades(make_account(mocker, STORAGE_EMBEDDED))
+    replace_trades.assert_called_once_with("account", data)
+    objects.return_value.update_one.assert_called_once_with(
+        __raw__={"$set": {"storage": STORAGE_TRADES}, "$unset": {"state.data": 1}}
+    )
+
+    assert not AccountRepository.move_to_trades(make_account(mocker, STORAGE_TRADES))
+
+
+def test_get_trade_projects_single_row(mocker):
+    account_id = ObjectId()
+    collection = mocker.Mock()
+    collection.find_one.return_value = RawBSONDocument(
+        encode({"_id": account_id, "state": {"data": {"a1": data["a1"]}}})
+    )
+    mocker.patch(
+        "app.repositories.account_repository.get_raw_collection",
+        return_value=collection,
+    )
+
+    assert AccountRepository.get_trade(str(account_id), "a1") == data["a1"]
+    collection.find_one.assert_called_once_with(
+        {"_id": account_id}, {"storage": 1, "state.data.a1": 1}
+    )
+
+
+def test_get_trade_trades(mocker):
+    account_id = ObjectId()
+    collection = mocker.Mock()
+    collection.find_one.return_value = {"_id": account_id, "storage": STORAGE_TRADES}
+    mocker.patch(
+        "app.repositories.account_repository.get_raw_collection",
+        return_value=collection,
+    )
+    get_trade = mocker.patch(
+        "app.repositories.account_repository.TradeRepository.get_trade",
+        return_value=None,
+    )
+
+    assert AccountRepository.get_trade(str(account_id), "c3") is None
+    get_trade.assert_called_once_with(account_id, "c3")
+
+
+def test_get_partial_state_trades(mocker):
+    account_id = ObjectId()
+    collection = mocker.Mock()
+    collection.find_one.return_value = RawBSONDocument(
+        encode(
+            {"_id": account_id, "storage": STORAGE_TRADES, "state": {"fields": fields}}
+        )
+    )
+    mocker.patch(
+        "app.repositories.account_repository.get_raw_collection",
+        return_value=collection,
+    )
+    get_trades = mocker.patch(
+        "app.repositories.account_repository.TradeRepository.get_trades",
+        return_value={"a1": data["a1"]},
+    )
+
+    state = AccountRepository.get_partial_state(str(account_id), ["a1", "c3"])
+
+    assert state == {"fields": fields, "data": {"a1": data["a1"]}}
+    get_trades.assert_called_once_with(account_id, row_ids=["a1", "c3"])
+    collection.find_one.assert_called_once_with(
+        {"_id": account_id},
+        {"storage": 1, "state.fields": 1, "state.data.a1": 1, "state.data.c3": 1},
+    )
@@ -0,0 +1,21 @@
+from app.models.Template import Template
+from app.repositories.template_repository import TemplateRepository
+from app.utils.cache import template_cache
+from bson import DBRef, ObjectId
+
+
+def test_template_name_is_resolved_once(mocker):
+    template_cache.clear()
+    template_id = ObjectId()
+    objects = mocker.patch("app.repositories.template_repository.Template.objects")
+    objects.return_value.get.return_value = Template(id=template_id, name="PPT")
+    document = mocker.Mock(_data={"template": DBRef("templates", template_id)})
+
+    assert TemplateRepository.get_template_name(document) == "PPT"
+    assert TemplateRepository.get_template_name(document) == "PPT"
+    objects.assert_called_once_with(id=template_id)
+
+
+def test_template_name_without_template(mocker):
+    document = mocker.Mock(_data={})
+    assert TemplateRepository.get_template_name(document) is None
@@ -0,0 +1,39 @@
+import pytest
+from app.repositories.trade_repository import TradeRepository
+from bson import ObjectId
+
+
+def test_replace_trades_upserts_before_deleting(mocker):
+    account_id = ObjectId()
+    collection = mocker.Mock()
+    mocker.patch(
+        "app.repositories.trade_repository.Trade._get_collection",
+        return_value=collection,
+    )
+
+    TradeRepository.replace_trades(str(account_id), {"a1": {"col_p": "eurusd"}})
+
+    assert [call[0] for call in collection.mock_calls] == [
+        "bulk_write",
+        "delete_many",
+    ]
+    (operation,) = collection.bulk_write.call_args.args[0]
+    assert operation._filter == {"account": account_id, "row_id": "a1"}
+    assert operation._doc["data"] == {"col_p": "eurusd"}
+    collection.delete_many.assert_called_once_with(
+        {"account": account_id, "row_id": {"$nin": ["a1"]}}
+    )
+
+
+def test_replace_trades_failed_write_keeps_trades(mocker):
+    collection = mocker.Mock()
+    collection.bulk_write.side_effect = Exception("write failed")
+    mocker.patch(
+        "app.repositories.trade_repository.Trade._get_collection",
+        return_value=collection,
+    )
+
+    with pytest.raises(Exception):
+        TradeRepository.replace_trades(str(ObjectId()), {"a1": {}})
+
+    collection.delete_many.assert_not_called()
@@ -0,0 +1,218 @@
+import pandas as pd
+import pytest
+from app.constants.storage import STORAGE_EMBEDDED, STORAGE_MEMBERSHIP
+from app.models.Setup import Setup
+from app.repositories.version_repository import VersionRepository
+from bson import DBRef, ObjectId, encode
+from bson.raw_bson import RawBSONDocument
+from pymongo.errors import BulkWriteError
+
+
+def test_bulk_update_versions_single_write(mocker):
+    collection = mocker.Mock()
+    mocker.patch(
+        "app.repositories.version_repository.Setup._get_collection",
+        return_value=collection,
+    )
+    updates = [(ObjectId(), {"$inc": {"state_version": 1}}) for _ in range(3)]
+
+    assert VersionRepository.bulk_update_versions(updates) == []
+    collection.bulk_write.assert_called_once()
+    operations = collection.bulk_write.call_args.args[0]
+    assert len(operations) == 3
+    assert collection.bulk_write.call_args.kwargs == {"ordered": False}
+
+
+def test_bulk_update_versions_reports_failures(mocker):
+    updates = [(ObjectId(), {"$inc": {"state_version": 1}}) for _ in range(3)]
+    collection = mocker.Mock()
+    collection.bulk_write.side_effect = BulkWriteError(
+        {"writeErrors": [{"index": 1, "code": 2, "errmsg": "bad update"}]}
+    )
+    mocker.patch(
+        "app.repositories.version_repository.Setup._get_collection",
+        return_value=collection,
+    )
+
+    assert VersionRepository.bulk_update_versions(updates) == [updates[1][0]]
+
+
+def test_bulk_update_versions_empty(mocker):
+    get_collection = mocker.patch(
+        "app.repositories.version_repository.Setup._get_collection"
+    )
+    assert VersionRepository.bulk_update_versions([]) == []
+    get_collection.assert_not_called()
+
+
+def test_get_state_update_membership():
+    df = pd.DataFrame({"col_v_Profit": [1.0, 2.0]}, index=["b2", "a1"])
+    fields = {"col_v_Profit": "float64"}
+
+    assert VersionRepository.get_state_update(STORAGE_MEMBERSHIP, df, fields) == {
+        "row_ids": ["a1", "b2"],
+        "state.fields": fields,
+    }
+    assert VersionRepository.get_state_update(STORAGE_EMBEDDED, df) == {
+        "state.data": {"b2": {"col_v_Profit": 1.0}, "a1": {"col_v_Profit": 2.0}}
+    }
+
+
+def test_get_row_update():
+    row = {"col_v_Profit": 1.0}
+    assert VersionRepository.get_row_update(STORAGE_MEMBERSHIP, "a1", row) == {
+        "$addToSet": {"row_ids": "a1"}
+    }
+    assert VersionRepository.get_row_update(STORAGE_MEMBERSHIP, "a1") == {
+        "$pull": {"row_ids": "a1"}
+    }
+    assert VersionRepository.get_row_update(STORAGE_EMBEDDED, "a1", row) == {
+        "$set": {"state.data.a1": row}
+    }
+    assert VersionRepository.get_row_update(STORAGE_EMBEDDED, "a1") == {
+        "$unset": {"state.data.a1": 1}
+    }
+
+
+def test_get_rows_update():
+    row = {"col_v_Profit": 1.0}
+    rows = {"a1": row, "b2": None}
+    assert VersionRepository.get_rows_update(STORAGE_MEMBERSHIP, rows) == [
+        {"$addToSet": {"row_ids": {"$each": ["a1"]}}},
+        {"$pull": {"row_ids": {"$in": ["b2"]}}},
+    ]
+    assert VersionRepository.get_rows_update(STORAGE_EMBEDDED, rows) == [
+        {"$set": {"state.data.a1": row}, "$unset": {"state.data.b2": 1}}
+    ]
+    assert VersionRepository.get_rows_update(STORAGE_EMBEDDED, {}) == []
+
+
+def test_get_columns_update(mocker):
+    migration = mocker.Mock()
+    migration.get_rows_expression.return_value = {"$literal": {}}
+    fields = {"col_p": "object"}
+    increment = {"$add": [{"$ifNull": ["$state_version", 0]}, 1]}
+
+    assert VersionRepository.get_columns_update(
+        STORAGE_MEMBERSHIP, fields, migration
+    ) == [{"$set": {"state.fields": {"$literal": fields}, "state_version": increment}}]
+    assert VersionRepository.get_columns_update(
+        STORAGE_EMBEDDED, fields, migration
+    ) == [
+        {
+            "$set": {
+                "state.fields": {"$literal": fields},
+                "state_version": increment,
+                "state.data": {"$literal": {}},
+            }
+        }
+    ]
+    migration.get_rows_expression.assert_called_once_with("$state.data")
+
+
+def test_resolve_state_keeps_account_order():
+    account_state = {
+        "fields": {"col_p": "object"},
+        "data": {"c3": {"col_p": "c"}, "a1": {"col_p": "a"}, "b2": {"col_p": "b"}},
+    }
+    state = VersionRepository.resolve_state(
+        {"fields": {"col_p": "object"}}, ["a1", "c3"], account_state
+    )
+    assert state == {
+        "fields": {"col_p": "object"},
+        "data": {"c3": {"col_p": "c"}, "a1": {"col_p": "a"}},
+    }
+
+
+def raw(document):
+    return RawBSONDocument(encode(document))
+
+
+def test_get_raw_dataframe_decodes_state_once(mocker):
+    version_id = ObjectId()
+    state = {
+        "fields": {"col_p": "object", "col_v_Profit": "float64"},
+        "data": {"a1": {"col_p": "eurusd", "col_v_Profit": 10.0}},
+    }
+    collection = mocker.Mock()
+    collection.aggregate.return_value = iter(
+        [raw({"state": state, "state_version": 3})]
+    )
+    mocker.patch(
+        "app.repositories.version_repository.get_raw_collection",
+        return_value=collection,
+    )
+    version = raw({"_id": version_id, "state_version": 3, "storage": STORAGE_EMBEDDED})
+
+    df = VersionRepository.get_raw_dataframe(version, ["col_v_Profit"])
+    assert list(df.columns) == ["col_v_Profit"]
+    assert df.loc["a1", "col_v_Profit"] == 10.0
+
+    # the second read is served from the cache without querying the rows
+    VersionRepository.get_raw_dataframe(version, ["col_v_Profit"])
+    collection.aggregate.assert_called_once()
+    pipeline = collection.aggregate.call_args.args[0]
+    assert pipeline[0] == {"$match": {"_id": version_id}}
+
+
+def test_get_raw_dataframe_membership_follows_account_writes(mocker):
+    version_id, account_id = ObjectId(), ObjectId()
+    collection = mocker.Mock()
+    collection.find_one.return_value = raw({"row_ids": ["a1"], "state_version": 2})
+    mocker.patch(
+        "app.repositories.version_repository.get_raw_collection",
+        return_value=collection,
+    )
+    account_repository = "app.repositories.version_repository.AccountRepository"
+    mocker.patch(f"{account_repository}.get_state_version", side_effect=[5, 5, 6])
+    account_df = pd.DataFrame(
+        {"col_v_Profit": [10.0, -5.0]}, index=pd.Index(["a1", "b2"], dtype="object")
+    )
+    get_account_df = mocker.patch(
+        f"{account_repository}.get_raw_dataframe", return_value=account_df
+    )
+    version = raw(
+        {
+            "_id": version_id,
+            "documentId": account_id,
+            "state_version": 2,
+            "storage": STORAGE_MEMBERSHIP,
+        }
+    )
+
+    df = VersionRepository.get_raw_dataframe(version, ["col_v_Profit"])
+    assert list(df.index) == ["a1"]
+    VersionRepository.get_raw_dataframe(version, ["col_v_Profit"])
+    assert get_account_df.call_count == 1
+
+    # a write that only bumps the account reads its rows again
+    VersionRepository.get_raw_dataframe(version, ["col_v_Profit"])
+    assert get_account_df.call_count == 2
+
+
+def test_get_raw_version_not_found(mocker):
+    collection = mocker.Mock()
+    collection.find_one.return_value = None
+    mocker.patch(
+        "app.repositories.version_repository.get_raw_collection",
+        return_value=collection,
+    )
+    with pytest.raises(Setup.DoesNotExist):
+        VersionRepository.get_raw_version(str(ObjectId()))
+
+
+def test_get_filters_loads_every_version_at_once(mocker):
+    shared, other = ObjectId(), ObjectId()
+    objects = mocker.patch("app.repositories.version_repository.Filter.objects")
+    objects.in_bulk.return_value = {shared: "shared", other: "other"}
+    versions = [
+        mocker.Mock(id="v1", _data={"filters": [DBRef("filters", shared)]}),
+        mocker.Mock(id="v2", _data={"filters": [other, DBRef("filters", shared)]}),
+        mocker.Mock(id="v3", _data={"filters": []}),
+    ]
+
+    filters = VersionRepository.get_filters(versions)
+
+    assert filters == {"v1": ["shared"], "v2": ["other", "shared"], "v3": []}
+    objects.in_bulk.assert_called_once()
+    assert sorted(objects.in_bulk.call_args.args[0]) == sorted([shared, other])
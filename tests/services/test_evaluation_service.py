@@ -0,0 +1,44 @@
+import threading
+
+from app.services.evaluation_service import VersionEvaluator
+
+
+def test_updates_are_written_in_batches():
+    batches = []
+
+    def write(updates):
+        batches.append(updates)
+        return [id for id, _ in updates if id == "v3"]
+
+    evaluator = VersionEvaluator(workers=1, batch_size=2)
+    failed_ids = evaluator.run(
+        ["v1", "v2", "v3"], lambda version: [(version, {"version": version})], write
+    )
+
+    assert failed_ids == ["v3"]
+    assert batches == [
+        [("v1", {"version": "v1"}), ("v2", {"version": "v2"})],
+        [("v3", {"version": "v3"})],
+    ]
+
+
+def test_versions_are_evaluated_in_parallel():
+    versions = [f"v{i}" for i in range(8)]
+    threads = set()
+    written = []
+
+    def evaluate(version):
+        threads.add(threading.current_thread().name)
+        return [(version, {})]
+
+    def write(updates):
+        written.extend(updates)
+        return []
+
+    evaluator = VersionEvaluator(workers=4, batch_size=3)
+    assert evaluator.run(versions, evaluate, write) == []
+
+    assert sorted(id for id, _ in written) == versions
+    assert all(name.startswith("evaluation") for name in threads)
+    evaluator.shutdown()
+    assert evaluator._executor._shutdown
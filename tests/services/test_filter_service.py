@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+from app.controllers.FilterController import apply_filter
+from app.services.filter_service import FilterMasks, FilterService, compile_filter
+from pandas.testing import assert_frame_equal
+from tests.controllers.filters.test_apply_filter_data import unfiltered_data
+
+
+def make_filter(mocker, column, operation, value):
+    return mocker.Mock(column=column, operation=operation, value=value)
+
+
+def test_chain_mask_matches_sequential_filters(mocker):
+    specs = [
+        ("date", "date", ["05/01/2018", "06/30/2018"]),
+        ("col_d", "nin", ["short"]),
+        ("numeric_metric", "gt", [0.3]),
+        ("asset", "in", ["A", "B", "C"]),
+    ]
+    expected = unfiltered_data
+    for column, operation, value in specs:
+        expected = apply_filter(expected, column, operation, value)
+
+    filters = [make_filter(mocker, *spec) for spec in specs]
+    filtered_df = FilterService().apply_filters(unfiltered_data, filters)
+
+    assert_frame_equal(filtered_df, expected)
+
+
+def test_masks_are_shared_between_chains(mocker):
+    masks = FilterMasks(unfiltered_data)
+    spy = mocker.spy(masks, "get_mask")
+    shared = make_filter(mocker, "asset", "in", ["B"])
+
+    masks.apply([shared])
+    masks.apply([shared, make_filter(mocker, "numeric_metric", "lt", [1])])
+
+    assert spy.call_count == 3
+    assert len(masks.masks) == 2
+
+
+def test_boolean_filter():
+    df = pd.DataFrame({"col_b": [True, False, True]})
+    assert list(apply_filter(df, "col_b", "in", ["true"]).index) == [0, 2]
+    assert list(apply_filter(df, "col_b", "nin", ["true"]).index) == [1]
+
+
+def test_direction_filter_ignores_missing_values():
+    df = pd.DataFrame({"col_d": ["Long", None, "short"]})
+    assert list(apply_filter(df, "col_d", "in", ["long"]).index) == [0]
+    assert list(apply_filter(df, "col_d", "nin", ["long"]).index) == [1, 2]
+
+
+def test_numeric_in_filters():
+    df = pd.DataFrame({"col_m_n": [1, 2, 3], "col_rr": [0.5, 1.0, 2.0]})
+    assert list(apply_filter(df, "col_m_n", "in", [1, 2]).index) == [0, 1]
+    assert list(apply_filter(df, "col_rr", "nin", [1.0]).index) == [0, 2]
+
+
+def test_date_bounds_are_compiled_once():
+    compile_filter.cache_clear()
+    masks = FilterMasks(unfiltered_data)
+    masks.get_mask("date", "date", ["05/01/2018", "05/31/2018"])
+    FilterMasks(unfiltered_data.head(3)).get_mask(
+        "date", "date", ["05/01/2018", "05/31/2018"]
+    )
+    assert compile_filter.cache_info().misses == 1
+    assert compile_filter.cache_info().hits == 1
+
+
+def test_empty_chain_keeps_every_row():
+    mask = FilterMasks(unfiltered_data).get_chain_mask([])
+    assert mask.dtype == np.bool_
+    assert mask.all()
+
+
+def test_unsupported_operation(mocker):
+    with pytest.raises(ValueError):
+        FilterService().apply_filter(
+            unfiltered_data, make_filter(mocker, "asset", "like", ["A"])
+        )
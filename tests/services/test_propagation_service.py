@@ -0,0 +1,201 @@
+import threading
+import time
+
+from app.services.propagation_service import PropagationQueue, RowsTask, coalesce
+
+
+def test_tasks_of_an_account_run_in_order(mocker):
+    version_repository = mocker.patch(
+        "app.services.propagation_service.VersionRepository"
+    )
+    queue = PropagationQueue(workers=2, window=0)
+    started = threading.Event()
+    release = threading.Event()
+    applied = []
+
+    def first():
+        started.set()
+        release.wait(5)
+        applied.append("first")
+
+    queue.submit("account", first)
+    started.wait(5)
+    # queued while the first task of the account is still running
+    queue.submit("account", lambda: applied.append("second"))
+    queue.submit("other", lambda: applied.append("other"))
+    release.set()
+
+    assert queue.wait(5)
+    assert applied.index("first") < applied.index("second")
+    assert version_repository.add_pending_update.call_count == 3
+    assert version_repository.remove_pending_updates.call_count == 3
+
+
+def test_inline_propagation_keeps_failed_versions_pending(mocker):
+    version_repository = mocker.patch(
+        "app.services.propagation_service.VersionRepository"
+    )
+    queue = PropagationQueue(workers=0)
+
+    queue.submit("account", lambda: ["v2"])
+
+    token = version_repository.add_pending_update.call_args.args[1]
+    version_repository.remove_pending_updates.assert_called_once_with(
+        "account", [token], ["v2"]
+    )
+
+
+def test_failed_task_is_retried(mocker):
+    version_repository = mocker.patch(
+        "app.services.propagation_service.VersionRepository"
+    )
+    queue = PropagationQueue(workers=0, attempts=3)
+    errors = [ValueError("bulk write failed")]
+
+    def flaky():
+        if errors:
+            raise errors.pop()
+        return []
+
+    queue.submit("account", flaky)
+
+    token = version_repository.add_pending_update.call_args.args[1]
+    version_repository.remove_pending_updates.assert_called_once_with(
+        "account", [token], []
+    )
+
+
+def test_failing_task_falls_back_to_a_resync(mocker):
+    version_repository = mocker.patch(
+        "app.services.propagation_service.VersionRepository"
+    )
+    fallback = mocker.Mock(return_value=["v2"])
+    queue = PropagationQueue(workers=0, attempts=2, fallback=fallback)
+    task = mocker.Mock(side_effect=ValueError("bulk write failed"))
+
+    queue.submit("account", task)
+
+    assert task.call_count == 2
+    fallback.assert_called_once_with("account")
+    token = version_repository.add_pending_update.call_args.args[1]
+    version_repository.remove_pending_updates.assert_called_once_with(
+        "account", [token], ["v2"]
+    )
+
+
+def test_task_falls_back_to_its_own_fallback(mocker):
+    mocker.patch("app.services.propagation_service.VersionRepository")
+    default = mocker.Mock(return_value=[])
+    fallback = mocker.Mock(return_value=[])
+    queue = PropagationQueue(workers=0, attempts=1, fallback=default)
+
+    queue.submit("account", mocker.Mock(side_effect=ValueError), fallback)
+
+    fallback.assert_called_once_with()
+    default.assert_not_called()
+
+
+def test_failed_resync_is_queued_again(mocker):
+    version_repository = mocker.patch(
+        "app.services.propagation_service.VersionRepository"
+    )
+    queue = PropagationQueue(workers=1, window=0, attempts=1, retry_delay=0.1)
+    retried = threading.Event()
+    errors = [ValueError("resync failed")]
+
+    def fallback():
+        if errors:
+            raise errors.pop()
+        retried.set()
+        return []
+
+    queue.submit("account", mocker.Mock(side_effect=ValueError), fallback)
+
+    assert retried.wait(5)
+    assert queue.wait(5)
+    token = version_repository.add_pending_update.call_args.args[1]
+    version_repository.remove_pending_updates.assert_called_once_with(
+        "account", [token], []
+    )
+
+
+def test_failed_resync_keeps_versions_pending(mocker):
+    version_repository = mocker.patch(
+        "app.services.propagation_service.VersionRepository"
+    )
+    fallback = mocker.Mock(side_effect=ValueError("account not found"))
+    queue = PropagationQueue(workers=0, attempts=1, fallback=fallback)
+
+    queue.submit("account", mocker.Mock(side_effect=ValueError("bulk write failed")))
+
+    version_repository.remove_pending_updates.assert_not_called()
+
+
+def test_coalesce_merges_consecutive_row_tasks():
+    apply = lambda row_ids: row_ids
+    barrier = lambda: []
+    items = [
+        (["t1"], RowsTask(apply, ["a1"]), None),
+        (["t2"], RowsTask(apply, ["a1", "b2"]), None),
+        (["t3"], barrier, None),
+        (["t4"], RowsTask(apply, ["c3"]), None),
+    ]
+
+    merged = coalesce(items)
+
+    assert [tokens for tokens, _, _ in merged] == [["t1", "t2"], ["t3"], ["t4"]]
+    assert merged[0][1]() == ["a1", "b2"]
+    assert merged[1][1] is barrier
+
+
+def test_burst_of_writes_is_propagated_once(mocker):
+    version_repository = mocker.patch(
+        "app.services.propagation_service.VersionRepository"
+    )
+    queue = PropagationQueue(workers=2, window=0.2)
+    applied = []
+
+    def apply(row_ids):
+        applied.append(row_ids)
+        return []
+
+    for row_id in ["a1", "b2", "a1"]:
+        queue.submit("account", RowsTask(apply, [row_id]))
+
+    assert queue.wait(5)
+    assert applied == [["a1", "b2"]]
+    tokens = [call.args[1] for call in version_repository.add_pending_update.mock_calls]
+    version_repository.remove_pending_updates.assert_called_once_with(
+        "account", tokens, []
+    )
+
+
+def test_account_waits_for_writes_without_a_worker(mocker):
+    mocker.patch("app.services.propagation_service.VersionRepository")
+    queue = PropagationQueue(workers=1, window=0.2)
+    submit = mocker.spy(queue._executor, "submit")
+
+    queue.submit("account", lambda: [])
+
+    # waiting on a timer, the only worker is free for other accounts
+    submit.assert_not_called()
+    assert queue.wait(5)
+    assert submit.call_count == 1
+
+
+def test_busy_account_is_propagated_after_max_delay(mocker):
+    mocker.patch("app.services.propagation_service.VersionRepository")
+    queue = PropagationQueue(workers=1, window=0.2, max_delay=0.3)
+    applied = []
+
+    def apply(row_ids):
+        applied.append(row_ids)
+        return []
+
+    for row_id in range(10):
+        queue.submit("account", RowsTask(apply, [row_id]))
+        time.sleep(0.1)
+
+    assert queue.wait(5)
+    assert len(applied) > 1
+    assert sum(applied, []) == list(range(10))
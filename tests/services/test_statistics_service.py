@@ -0,0 +1,99 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+from app.services.statistics_service import StatisticsService
+
+
+def legacy_statistics(data, col):
+    """Previous per-value loop of get_statistics, kept as a reference for equivalence"""
+    count = total = wins = losses = break_even = 0
+    total_wins = total_losses = consecutive_losses = current_losses = 0
+    for val in data[col]:
+        count += 1 if not np.isnan(val) else 0
+        total += val if not np.isnan(val) else 0
+        if val > 0:
+            wins += 1
+            total_wins += val
+            consecutive_losses = max(consecutive_losses, current_losses)
+            current_losses = 0
+        elif val < 0:
+            total_losses += val
+            losses += 1
+            current_losses += 1
+        elif val == 0:
+            break_even += 1
+            consecutive_losses = max(consecutive_losses, current_losses)
+            current_losses = 0
+    cumulative = data[col].cumsum().round(2)
+    drawdown = (cumulative - cumulative.cummax()).min()
+    win_rate = wins / count if count else 0
+    avg_win = total_wins / wins if wins else 0
+    avg_loss = total_losses / losses if losses else 0
+    return {
+        "count": count,
+        "drawdown": round(drawdown, 3) if not math.isnan(drawdown) else None,
+        "total": round(total, 3),
+        "mean": round(total / count if count else 0, 3),
+        "wins": wins,
+        "losses": losses,
+        "breakEvens": break_even,
+        "win_rate": round(wins / count, 4) if count else 0,
+        "avg_win": round(total_wins / wins, 2) if wins else 0,
+        "avg_loss": round(total_losses / losses, 2) if losses else 0,
+        "expectancy": round(
+            (win_rate * avg_win) - ((1 - win_rate) * abs(avg_loss)),
+            2,
+        ),
+        "max_consec_loss": max(consecutive_losses, current_losses),
+        "max_win": round(data[col].max(), 2)
+        if not math.isnan(data[col].max())
+        else None,
+        "profit_factor": round(total_wins / abs(total_losses), 2)
+        if total_losses
+        else round(total_wins, 2),
+    }
+
+
+@pytest.fixture
+def results():
+    rng = np.random.default_rng(7)
+    profit = rng.normal(5, 100, 500).round(2)
+    profit[rng.choice(500, 40, replace=False)] = np.nan
+    profit[rng.choice(500, 20, replace=False)] = 0
+    return pd.DataFrame(
+        {
+            "col_v_Profit": profit,
+            "col_r_RR": rng.choice([-1.0, 0.0, 2.0, np.nan], 500),
+            "col_p_Return": rng.normal(0.001, 0.01, 500),
+            "col_v_Empty": np.full(500, np.nan),
+        }
+    )
+
+
+def test_get_statistics_matches_legacy(results):
+    columns = list(results.columns)
+    statistics = StatisticsService().get_statistics(results, columns)
+
+    assert list(statistics) == columns
+    for column in columns:
+        assert statistics[column] == legacy_statistics(results, column)
+
+
+def test_get_statistics_consecutive_losses():
+    df = pd.DataFrame({"col_v_Profit": [-1, np.nan, -2, 3, -1, -1, -1, 0, -1]})
+    statistics = StatisticsService().get_statistics(df, ["col_v_Profit"])
+    assert statistics["col_v_Profit"]["max_consec_loss"] == 3
+
+
+def test_get_statistics_empty_frame():
+    df = pd.DataFrame({"col_v_Profit": pd.Series(dtype="float64")})
+    statistics = StatisticsService().get_statistics(df, ["col_v_Profit"])
+    assert statistics["col_v_Profit"] == legacy_statistics(df, "col_v_Profit")
+
+
+def test_get_statistics_does_not_modify_frame(results):
+    original = results.copy()
+    StatisticsService().get_statistics(results, list(results.columns))
+    pd.testing.assert_frame_equal(results, original)
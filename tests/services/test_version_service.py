@@ -0,0 +1,125 @@
+import pandas as pd
+from app.repositories.version_repository import VersionRepository
+from app.services.filter_service import FilterService
+from app.services.version_service import VersionService
+
+
+def make_filter(mocker, column, operation, value):
+    filter = mocker.Mock(column=column, operation=operation, value=value)
+    filter.pk = f"{column}-{operation}"
+    return filter
+
+
+def get_filters(versions):
+    return {version.id: version.filters for version in versions}
+
+
+def test_update_version_from_account_without_filters(mocker):
+    account_data = pd.DataFrame(
+        {"col_p": ["eurusd", "gbpusd", "eurusd"], "col_m_Setup": ["a", "b", "b"]},
+        index=pd.Index(["r1", "r2", "r3"], dtype="object"),
+    )
+    fields = {"col_p": "object", "col_m_Setup": "object"}
+    kept_filter = make_filter(mocker, "col_p", "in", ["eurusd"])
+    removed_filter = make_filter(mocker, "col_m_Setup", "in", ["a"])
+    versions = [
+        mocker.Mock(id="v1", filters=[kept_filter, removed_filter]),
+        mocker.Mock(id="v2", filters=[]),
+    ]
+    version_repository = mocker.Mock()
+    version_repository.get_state_update = VersionRepository.get_state_update
+    version_repository.get_filters = get_filters
+    version_repository.get_versions_by_account.return_value = versions
+    version_repository.bulk_update_versions.return_value = []
+
+    service = VersionService(version_repository, FilterService())
+    failed_ids = service.update_version_from_account_without_filters(
+        "account", account_data, fields, ["col_m_Setup"]
+    )
+
+    assert failed_ids == []
+    version_repository.bulk_update_versions.assert_called_once()
+    updates = dict(version_repository.bulk_update_versions.call_args.args[0])
+    assert list(updates["v1"]["$set"]["state"]["data"]) == ["r1", "r3"]
+    assert updates["v1"]["$pull"] == {"filters": {"$in": ["col_m_Setup-in"]}}
+    assert list(updates["v2"]["$set"]["state"]["data"]) == ["r1", "r2", "r3"]
+    assert "$pull" not in updates["v2"]
+    removed_filter.delete.assert_called_once()
+    kept_filter.delete.assert_not_called()
+
+
+def test_update_version_keeps_filters_of_failed_versions(mocker):
+    account_data = pd.DataFrame({"col_m_Setup": ["a"]}, index=["r1"])
+    removed_filter = make_filter(mocker, "col_m_Setup", "in", ["a"])
+    version_repository = mocker.Mock()
+    version_repository.get_state_update = VersionRepository.get_state_update
+    version_repository.get_filters = get_filters
+    version_repository.get_versions_by_account.return_value = [
+        mocker.Mock(id="v1", filters=[removed_filter])
+    ]
+    version_repository.bulk_update_versions.return_value = ["v1"]
+
+    service = VersionService(version_repository, FilterService())
+    failed_ids = service.update_version_from_account_without_filters(
+        "account", account_data, {"col_m_Setup": "object"}, ["col_m_Setup"]
+    )
+
+    assert failed_ids == ["v1"]
+    removed_filter.delete.assert_not_called()
+
+
+def test_migrate_version_columns(mocker):
+    account_data = pd.DataFrame(
+        {"col_p": ["eurusd", "gbpusd"], "col_m_Setup": ["a", "b"]},
+        index=pd.Index(["r1", "r2"], dtype="object"),
+    )
+    fields = {"col_p": "object", "col_m_Setup": "object"}
+    removed_filter = make_filter(mocker, "col_m_Swap", "in", ["x"])
+    versions = [
+        mocker.Mock(id="v1", storage="embedded", filters=[removed_filter]),
+        mocker.Mock(id="v2", storage="membership", filters=[]),
+    ]
+    version_repository = mocker.Mock()
+    version_repository.get_state_update = VersionRepository.get_state_update
+    version_repository.get_columns_update = VersionRepository.get_columns_update
+    version_repository.get_filters = get_filters
+    version_repository.get_versions_by_account.return_value = versions
+    version_repository.bulk_update_versions.return_value = []
+    load_account_data = mocker.Mock(return_value=account_data)
+    migration = mocker.Mock()
+
+    service = VersionService(version_repository, FilterService())
+    failed_ids = service.migrate_version_columns(
+        "account", fields, migration, ["col_m_Swap"], load_account_data
+    )
+
+    assert failed_ids == []
+    migrated, refiltered = [
+        dict(call.args[0])
+        for call in version_repository.bulk_update_versions.call_args_list
+    ]
+    # only the version that loses a filter is rebuilt from the account data
+    assert list(migrated) == ["v2"]
+    assert migrated["v2"][0]["$set"]["state.fields"] == {"$literal": fields}
+    assert list(refiltered) == ["v1"]
+    assert list(refiltered["v1"]["$set"]["state"]["data"]) == ["r1", "r2"]
+    load_account_data.assert_called_once()
+    removed_filter.delete.assert_called_once()
+
+
+def test_migrate_version_columns_without_filters(mocker):
+    version_repository = mocker.Mock()
+    version_repository.get_filters = get_filters
+    version_repository.get_versions_by_account.return_value = [
+        mocker.Mock(id="v1", storage="embedded", filters=[])
+    ]
+    version_repository.bulk_update_versions.return_value = []
+    load_account_data = mocker.Mock()
+
+    service = VersionService(version_repository, FilterService())
+    service.migrate_version_columns(
+        "account", {}, mocker.Mock(), ["col_m_Swap"], load_account_data
+    )
+
+    version_repository.bulk_update_versions.assert_called_once()
+    load_account_data.assert_not_called()
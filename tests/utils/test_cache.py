@@ -0,0 +1,76 @@
+import pandas as pd
+from app.utils.cache import DataFrameCache, TTLCache
+
+
+def generate_df(rows=10):
+    return pd.DataFrame({"col_v_Profit": [float(i) for i in range(rows)]})
+
+
+def test_cache_hit_and_miss():
+    cache = DataFrameCache(max_bytes=1024 * 1024)
+    assert cache.get("setup", 0) is None
+    cache.put("setup", 0, generate_df())
+    assert cache.get("setup", 0) is not None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_stale_version():
+    cache = DataFrameCache(max_bytes=1024 * 1024)
+    cache.put("setup", 0, generate_df())
+    assert cache.get("setup", 1) is None
+    cache.put("setup", 1, generate_df())
+    assert cache.stats()["entries"] == 1
+
+
+def test_cache_returns_copy():
+    cache = DataFrameCache(max_bytes=1024 * 1024)
+    cache.put("setup", 0, generate_df())
+    df = cache.get("setup", 0)
+    df["cumulative"] = df["col_v_Profit"].cumsum()
+    assert "cumulative" not in cache.get("setup", 0).columns
+
+
+def test_cache_evicts_least_recently_used():
+    size = int(generate_df().memory_usage(index=True, deep=True).sum())
+    cache = DataFrameCache(max_bytes=size * 2)
+    cache.put("first", 0, generate_df())
+    cache.put("second", 0, generate_df())
+    cache.get("first", 0)
+    cache.put("third", 0, generate_df())
+    assert cache.get("second", 0) is None
+    assert cache.get("first", 0) is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size"] <= size * 2
+
+
+def test_cache_skips_oversized_frames():
+    cache = DataFrameCache(max_bytes=10)
+    cache.put("setup", 0, generate_df())
+    assert cache.get("setup", 0) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_ttl_cache_expires_entries(mocker):
+    monotonic = mocker.patch("app.utils.cache.time.monotonic", return_value=100.0)
+    cache = TTLCache(ttl=10)
+    cache.put("Default", "template")
+    assert cache.get("Default") == "template"
+    monotonic.return_value = 110.0
+    assert cache.get("Default") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_ttl_cache_loads_once():
+    cache = TTLCache(ttl=60)
+    load = lambda: object()
+    value = cache.get_or_load("Default", load)
+    assert cache.get_or_load("Default", load) is value
+    cache.invalidate("Default")
+    assert cache.get_or_load("Default", load) is not value
+
+
+def test_ttl_cache_does_not_keep_missing_values():
+    cache = TTLCache(ttl=60)
+    assert cache.get_or_load("PPT", lambda: None) is None
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,65 @@
+from app.utils.column_migrations import ColumnMigration, get_increment
+
+
+def test_get_row_expression():
+    migration = ColumnMigration(
+        deleted=["col_m_Taxes"], added=["col_m_Setup"], renamed={"col_m_Swap": "col_s"}
+    )
+    assert migration.get_row_expression("$data") == {
+        "$arrayToObject": {
+            "$concatArrays": [
+                {
+                    "$map": {
+                        "input": {
+                            "$filter": {
+                                "input": {"$objectToArray": "$data"},
+                                "as": "column",
+                                "cond": {
+                                    "$not": {"$in": ["$$column.k", ["col_m_Taxes"]]}
+                                },
+                            }
+                        },
+                        "as": "column",
+                        "in": {
+                            "k": {
+                                "$switch": {
+                                    "branches": [
+                                        {
+                                            "case": {
+                                                "$eq": ["$$column.k", "col_m_Swap"]
+                                            },
+                                            "then": "col_s",
+                                        }
+                                    ],
+                                    "default": "$$column.k",
+                                }
+                            },
+                            "v": "$$column.v",
+                        },
+                    }
+                },
+                [{"k": "col_m_Setup", "v": None}],
+            ]
+        }
+    }
+
+
+def test_get_rows_expression_maps_every_row():
+    migration = ColumnMigration(added=["col_m_Setup"])
+    assert migration.get_rows_expression("$state.data") == {
+        "$arrayToObject": {
+            "$map": {
+                "input": {
+                    "$objectToArray": {"$ifNull": ["$state.data", {"$literal": {}}]}
+                },
+                "as": "row",
+                "in": {"k": "$$row.k", "v": migration.get_row_expression("$$row.v")},
+            }
+        }
+    }
+
+
+def test_get_increment():
+    assert get_increment("state_version") == {
+        "$add": [{"$ifNull": ["$state_version", 0]}, 1]
+    }
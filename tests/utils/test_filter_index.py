@@ -0,0 +1,102 @@
+from app.utils.filter_index import (
+    build_filter_index,
+    get_filter_index_rows_update,
+    get_filter_index_update,
+    get_filter_options,
+    replaces_indexed_value,
+)
+
+fields = {
+    "col_p": "object",
+    "col_rr": "float64",
+    "col_m_Setup": "object",
+    "col_m_Size": "float64",
+    "col_m_Empty": "float64",
+    "col_d_Close Time": "datetime64[ns, UTC]",
+    "col_d": "object",
+    "col_v_Profit": "float64",
+}
+data = {
+    "a1": {"col_p": "eurusd", "col_rr": 2.0, "col_m_Setup": "A", "col_m_Size": 1.5},
+    "b2": {"col_p": "gbpusd", "col_rr": None, "col_m_Setup": None, "col_m_Size": 0.5},
+    "c3": {"col_p": "eurusd", "col_rr": -1.0, "col_m_Setup": "B", "col_m_Size": 2.0},
+}
+
+
+def test_build_filter_index():
+    assert build_filter_index(fields, data) == {
+        "columns": {
+            "col_p": {"values": ["eurusd", "gbpusd"]},
+            "col_rr": {"values": [2.0, -1.0]},
+            "col_m_Setup": {"values": ["A", "B"]},
+            "col_m_Size": {"min": 0.5, "max": 2.0},
+            "col_m_Empty": {},
+        }
+    }
+
+
+def test_get_filter_index_update():
+    row = {"col_p": "usdjpy", "col_m_Size": 3.0, "col_m_Setup": None, "note": "x"}
+    assert get_filter_index_update(fields, row) == {
+        "$addToSet": {"filter_index.columns.col_p.values": "usdjpy"},
+        "$min": {"filter_index.columns.col_m_Size.min": 3.0},
+        "$max": {"filter_index.columns.col_m_Size.max": 3.0},
+    }
+    assert get_filter_index_update(fields, {"note": "x"}) == {}
+
+
+def test_get_filter_index_rows_update():
+    assert get_filter_index_rows_update(fields, list(data.values())) == {
+        "$addToSet": {
+            "filter_index.columns.col_p.values": {"$each": ["eurusd", "gbpusd"]},
+            "filter_index.columns.col_rr.values": {"$each": [2.0, -1.0]},
+            "filter_index.columns.col_m_Setup.values": {"$each": ["A", "B"]},
+        },
+        "$min": {"filter_index.columns.col_m_Size.min": 0.5},
+        "$max": {"filter_index.columns.col_m_Size.max": 2.0},
+    }
+    assert get_filter_index_rows_update(fields, []) == {}
+
+
+def test_replaces_indexed_value():
+    old_row = {"col_p": "eurusd", "col_m_Size": 1.5, "note": "x"}
+    assert not replaces_indexed_value(fields, None, {"col_p": "usdjpy"})
+    assert not replaces_indexed_value(fields, old_row, {**old_row, "note": "y"})
+    assert replaces_indexed_value(fields, old_row, {**old_row, "col_p": "usdjpy"})
+    # a full row without an indexed column removes its value
+    assert replaces_indexed_value(fields, old_row, {"col_p": "eurusd"})
+    assert not replaces_indexed_value(fields, old_row, {"note": "y"}, partial=True)
+
+
+def test_get_filter_options():
+    options = get_filter_options(fields, build_filter_index(fields, data))
+    assert options == [
+        {
+            "id": "col_p",
+            "name": "Pair",
+            "type": "string",
+            "values": ["eurusd", "gbpusd"],
+        },
+        {
+            "id": "col_rr",
+            "name": "Risk Reward",
+            "type": "number",
+            "values": [2.0, -1.0],
+        },
+        {"id": "col_m_Setup", "name": "Setup", "type": "string", "values": ["A", "B"]},
+        {"id": "col_m_Size", "name": "Size", "type": "number", "min": 0.5, "max": 2.0},
+        {
+            "id": "col_m_Empty",
+            "name": "Empty",
+            "type": "number",
+            "min": None,
+            "max": None,
+        },
+        {"id": "col_d_Close Time", "name": "Close Time", "type": "date"},
+        {
+            "id": "col_d",
+            "name": "Direction",
+            "type": "string",
+            "values": ["Long", "Short"],
+        },
+    ]
@@ -0,0 +1,29 @@
+from app.utils.identity import get_user, get_user_id
+from bson import ObjectId
+from flask import Flask
+
+user_id = ObjectId()
+
+
+def test_user_id_is_read_once_per_request(mocker):
+    get_jwt_identity = mocker.patch(
+        "app.utils.identity.get_jwt_identity", return_value={"$oid": str(user_id)}
+    )
+    with Flask(__name__).test_request_context():
+        assert get_user_id() == user_id
+        assert get_user_id() == user_id
+    get_jwt_identity.assert_called_once()
+
+
+def test_user_is_loaded_once_per_request(mocker):
+    mocker.patch(
+        "app.utils.identity.get_jwt_identity", return_value={"$oid": str(user_id)}
+    )
+    objects = mocker.patch("app.utils.identity.User.objects")
+    app = Flask(__name__)
+    with app.test_request_context():
+        assert get_user() is get_user()
+    with app.test_request_context():
+        get_user()
+    assert objects.call_count == 2
+    objects.assert_called_with(id=user_id)
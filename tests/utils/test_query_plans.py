@@ -0,0 +1,31 @@
+from app.utils.query_plans import check_query_plans, get_plan_stages
+
+index_plan = {
+    "stage": "FETCH",
+    "inputStage": {"stage": "IXSCAN", "indexName": "documentId_1_date_created_-1"},
+}
+scan_plan = {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}
+
+
+def test_plan_stages():
+    assert get_plan_stages(index_plan) == ["FETCH", "IXSCAN"]
+    assert get_plan_stages({"queryPlan": scan_plan}) == ["SORT", "COLLSCAN"]
+    assert get_plan_stages(
+        {
+            "stage": "OR",
+            "inputStages": [index_plan["inputStage"], {"stage": "COLLSCAN"}],
+        }
+    ) == ["OR", "IXSCAN", "COLLSCAN"]
+
+
+def test_check_query_plans_flags_scans(mocker):
+    explain_query = mocker.patch(
+        "app.utils.query_plans.explain_query",
+        side_effect=lambda model, filter, sort: get_plan_stages(
+            scan_plan if model.__name__ == "PPTTemplate" else index_plan
+        ),
+    )
+    scans = [result for result in check_query_plans() if result[3]]
+
+    assert explain_query.call_count > len(scans)
+    assert {collection for _, collection, _, _ in scans} == {"ppttemplate"}
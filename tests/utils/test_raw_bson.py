@@ -0,0 +1,39 @@
+from app.utils.raw_bson import find_one_state
+
+
+def test_find_one_state_reads_every_column(mocker):
+    collection = mocker.Mock()
+
+    find_one_state(collection, {"_id": 1}, {"state": 1, "state_version": 1})
+
+    collection.find_one.assert_called_once_with(
+        {"_id": 1}, {"state": 1, "state_version": 1}
+    )
+    collection.aggregate.assert_not_called()
+
+
+def test_find_one_state_projects_the_columns_of_every_row(mocker):
+    collection = mocker.Mock()
+    collection.aggregate.return_value = iter([{"_id": 1}])
+
+    document = find_one_state(
+        collection, {"_id": 1}, {"state": 1, "state_version": 1}, ["col_p", "col_rr"]
+    )
+
+    assert document == {"_id": 1}
+    match, limit, project = collection.aggregate.call_args.args[0]
+    assert match == {"$match": {"_id": 1}}
+    assert limit == {"$limit": 1}
+    projection = project["$project"]
+    assert projection["state_version"] == 1
+    assert projection["state"]["fields"] == "$state.fields"
+    rows = projection["state"]["data"]["$arrayToObject"]["$map"]["in"]
+    assert rows["v"] == {"col_p": "$$row.v.col_p", "col_rr": "$$row.v.col_rr"}
+
+
+def test_find_one_state_reads_columns_with_dots_whole(mocker):
+    collection = mocker.Mock()
+
+    find_one_state(collection, {"_id": 1}, {"state": 1}, ["col_m_P.L"])
+
+    collection.find_one.assert_called_once_with({"_id": 1}, {"state": 1})